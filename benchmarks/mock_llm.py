@@ -0,0 +1,195 @@
+"""
+Local stand-in for OpenAI-compatible and Ollama chat servers.
+
+Serves POST /v1/chat/completions (OpenAI) and POST /api/chat (Ollama), both
+streaming and non-streaming, plus their model listings for health checks.
+Latency, token rate and injected errors are configurable, so the gateway can
+be load-tested without network access.
+
+Usage:
+    python -m benchmarks.mock_llm --port 11500 --latency 0.2 --tokens-per-second 100 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+@dataclass
+class MockSettings:
+    """
+    Behaviour of the mock server.
+
+    Attributes:
+        latency: Seconds before the first token (or the whole response).
+        tokens_per_second: Generation speed after the first token (0 = instant).
+        response_tokens: Tokens per response.
+        error_rate: Fraction of requests answered with error_status.
+        error_status: HTTP status used for injected errors (e.g. 500 or 429).
+        retry_after: Retry-After seconds sent with injected 429s.
+        seed: Seed for error injection, for reproducible runs.
+    """
+    latency: float = 0.05
+    tokens_per_second: float = 200.0
+    response_tokens: int = 20
+    error_rate: float = 0.0
+    error_status: int = 500
+    retry_after: float = 1.0
+    seed: Optional[int] = 0
+
+def _prompt_tokens(messages) -> int:
+    return sum(len(str(message.get("content") or "")) for message in messages) // 4 + 1
+
+def create_app(settings: MockSettings) -> FastAPI:
+    """Build the mock FastAPI app; `app.state.requests` counts calls per API."""
+    app = FastAPI(title="Mock LLM")
+    rng = random.Random(settings.seed)
+    app.state.requests = {"openai": 0, "ollama": 0, "errors": 0}
+
+    def injected_error() -> Optional[JSONResponse]:
+        if settings.error_rate and rng.random() < settings.error_rate:
+            app.state.requests["errors"] += 1
+            headers = {"retry-after": str(settings.retry_after)} if settings.error_status == 429 else None
+            return JSONResponse({"error": {"message": "injected error"}}, status_code=settings.error_status,
+                                headers=headers)
+        return None
+
+    async def tokens() -> AsyncIterator[str]:
+        await asyncio.sleep(settings.latency)
+        delay = 1.0 / settings.tokens_per_second if settings.tokens_per_second else 0.0
+        for i in range(settings.response_tokens):
+            if i and delay:
+                await asyncio.sleep(delay)
+            yield f"tok{i} "
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        app.state.requests["openai"] += 1
+        error = injected_error()
+        if error:
+            return error
+        body = await request.json()
+        model = body.get("model", "mock")
+        prompt_tokens = _prompt_tokens(body.get("messages", []))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": settings.response_tokens,
+                 "total_tokens": prompt_tokens + settings.response_tokens}
+        base = {"id": "chatcmpl-mock", "created": int(time.time()), "model": model}
+        if not body.get("stream"):
+            text = "".join([token async for token in tokens()])
+            return {**base, "object": "chat.completion", "usage": usage, "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]}
+
+        async def events():
+            chunk = {**base, "object": "chat.completion.chunk"}
+            async for token in tokens():
+                delta = {"index": 0, "delta": {"content": token}, "finish_reason": None}
+                yield f"data: {json.dumps({**chunk, 'choices': [delta]})}\n\n"
+            yield f"data: {json.dumps({**chunk, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield f"data: {json.dumps({**chunk, 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/api/chat")
+    async def ollama_chat(request: Request):
+        app.state.requests["ollama"] += 1
+        error = injected_error()
+        if error:
+            return error
+        body = await request.json()
+        model = body.get("model", "mock")
+        counts = {"prompt_eval_count": _prompt_tokens(body.get("messages", [])),
+                  "eval_count": settings.response_tokens}
+        if not body.get("stream", True):
+            text = "".join([token async for token in tokens()])
+            return {"model": model, "message": {"role": "assistant", "content": text}, "done": True, **counts}
+
+        async def lines():
+            async for token in tokens():
+                yield json.dumps({"model": model, "message": {"role": "assistant", "content": token},
+                                  "done": False}) + "\n"
+            yield json.dumps({"model": model, "message": {"role": "assistant", "content": ""},
+                              "done": True, **counts}) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @app.get("/v1/models")
+    async def openai_models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model", "created": 0, "owned_by": "mock"}]}
+
+    @app.get("/api/tags")
+    async def ollama_tags():
+        return {"models": [{"name": "mock"}]}
+
+    return app
+
+class MockLLMServer:
+    """
+    Runs the mock app with uvicorn on a background thread.
+
+    Usage:
+        with MockLLMServer(MockSettings(latency=0.1)) as server:
+            print(server.url)
+    """
+
+    def __init__(self, settings: Optional[MockSettings] = None, host: str = "127.0.0.1", port: int = 0):
+        self.settings = settings or MockSettings()
+        self.app = create_app(self.settings)
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host=host, port=port, log_level="warning",
+                                                     access_log=False))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.servers[0].sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self) -> Dict[str, Any]:
+        return dict(self.app.state.requests)
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._server.run, name="mock-llm", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("Mock LLM server failed to start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mock OpenAI/Ollama chat server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=MockSettings.latency)
+    parser.add_argument("--tokens-per-second", type=float, default=MockSettings.tokens_per_second)
+    parser.add_argument("--response-tokens", type=int, default=MockSettings.response_tokens)
+    parser.add_argument("--error-rate", type=float, default=MockSettings.error_rate)
+    parser.add_argument("--error-status", type=int, default=MockSettings.error_status)
+    parser.add_argument("--seed", type=int, default=MockSettings.seed)
+    args = parser.parse_args()
+    settings = MockSettings(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                            response_tokens=args.response_tokens, error_rate=args.error_rate,
+                            error_status=args.error_status, seed=args.seed)
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
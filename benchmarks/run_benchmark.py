@@ -0,0 +1,333 @@
+"""
+Load-test the gateway against the local mock LLM server.
+
+Starts benchmarks.mock_llm in-process and the gateway (uvicorn src.main:app)
+as a subprocess pointed at it, then drives /v1/query, /v1/query/stream and
+/v1/batch at each concurrency level for both providers. Throughput,
+p50/p95/p99 latency, time to first token, gateway memory and startup time
+(process spawn until GET /ready answers 200) are written to a JSON file so runs can be compared between releases.
+
+Usage:
+    python -m benchmarks.run_benchmark --concurrency 1 8 32 --requests 200
+    python -m benchmarks.run_benchmark --latency 0.2 --error-rate 0.02 --output results.json
+    python -m benchmarks.run_benchmark --compare benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+import yaml
+
+from benchmarks.mock_llm import MockLLMServer, MockSettings
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+INTERFACE_ID = "bench"
+SCENARIOS = ("query", "stream", "batch")
+PROVIDERS = ("openai", "local_model")
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of `values`, or None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+def latency_summary(latencies: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": _ms(percentile(latencies, 50)),
+        "p95": _ms(percentile(latencies, 95)),
+        "p99": _ms(percentile(latencies, 99)),
+        "mean": _ms(sum(latencies) / len(latencies)) if latencies else None,
+    }
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of a process in MiB (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        return None
+    return None
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def write_interface(directory: str, mock_url: str) -> None:
+    """Write an interface config that sends both providers to the mock server."""
+    limits = {"max_concurrency": 1024}
+    config = {
+        "description": "Benchmark interface served by benchmarks.mock_llm",
+        "model_providers": {
+            "openai": {"model": "mock-gpt", "api_key": "MOBAI_BENCH_API_KEY", "base_url": f"{mock_url}/v1",
+                       "system_prompt": "You are a benchmark.", "limits": limits},
+            "local_model": {"model_type": "ollama", "base_url": mock_url, "model": "mock-llama",
+                            "system_prompt": "You are a benchmark.", "limits": limits},
+        },
+    }
+    path = os.path.join(directory, "interfaces", INTERFACE_ID)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "config.yaml"), "w") as f:
+        yaml.safe_dump(config, f)
+
+class Gateway:
+    """The gateway under test, run as `uvicorn src.main:app` in a subprocess."""
+
+    def __init__(self, workdir: str):
+        self.workdir = workdir
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process: Optional[subprocess.Popen] = None
+        self.startup: Dict[str, Any] = {}
+
+    def env(self) -> Dict[str, str]:
+        """
+        The gateway's environment. Every file it writes (log, job queue, caches)
+        goes under workdir, so runs leave nothing in the repo and share no state.
+        """
+        return {
+            **os.environ,
+            "PYTHONPATH": REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+            "MOBAI_BENCH_API_KEY": "mock-key",
+            "MOBAI_LOG_FILE": os.path.join(self.workdir, "gateway.log"),
+            "MOBAI_QUEUE_PATH": os.path.join(self.workdir, "job_queue.sqlite3"),
+            "MOBAI_CACHE_DISK_PATH": os.path.join(self.workdir, "response_cache.sqlite3"),
+            "MOBAI_SEMANTIC_CACHE_DIR": os.path.join(self.workdir, "semantic_cache"),
+            "MOBAI_JOB_DB": os.path.join(self.workdir, "batch_jobs.sqlite3"),
+        }
+
+    def __enter__(self) -> "Gateway":
+        spawned = time.perf_counter()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=self.workdir, env=self.env(),
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Gateway exited with status {self.process.returncode}")
+            try:
+                response = httpx.get(f"{self.url}/ready", timeout=1)
+                if response.status_code == 200:
+                    ready = response.json()
+                    self.startup = {"seconds": round(time.perf_counter() - spawned, 4),
+                                    "reported_seconds": round(ready["startup_seconds"], 4),
+                                    "phases": {name: round(seconds, 4) for name, seconds in ready["phases"].items()}}
+                    return self
+            except httpx.TransportError:
+                pass
+            time.sleep(0.02)
+        self.__exit__()
+        raise RuntimeError("Gateway did not start within 30 seconds")
+
+    def __exit__(self, *exc) -> None:
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+async def _sample_memory(pid: int, samples: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        value = rss_mb(pid)
+        if value is not None:
+            samples.append(value)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.1)
+        except asyncio.TimeoutError:
+            pass
+
+async def _query(client: httpx.AsyncClient, provider: str, i: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    response = await client.post("/v1/query", json={
+        "interface_id": INTERFACE_ID, "model_provider": provider, "message": f"benchmark message {i}"})
+    return {"latency": time.perf_counter() - started, "ok": response.status_code == 200}
+
+async def _stream(client: httpx.AsyncClient, provider: str, i: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    first_token = None
+    ok = False
+    async with client.stream("POST", "/v1/query/stream", json={
+            "interface_id": INTERFACE_ID, "model_provider": provider, "message": f"benchmark message {i}"}) as response:
+        async for line in response.aiter_lines():
+            if first_token is None and line.startswith('data: {"token"'):
+                first_token = time.perf_counter() - started
+            elif line == "event: done":
+                ok = response.status_code == 200
+    return {"latency": time.perf_counter() - started, "ttft": first_token, "ok": ok}
+
+async def run_scenario(gateway: Gateway, scenario: str, provider: str, concurrency: int,
+                       requests: int, batch_size: int) -> Dict[str, Any]:
+    """Drive one scenario at one concurrency level and summarize it."""
+    memory: List[float] = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(_sample_memory(gateway.process.pid, memory, stop))
+    results: List[Dict[str, Any]] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=gateway.url, timeout=300, limits=limits) as client:
+        started = time.perf_counter()
+        if scenario == "batch":
+            # One request fanned out by the gateway itself at `concurrency`
+            items = [{"id": i, "message": f"benchmark message {i}"} for i in range(batch_size)]
+            response = await client.post("/v1/batch", json=items, params={
+                "interface_id": INTERFACE_ID, "model_provider": provider, "concurrency": concurrency})
+            lines = [json.loads(line) for line in response.text.splitlines() if line]
+            results = [{"latency": time.perf_counter() - started, "ok": "response" in line} for line in lines]
+            operations = len(lines)
+        else:
+            call = _query if scenario == "query" else _stream
+            counter = iter(range(requests))
+
+            async def worker():
+                for i in counter:
+                    try:
+                        results.append(await call(client, provider, i))
+                    except httpx.HTTPError:
+                        results.append({"latency": None, "ok": False})
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            operations = len(results)
+        elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    latencies = [r["latency"] for r in results if r["ok"] and r["latency"] is not None]
+    summary = {
+        "scenario": scenario,
+        "provider": provider,
+        "concurrency": concurrency,
+        "operations": operations,
+        "errors": sum(1 for r in results if not r["ok"]),
+        "duration_s": round(elapsed, 3),
+        "throughput_per_s": round(operations / elapsed, 3) if elapsed else None,
+        "latency_ms": latency_summary(latencies) if scenario != "batch" else {"total": _ms(elapsed)},
+        "rss_mb_peak": round(max(memory), 2) if memory else None,
+        "rss_mb_end": round(memory[-1], 2) if memory else None,
+    }
+    if scenario == "stream":
+        summary["ttft_ms"] = latency_summary([r["ttft"] for r in results if r.get("ttft") is not None])
+    return summary
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(settings: MockSettings, concurrency_levels: List[int], requests: int, batch_size: int,
+        scenarios: List[str], providers: List[str]) -> Dict[str, Any]:
+    """Run every scenario/provider/concurrency combination and return the report."""
+    results = []
+    with tempfile.TemporaryDirectory() as workdir, MockLLMServer(settings) as mock:
+        write_interface(workdir, mock.url)
+        with Gateway(workdir) as gateway:
+            startup = gateway.startup
+            print(f"startup {startup['seconds']} s (in-process {startup['reported_seconds']:.3f} s)", flush=True)
+            for scenario in scenarios:
+                for provider in providers:
+                    # Warm up pooled connections so the first level is not penalized
+                    asyncio.run(run_scenario(gateway, "query", provider, 2, 4, batch_size))
+                    for concurrency in concurrency_levels:
+                        result = asyncio.run(run_scenario(gateway, scenario, provider, concurrency,
+                                                          requests, batch_size))
+                        results.append(result)
+                        print(f"{scenario:7} {provider:12} c={concurrency:<4} "
+                              f"{result['throughput_per_s']:>9} ops/s  p95={result['latency_ms'].get('p95')} ms  "
+                              f"errors={result['errors']}  rss={result['rss_mb_peak']} MiB", flush=True)
+        mock_requests = mock.requests
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "mock": {**asdict(settings), "requests": mock_requests},
+        "requests_per_level": requests,
+        "batch_size": batch_size,
+        "startup": startup,
+        "results": results,
+    }
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Return a description of every result that regressed by more than
+    `threshold` (a fraction) in throughput or p95 latency against the baseline,
+    and of a startup time that did.
+    """
+    def key(result):
+        return result["scenario"], result["provider"], result["concurrency"]
+    previous = {key(result): result for result in baseline.get("results", [])}
+    regressions = []
+    old_startup = baseline.get("startup", {}).get("seconds")
+    new_startup = current.get("startup", {}).get("seconds")
+    if old_startup and new_startup and new_startup > old_startup * (1 + threshold):
+        regressions.append(f"startup: {old_startup} -> {new_startup} s")
+    for result in current["results"]:
+        before = previous.get(key(result))
+        if not before:
+            continue
+        label = "{} {} c={}".format(*key(result))
+        if before["throughput_per_s"] and result["throughput_per_s"] < before["throughput_per_s"] * (1 - threshold):
+            regressions.append(f"{label}: throughput {before['throughput_per_s']} -> {result['throughput_per_s']} ops/s")
+        old_p95, new_p95 = before["latency_ms"].get("p95"), result["latency_ms"].get("p95")
+        if old_p95 and new_p95 and new_p95 > old_p95 * (1 + threshold):
+            regressions.append(f"{label}: p95 {old_p95} -> {new_p95} ms")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the gateway against a mock LLM server")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per query/stream level")
+    parser.add_argument("--batch-size", type=int, default=500, help="Items per /v1/batch request")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--providers", nargs="+", choices=PROVIDERS, default=list(PROVIDERS))
+    parser.add_argument("--latency", type=float, default=MockSettings.latency)
+    parser.add_argument("--tokens-per-second", type=float, default=MockSettings.tokens_per_second)
+    parser.add_argument("--response-tokens", type=int, default=MockSettings.response_tokens)
+    parser.add_argument("--error-rate", type=float, default=MockSettings.error_rate)
+    parser.add_argument("--error-status", type=int, default=MockSettings.error_status)
+    parser.add_argument("--output", help="JSON report path (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Baseline report to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed regression fraction (default 0.2)")
+    args = parser.parse_args()
+
+    settings = MockSettings(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                            response_tokens=args.response_tokens, error_rate=args.error_rate,
+                            error_status=args.error_status)
+    report = run(settings, args.concurrency, args.requests, args.batch_size, args.scenarios, args.providers)
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
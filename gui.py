@@ -1,7 +1,8 @@
 import streamlit as st
 import requests
+import json
 import os
-from typing import List, Dict
+from typing import Iterator, List, Dict
 import yaml
 
 # Constants
@@ -66,6 +67,45 @@ def send_request(interface_id: str, question: str) -> str:
         st.error(f"Error sending request to API: {str(e)}")
         return ""
 
+def stream_request(interface_id: str, question: str) -> Iterator[str]:
+    """
+    Send a request to the streaming endpoint and yield tokens as they arrive.
+    
+    Args:
+        interface_id (str): The ID of the interface to use.
+        question (str): The user's question/input.
+        
+    Yields:
+        str: Response tokens parsed from the Server-Sent Events stream.
+    """
+    try:
+        with requests.post(
+            f"{API_URL}/v1/query/stream",
+            json={
+                "interface_id": interface_id,
+                "model_provider": "openai",  # Default to OpenAI, could be made configurable
+                "message": question
+            },
+            stream=True
+        ) as response:
+            response.raise_for_status()
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:"):])
+                    if event == "error":
+                        st.error(data.get("detail", "Unknown streaming error"))
+                        return
+                    if event == "done":
+                        return
+                    yield data.get("token", "")
+                elif not line:
+                    event = None
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error sending request to API: {str(e)}")
+
 # Set page config
 st.set_page_config(
     page_title="AI Platform Interface",
@@ -105,12 +145,18 @@ if selected_interface:
         placeholder="Type your message here..."
     )
     
+    stream_response = st.checkbox("Stream response", value=True)
+    
     # Submit button
     if st.button("Submit"):
         if user_input.strip():
-            with st.spinner("Processing your request..."):
-                response = send_request(selected_interface, user_input)
+            if stream_response:
                 st.markdown("### Response:")
-                st.markdown(response)
+                st.write_stream(stream_request(selected_interface, user_input))
+            else:
+                with st.spinner("Processing your request..."):
+                    response = send_request(selected_interface, user_input)
+                    st.markdown("### Response:")
+                    st.markdown(response)
         else:
             st.warning("Please enter some text before submitting.") 
\ No newline at end of file
@@ -1,5 +1,44 @@
+import argparse
+import os
+import sys
+
 import uvicorn
 
+def prepare_production(workers: int) -> None:
+    """
+    Validate interface configs and set up the state shared by the workers,
+    before any worker starts accepting traffic.
+    """
+    from src.config_manager import ConfigManager
+    from src.job_queue import get_job_queue
+    from src.shared_state import get_bucket_store
+
+    config_manager = ConfigManager()
+    for interface_id, error in config_manager.load_errors.items():
+        print(f"Config error in interface '{interface_id}': {error}", file=sys.stderr)
+    if not config_manager.config_cache:
+        sys.exit("No interface configuration could be loaded.")
+
+    # Workers inherit these; the shared file is created here to avoid a startup race
+    os.environ["MOBAI_WORKERS"] = str(workers)
+    os.environ.setdefault("MOBAI_SHARED_STATE_PATH", os.path.join("data", "shared_state.sqlite3"))
+    get_bucket_store()
+    get_job_queue()
+
 if __name__ == "__main__":
-    # Run the FastAPI server
-    uvicorn.run("src.main:app", host="0.0.0.0", port=8000, reload=True)
+    parser = argparse.ArgumentParser(description="Run the AI Platform server")
+    parser.add_argument("--production", action="store_true",
+                        help="Run several worker processes without auto-reload")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes in production mode (default: MOBAI_WORKERS or the CPU count)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    if args.production:
+        workers = args.workers or int(os.environ.get("MOBAI_WORKERS", 0)) or os.cpu_count() or 1
+        prepare_production(workers)
+        uvicorn.run("src.main:app", host=args.host, port=args.port, workers=workers, access_log=False)
+    else:
+        # Run the FastAPI server
+        uvicorn.run("src.main:app", host=args.host, port=args.port, reload=True)
@@ -0,0 +1,469 @@
+"""
+Offline batch jobs submitted through a provider's asynchronous batch API.
+
+A job turns an input file of messages into chat-completion request lines using
+the interface's system_prompt and model from config.yaml, uploads them, polls
+the provider until the batch finishes and joins the results back to the input
+ids. All state lives in a local SQLite database, so a restarted worker resumes
+in-flight jobs with resume_jobs().
+
+Usage:
+    python -m src.batch_jobs submit at_risk responses.ndjson --wait
+    python -m src.batch_jobs status <job_id>
+    python -m src.batch_jobs results <job_id> --output results.ndjson
+    python -m src.batch_jobs resume
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from .config_manager import get_configuration
+from .external_integration import ConfigurationError, resolve_model_config
+from .log_config import log_event
+from .model_adaptor import OpenAIAdaptor, adaptor_name, get_adaptor, openai_options
+from .prompt_orchestrator import get_prompt_orchestrator
+from .structured_output import output_settings, parse_output, typed_fields
+from .token_budget import fit_input
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "batch_jobs.sqlite3")
+
+# OpenAI accepts at most 50,000 requests per batch input file
+MAX_REQUESTS_PER_BATCH = 50000
+
+TERMINAL_PART_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+def read_input_file(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Read batch input from a JSON array or NDJSON file.
+
+    Each entry is a message string or a {"id": ..., "message": ...} object;
+    entries without an id get their zero-based position as id.
+    """
+    with open(path, "r") as file:
+        content = file.read()
+    stripped = content.lstrip()
+    if stripped.startswith("["):
+        entries = json.loads(stripped)
+    else:
+        entries = (json.loads(line) for line in content.splitlines() if line.strip())
+    for index, entry in enumerate(entries):
+        if isinstance(entry, str):
+            yield {"id": index, "message": entry}
+        else:
+            yield {"id": entry.get("id", index), "message": entry.get("message")}
+
+class JobStore:
+    """
+    SQLite persistence for batch jobs, their provider batches and items.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get("MOBAI_JOB_DB", DEFAULT_DB_PATH)
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    interface_id TEXT NOT NULL,
+                    model_provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    item_count INTEGER NOT NULL,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS job_parts (
+                    job_id TEXT NOT NULL,
+                    part INTEGER NOT NULL,
+                    start_index INTEGER NOT NULL,
+                    end_index INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    input_file_id TEXT,
+                    provider_batch_id TEXT,
+                    error TEXT,
+                    PRIMARY KEY (job_id, part)
+                );
+                CREATE TABLE IF NOT EXISTS job_items (
+                    job_id TEXT NOT NULL,
+                    item_index INTEGER NOT NULL,
+                    item_id TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    response TEXT,
+                    error TEXT,
+                    PRIMARY KEY (job_id, item_index)
+                );
+            """)
+
+    def execute(self, sql: str, params: Iterable[Any] = ()) -> List[sqlite3.Row]:
+        with self._lock, self._conn:
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def executemany(self, sql: str, rows: Iterable[Iterable[Any]]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(sql, rows)
+
+    def close(self) -> None:
+        self._conn.close()
+
+class OpenAIBatchProvider:
+    """
+    Thin async wrapper over the OpenAI Files and Batches APIs.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def upload(self, content: bytes) -> str:
+        uploaded = await self.client.files.create(file=("batch.jsonl", content), purpose="batch")
+        return uploaded.id
+
+    async def create(self, input_file_id: str, metadata: Dict[str, str]) -> str:
+        batch = await self.client.batches.create(
+            input_file_id=input_file_id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+            metadata=metadata,
+        )
+        return batch.id
+
+    async def retrieve(self, batch_id: str) -> Dict[str, Any]:
+        batch = await self.client.batches.retrieve(batch_id)
+        return {
+            "status": batch.status,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id,
+        }
+
+    async def download(self, file_id: str) -> bytes:
+        content = await self.client.files.content(file_id)
+        return content.read()
+
+class FakeBatchProvider:
+    """
+    In-process stand-in for OpenAIBatchProvider, for tests and dry runs without network.
+
+    Batches complete after `polls_until_complete` retrieve calls. The responder
+    maps a request body to the assistant's answer; if it raises, the line is
+    reported in the error file like a failed provider request.
+    """
+
+    def __init__(self, responder: Optional[Callable[[Dict[str, Any]], str]] = None,
+                 polls_until_complete: int = 1):
+        self.responder = responder or (lambda body: "Neutral")
+        self.polls_until_complete = polls_until_complete
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+
+    async def upload(self, content: bytes) -> str:
+        file_id = f"file-{uuid.uuid4().hex}"
+        self.files[file_id] = content
+        return file_id
+
+    async def create(self, input_file_id: str, metadata: Dict[str, str]) -> str:
+        batch_id = f"batch-{uuid.uuid4().hex}"
+        self.batches[batch_id] = {"input_file_id": input_file_id, "polls": 0, "metadata": metadata}
+        return batch_id
+
+    async def retrieve(self, batch_id: str) -> Dict[str, Any]:
+        batch = self.batches[batch_id]
+        batch["polls"] += 1
+        if batch["polls"] < self.polls_until_complete:
+            return {"status": "in_progress", "output_file_id": None, "error_file_id": None}
+        if "output_file_id" not in batch:
+            output, errors = [], []
+            for line in self.files[batch["input_file_id"]].decode().splitlines():
+                request = json.loads(line)
+                try:
+                    content = self.responder(request["body"])
+                    output.append({"custom_id": request["custom_id"], "error": None, "response": {
+                        "status_code": 200,
+                        "body": {"choices": [{"message": {"role": "assistant", "content": content}}]},
+                    }})
+                except Exception as e:
+                    errors.append({"custom_id": request["custom_id"], "response": None,
+                                   "error": {"code": "fake_error", "message": str(e)}})
+            batch["output_file_id"] = await self.upload("\n".join(json.dumps(o) for o in output).encode())
+            batch["error_file_id"] = await self.upload("\n".join(json.dumps(e) for e in errors).encode()) if errors else None
+        return {"status": "completed", "output_file_id": batch["output_file_id"], "error_file_id": batch["error_file_id"]}
+
+    async def download(self, file_id: str) -> bytes:
+        return self.files[file_id]
+
+def _default_provider_factory(resolved: Dict[str, Any]):
+    adaptor = get_adaptor(adaptor_name(resolved["model_provider"], resolved["model_config"]))
+    return OpenAIBatchProvider(adaptor.client(resolved["model_config"], resolved["api_key"]))
+
+class BatchJobManager:
+    """
+    Submits, polls and resumes offline batch jobs.
+
+    Args:
+        store: The JobStore holding job state.
+        provider_factory: Builds a batch provider from the resolved model config
+            (see resolve_model_config). Defaults to OpenAIBatchProvider on the
+            pooled client; pass e.g. `lambda resolved: FakeBatchProvider()` to test
+            without network.
+        max_requests_per_batch: Jobs larger than this are split into several provider batches.
+    """
+
+    def __init__(self, store: JobStore, provider_factory: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                 max_requests_per_batch: int = MAX_REQUESTS_PER_BATCH):
+        self.store = store
+        self.provider_factory = provider_factory or _default_provider_factory
+        self.max_requests_per_batch = max_requests_per_batch
+        self._providers: Dict[tuple, Any] = {}
+
+    def _resolve(self, interface_id: str, model_provider: str) -> Dict[str, Any]:
+        error, resolved = resolve_model_config(interface_id, model_provider)
+        if error:
+            raise ConfigurationError(error.message)
+        # Only OpenAI-compatible endpoints expose the files/batches API
+        if not isinstance(get_adaptor(adaptor_name(model_provider, resolved["model_config"])), OpenAIAdaptor):
+            raise ConfigurationError(f"Provider '{model_provider}' does not support batch jobs")
+        return resolved
+
+    def _provider(self, resolved: Dict[str, Any]):
+        key = (resolved["interface_id"], resolved["model_provider"])
+        if key not in self._providers:
+            self._providers[key] = self.provider_factory(resolved)
+        return self._providers[key]
+
+    def _set_job(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        self.store.execute("UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                           (status, error, time.time(), job_id))
+
+    async def submit(self, interface_id: str, items: Iterable[Dict[str, Any]], model_provider: str = 'openai') -> str:
+        """
+        Create a job from input items and submit its provider batches.
+
+        Args:
+            interface_id: The interface whose system_prompt and model are used.
+            items: Dicts with 'id' and 'message' (see read_input_file).
+            model_provider: A provider with a batch API (default 'openai').
+
+        Returns:
+            str: The new job ID.
+
+        Raises:
+            ConfigurationError: If the interface/provider is invalid or has no batch API.
+        """
+        resolved = self._resolve(interface_id, model_provider)
+        job_id = uuid.uuid4().hex
+        # Items without a message are recorded as failed rather than sent
+        rows = [(job_id, index, str(item["id"]), item.get("message") or "",
+                 None if item.get("message") else "Error: 'message' must be provided.")
+                for index, item in enumerate(items)]
+        sendable = [row[1] for row in rows if row[4] is None]
+        now = time.time()
+        self.store.execute(
+            "INSERT INTO jobs VALUES (?, ?, ?, ?, 'pending', ?, NULL, ?, ?)",
+            (job_id, interface_id, model_provider, resolved["model_config"].get("model"), len(rows), now, now),
+        )
+        self.store.executemany(
+            "INSERT INTO job_items (job_id, item_index, item_id, message, error) VALUES (?, ?, ?, ?, ?)", rows)
+        # Each part spans the item indexes of up to max_requests_per_batch sendable items
+        chunks = [sendable[start:start + self.max_requests_per_batch]
+                  for start in range(0, len(sendable), self.max_requests_per_batch)]
+        self.store.executemany(
+            "INSERT INTO job_parts (job_id, part, start_index, end_index, status) VALUES (?, ?, ?, ?, 'pending')",
+            [(job_id, part, chunk[0], chunk[-1] + 1) for part, chunk in enumerate(chunks)],
+        )
+        log_event("batch_job_created", correlation_id=job_id, interface_id=interface_id, items=len(rows))
+        await self.advance(job_id)
+        return job_id
+
+    def _request_lines(self, job_id: str, resolved: Dict[str, Any], start: int, end: int) -> bytes:
+        items = self.store.execute(
+            "SELECT item_index, message FROM job_items WHERE job_id = ? AND item_index >= ? AND item_index < ? "
+            "AND error IS NULL ORDER BY item_index", (job_id, start, end))
+        model = resolved["model_config"].get("model")
+        # Every line starts with the same system message so the provider can cache the prefix
+        system_message = get_prompt_orchestrator().compile(resolved).system_message
+        options = openai_options(resolved["model_config"])
+        return "\n".join(json.dumps({
+            "custom_id": str(item["item_index"]),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": model, "messages": [system_message, {
+                "role": "user", "content": fit_input({**resolved, "question": item["message"]})}],
+                     **options},
+        }) for item in items).encode()
+
+    async def advance(self, job_id: str) -> str:
+        """
+        Move every part of a job one step forward: upload, create, poll or collect.
+
+        Safe to call repeatedly and after a restart; each step is persisted before
+        the next one starts.
+
+        Returns:
+            str: The job status after this step.
+        """
+        job = self.store.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+        if not job:
+            raise KeyError(f"No batch job found: {job_id}")
+        job = job[0]
+        if job["status"] in ("completed", "failed"):
+            return job["status"]
+        try:
+            resolved = self._resolve(job["interface_id"], job["model_provider"])
+        except ConfigurationError as e:
+            self._set_job(job_id, "failed", str(e))
+            return "failed"
+        provider = self._provider(resolved)
+
+        parts = self.store.execute("SELECT * FROM job_parts WHERE job_id = ? ORDER BY part", (job_id,))
+        for part in parts:
+            status = part["status"]
+            key = (job_id, part["part"])
+            if status == "pending":
+                file_id = await provider.upload(self._request_lines(job_id, resolved, part["start_index"], part["end_index"]))
+                self.store.execute("UPDATE job_parts SET status = 'uploaded', input_file_id = ? WHERE job_id = ? AND part = ?",
+                                   (file_id, *key))
+                status = "uploaded"
+                part = {**dict(part), "input_file_id": file_id}
+            if status == "uploaded":
+                batch_id = await provider.create(part["input_file_id"], {"mobai_job_id": job_id, "part": str(part["part"])})
+                self.store.execute("UPDATE job_parts SET status = 'submitted', provider_batch_id = ? WHERE job_id = ? AND part = ?",
+                                   (batch_id, *key))
+                self._set_job(job_id, "submitted")
+            elif status == "submitted":
+                batch = await provider.retrieve(part["provider_batch_id"])
+                if batch["status"] == "completed":
+                    await self._collect(job_id, provider, batch, resolved)
+                    self.store.execute("UPDATE job_parts SET status = 'completed' WHERE job_id = ? AND part = ?", key)
+                elif batch["status"] in TERMINAL_PART_STATUSES:
+                    if batch.get("output_file_id") or batch.get("error_file_id"):
+                        await self._collect(job_id, provider, batch, resolved)
+                    self.store.execute("UPDATE job_parts SET status = 'failed', error = ? WHERE job_id = ? AND part = ?",
+                                       (f"Provider batch {batch['status']}", *key))
+
+        statuses = {row["status"] for row in self.store.execute(
+            "SELECT status FROM job_parts WHERE job_id = ?", (job_id,))}
+        if not statuses or statuses == {"completed"}:
+            self._set_job(job_id, "completed")
+        elif statuses <= {"completed", "failed"}:
+            self._set_job(job_id, "failed", "One or more provider batches did not complete")
+        return self.status(job_id)["status"]
+
+    async def _collect(self, job_id: str, provider, batch: Dict[str, Any], resolved: Dict[str, Any]) -> None:
+        # Typed answers are stored in canonical form, so results() never re-parses them
+        output = output_settings(resolved["interface_config"])
+        updates = []
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if not file_id:
+                continue
+            for line in (await provider.download(file_id)).decode().splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                response = result.get("response") or {}
+                body = response.get("body") or {}
+                if result.get("error") or response.get("status_code") != 200:
+                    error = result.get("error") or body.get("error") or {"message": f"status {response.get('status_code')}"}
+                    updates.append((None, f"Error from batch provider: {error.get('message', error)}", job_id, int(result["custom_id"])))
+                elif body.get("choices"):
+                    content = body["choices"][0]["message"]["content"]
+                    if output is not None:
+                        content = parse_output(content, output) or content
+                    updates.append((content, None, job_id, int(result["custom_id"])))
+                else:
+                    updates.append((None, "Error: No response content received from batch provider.", job_id, int(result["custom_id"])))
+        self.store.executemany("UPDATE job_items SET response = ?, error = ? WHERE job_id = ? AND item_index = ?", updates)
+
+    async def wait(self, job_id: str, poll_interval: float = 30.0) -> str:
+        """Advance a job until it completes or fails, sleeping poll_interval between polls."""
+        while True:
+            status = await self.advance(job_id)
+            if status in ("completed", "failed"):
+                return status
+            await asyncio.sleep(poll_interval)
+
+    async def resume_jobs(self, poll_interval: float = 30.0) -> Dict[str, str]:
+        """Drive every unfinished job in the store to completion. Returns {job_id: status}."""
+        rows = self.store.execute("SELECT job_id FROM jobs WHERE status NOT IN ('completed', 'failed')")
+        statuses = await asyncio.gather(*(self.wait(row["job_id"], poll_interval) for row in rows))
+        return {row["job_id"]: status for row, status in zip(rows, statuses)}
+
+    def status(self, job_id: str) -> Dict[str, Any]:
+        """Return the job record with per-status item counts."""
+        job = self.store.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+        if not job:
+            raise KeyError(f"No batch job found: {job_id}")
+        counts = self.store.execute(
+            "SELECT SUM(response IS NOT NULL) AS succeeded, SUM(error IS NOT NULL) AS failed "
+            "FROM job_items WHERE job_id = ?", (job_id,))[0]
+        return {**dict(job[0]), "succeeded": counts["succeeded"] or 0, "failed": counts["failed"] or 0}
+
+    def results(self, job_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        Yield each input item joined with its response or error, in input order.
+
+        For interfaces with an `output` section, parsed responses also carry
+        the typed 'label' or 'score'.
+        """
+        job = self.store.execute("SELECT interface_id FROM jobs WHERE job_id = ?", (job_id,))
+        try:
+            output = output_settings(get_configuration(job[0]["interface_id"])) if job else None
+        except KeyError:
+            output = None
+        for row in self.store.execute(
+                "SELECT item_index, item_id, response, error FROM job_items WHERE job_id = ? ORDER BY item_index", (job_id,)):
+            result = {"index": row["item_index"], "id": row["item_id"]}
+            if row["response"] is not None:
+                result["response"] = row["response"]
+                if output is not None:
+                    result.update(typed_fields(row["response"], output))
+            else:
+                result["error"] = row["error"] or "Error: No result returned for this item."
+            yield result
+
+async def _main(args: argparse.Namespace) -> None:
+    manager = BatchJobManager(JobStore(args.db))
+    if args.command == "submit":
+        job_id = await manager.submit(args.interface_id, read_input_file(args.input), args.model_provider)
+        print(job_id)
+        if args.wait:
+            print(await manager.wait(job_id, args.poll_interval))
+    elif args.command == "status":
+        print(json.dumps(manager.status(args.job_id), indent=2))
+    elif args.command == "results":
+        lines = (json.dumps(result) + "\n" for result in manager.results(args.job_id))
+        if args.output:
+            with open(args.output, "w") as file:
+                file.writelines(lines)
+        else:
+            for line in lines:
+                print(line, end="")
+    elif args.command == "resume":
+        print(json.dumps(await manager.resume_jobs(args.poll_interval), indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline batch jobs through provider batch APIs")
+    parser.add_argument("--db", default=None, help="Path to the SQLite job store")
+    parser.add_argument("--poll-interval", type=float, default=30.0)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    submit = subparsers.add_parser("submit")
+    submit.add_argument("interface_id")
+    submit.add_argument("input", help="JSON array or NDJSON file of messages")
+    submit.add_argument("--model-provider", default="openai")
+    submit.add_argument("--wait", action="store_true")
+    status = subparsers.add_parser("status")
+    status.add_argument("job_id")
+    results = subparsers.add_parser("results")
+    results.add_argument("job_id")
+    results.add_argument("--output")
+    subparsers.add_parser("resume")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import importlib
+import importlib.util
+import os
+import time
+import weakref
+import httpx
+from typing import Dict, Any, Optional, Tuple
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+class PoolStats:
+    """
+    Connection statistics for one pooled client, collected through httpcore trace events.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.wait_seconds = 0.0
+
+    async def trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.new_connections += 1
+
+    def as_dict(self, open_connections: int) -> Dict[str, Any]:
+        reused = max(self.requests - self.new_connections, 0)
+        return {
+            "open_connections": open_connections,
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reuse_ratio": reused / self.requests if self.requests else 0.0,
+            "total_wait_seconds": self.wait_seconds,
+            "avg_wait_seconds": self.wait_seconds / self.requests if self.requests else 0.0,
+        }
+
+class _InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps an AsyncHTTPTransport and records how long each request waited for a
+    connection (pool checkout plus any new TCP/TLS handshake) before sending.
+    """
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport, stats: PoolStats):
+        self._transport = transport
+        self.stats = stats
+
+    @property
+    def open_connections(self) -> int:
+        pool = getattr(self._transport, "_pool", None)
+        return len(getattr(pool, "connections", ()))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        sent = False
+        stats = self.stats
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            nonlocal sent
+            if not sent and event_name.endswith("send_request_headers.started"):
+                sent = True
+                stats.wait_seconds += time.perf_counter() - started
+            await stats.trace(event_name, info)
+
+        stats.requests += 1
+        request.extensions = {**request.extensions, "trace": trace}
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+class ClientPool:
+    """
+    Long-lived provider clients keyed by (provider, API key, base URL).
+
+    Each entry owns one httpx.AsyncClient with keep-alive connections (HTTP/2 through
+    'h2', installed with the httpx[http2] dependency), so consecutive requests to the same
+    provider reuse TCP/TLS connections instead of handshaking every time.
+
+    Pool sizes and timeouts are read from the environment:
+        MOBAI_POOL_MAX_CONNECTIONS  (default 100)
+        MOBAI_POOL_MAX_KEEPALIVE    (default 20)
+        MOBAI_CONNECT_TIMEOUT       (seconds, default 10)
+        MOBAI_READ_TIMEOUT          (seconds, default 600)
+        MOBAI_HTTP2                 (default 'true')
+        MOBAI_DISABLE_SSL_VERIFY    (default 'false')
+    """
+
+    def __init__(self):
+        self.max_connections = _env_int('MOBAI_POOL_MAX_CONNECTIONS', 100)
+        self.max_keepalive = _env_int('MOBAI_POOL_MAX_KEEPALIVE', 20)
+        self.connect_timeout = _env_float('MOBAI_CONNECT_TIMEOUT', 10)
+        self.read_timeout = _env_float('MOBAI_READ_TIMEOUT', 600)
+        self.http2 = (os.environ.get('MOBAI_HTTP2', 'true').lower() == 'true'
+                      and importlib.util.find_spec('h2') is not None)
+        self.verify = os.environ.get('MOBAI_DISABLE_SSL_VERIFY', 'false').lower() != 'true'
+        self._http_clients: Dict[Tuple[str, str, str], httpx.AsyncClient] = {}
+        self._transports: Dict[Tuple[str, str, str], _InstrumentedTransport] = {}
+        self._provider_clients: Dict[Tuple[str, str, str], Any] = {}
+
+    @staticmethod
+    def _key(provider: str, api_key: Optional[str], base_url: Optional[str]) -> Tuple[str, str, str]:
+        # Never keep raw API keys in pool keys or stats labels
+        key_hash = hashlib.sha256(api_key.encode()).hexdigest()[:12] if api_key else ""
+        return (provider, key_hash, base_url or "")
+
+    def get_http_client(self, provider: str, base_url: Optional[str] = None,
+                        api_key: Optional[str] = None) -> httpx.AsyncClient:
+        """
+        Return the shared httpx.AsyncClient for a provider endpoint, creating it on first use.
+        """
+        key = self._key(provider, api_key, base_url)
+        client = self._http_clients.get(key)
+        if client is None:
+            transport = _InstrumentedTransport(
+                httpx.AsyncHTTPTransport(
+                    verify=self.verify,
+                    http2=self.http2,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_keepalive,
+                    ),
+                ),
+                PoolStats(),
+            )
+            client = httpx.AsyncClient(
+                transport=transport,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            )
+            self._transports[key] = transport
+            self._http_clients[key] = client
+        return client
+
+    def get_openai_client(self, model_provider: str, api_key: str, base_url: Optional[str] = None,
+                          client_class=None):
+        """
+        Return the shared AsyncOpenAI-style client for a provider, creating it on first use.
+
+        Without `client_class`, the provider module is imported once per pool
+        entry and must export an 'AsyncOpenAI' class (e.g. the 'openai' package).
+
+        Raises:
+            ValueError: If the client class cannot be loaded.
+        """
+        key = self._key(model_provider, api_key, base_url)
+        client = self._provider_clients.get(key)
+        if client is None:
+            if client_class is None:
+                try:
+                    module = importlib.import_module(model_provider)
+                    client_class = getattr(module, 'AsyncOpenAI')
+                except (ImportError, AttributeError) as e:
+                    raise ValueError(f"Could not load client for {model_provider}: {e}")
+            kwargs = {
+                "api_key": api_key,
+                "http_client": self.get_http_client(model_provider, base_url, api_key),
+                "timeout": httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                # Retries are handled by src.scheduler so they respect shared rate limits
+                "max_retries": 0,
+            }
+            if base_url:
+                kwargs["base_url"] = base_url
+            client = client_class(**kwargs)
+            self._provider_clients[key] = client
+        return client
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return per-pool connection statistics keyed by 'provider@base_url#key_hash'."""
+        result = {}
+        for (provider, key_hash, base_url), transport in self._transports.items():
+            label = f"{provider}@{base_url or 'default'}" + (f"#{key_hash}" if key_hash else "")
+            result[label] = transport.stats.as_dict(transport.open_connections)
+        return result
+
+    async def aclose(self) -> None:
+        """Close every pooled client and its connections."""
+        clients = list(self._http_clients.values())
+        self._http_clients.clear()
+        self._transports.clear()
+        self._provider_clients.clear()
+        for client in clients:
+            await client.aclose()
+
+# httpx connections are bound to the event loop that opened them, so each loop
+# gets its own pool.
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ClientPool]" = weakref.WeakKeyDictionary()
+
+def get_client_pool() -> ClientPool:
+    """
+    Return the ClientPool for the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = ClientPool()
+        _pools[loop] = pool
+    return pool
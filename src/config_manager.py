@@ -1,16 +1,98 @@
-import yaml
+import logging
 import os
-from typing import Dict, Any
-from pathlib import Path
+import threading
+import time
+import yaml
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Any, List, Mapping, Optional, Tuple
+
+CONFIG_FILENAME = 'config.yaml'
+
+def _freeze(value: Any) -> Any:
+    """Recursively convert dicts and lists into read-only equivalents."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+@dataclass(frozen=True)
+class InterfaceConfig:
+    """
+    An immutable, validated snapshot of one interface's config.yaml.
+
+    Attributes:
+        interface_id: Name of the interface directory.
+        data: The parsed configuration as a read-only mapping.
+        version: Incremented every time this interface is (re)loaded.
+        mtime_ns: Modification time of config.yaml when it was loaded.
+        loaded_at: Wall-clock time (epoch seconds) of the load.
+        load_seconds: How long parsing and validation took.
+    """
+    interface_id: str
+    data: Mapping[str, Any]
+    version: int
+    mtime_ns: int
+    loaded_at: float
+    load_seconds: float
+
+    @property
+    def model_providers(self) -> Mapping[str, Any]:
+        return self.data.get('model_providers', MappingProxyType({}))
+
+def validate_interface_config(interface_id: str, config: Any) -> None:
+    """
+    Validate the overall shape of an interface configuration.
+
+    Provider-specific fields are checked per request by
+    external_integration.validate_model_config.
+
+    Raises:
+        ValueError: If the configuration is malformed.
+    """
+    if not isinstance(config, dict):
+        raise ValueError(f"Configuration for interface {interface_id} must be a mapping")
+    model_providers = config.get('model_providers', {})
+    if not isinstance(model_providers, dict):
+        raise ValueError(f"'model_providers' for interface {interface_id} must be a mapping")
+    for provider, provider_config in model_providers.items():
+        if not isinstance(provider_config, dict):
+            raise ValueError(f"Provider '{provider}' for interface {interface_id} must be a mapping")
+    timeout_ms = config.get('timeout_ms')
+    if timeout_ms is not None and (isinstance(timeout_ms, bool) or not isinstance(timeout_ms, int) or timeout_ms <= 0):
+        raise ValueError(f"'timeout_ms' for interface {interface_id} must be a positive integer")
+    output = config.get('output')
+    if output is not None:
+        if not isinstance(output, dict) or output.get('type') not in ('label', 'score'):
+            raise ValueError(f"'output' for interface {interface_id} must be a mapping with type 'label' or 'score'")
+        if output['type'] == 'label' and not output.get('labels'):
+            raise ValueError(f"'output' for interface {interface_id} must list its 'labels'")
+    budget = config.get('token_budget')
+    if budget is not None:
+        if not isinstance(budget, dict):
+            raise ValueError(f"'token_budget' for interface {interface_id} must be a mapping")
+        for key in ('max_input_tokens', 'max_output_tokens'):
+            value = budget.get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value <= 0):
+                raise ValueError(f"'token_budget.{key}' for interface {interface_id} must be a positive integer")
+        if budget.get('truncation', 'head_tail') not in ('head', 'tail', 'head_tail'):
+            raise ValueError(f"'token_budget.truncation' for interface {interface_id} must be head, tail or head_tail")
 
 class ConfigManager:
     """
     Manages configuration for different interfaces in the AI platform.
-    
+
     This class implements a directory-based configuration system where each interface
-    has its own directory containing a config.yaml file. The configuration is cached
-    in memory for improved performance.
-    
+    has its own directory containing a config.yaml file. All interfaces are parsed
+    and validated once into immutable InterfaceConfig snapshots; afterwards lookups
+    never touch the disk.
+
+    Reloads are driven by polling the mtime of each config.yaml (see
+    reload_changed and start_watching). Only changed interfaces are re-parsed, and
+    the snapshot dictionary is swapped in a single reference assignment, so readers
+    never take a lock.
+
     Directory Structure:
         interfaces/
         ├── interface1/
@@ -18,7 +100,7 @@ class ConfigManager:
         ├── interface2/
         │   └── config.yaml
         └── ...
-    
+
     Example config.yaml format:
         model_providers:
           openai:
@@ -27,67 +109,204 @@ class ConfigManager:
             system_prompt: |
               Your system prompt here
     """
-    
-    def __init__(self, interfaces_dir: str = 'interfaces'):
+
+    def __init__(self, interfaces_dir: str = 'interfaces', poll_interval: Optional[float] = None):
         """
-        Initialize the ConfigManager.
-        
+        Initialize the ConfigManager and load every interface.
+
         Args:
             interfaces_dir (str): Path to the directory containing interface configurations.
                                 Defaults to 'interfaces'.
+            poll_interval (float): Seconds between mtime checks when watching.
+                                Defaults to MOBAI_CONFIG_POLL_INTERVAL or 2 seconds.
         """
         self.interfaces_dir = interfaces_dir
-        self.config_cache = {}
+        if poll_interval is None:
+            poll_interval = float(os.environ.get('MOBAI_CONFIG_POLL_INTERVAL', '2'))
+        self.poll_interval = poll_interval
+        self.config_cache: Dict[str, InterfaceConfig] = {}
+        self.load_errors: Dict[str, str] = {}
+        self._failed_mtimes: Dict[str, int] = {}
+        self.reload_count = 0
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.reload_changed()
+
+    def _scan(self) -> Dict[str, Tuple[str, int]]:
+        """Return {interface_id: (config_path, mtime_ns)} for every interface on disk."""
+        found = {}
+        try:
+            entries = list(os.scandir(self.interfaces_dir))
+        except FileNotFoundError:
+            return found
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            config_path = os.path.join(entry.path, CONFIG_FILENAME)
+            try:
+                found[entry.name] = (config_path, os.stat(config_path).st_mtime_ns)
+            except FileNotFoundError:
+                continue
+        return found
+
+    def _load(self, interface_id: str, config_path: str, mtime_ns: int, version: int) -> InterfaceConfig:
+        started = time.perf_counter()
+        with open(config_path, 'r') as file:
+            config = yaml.safe_load(file) or {}
+        validate_interface_config(interface_id, config)
+        return InterfaceConfig(
+            interface_id=interface_id,
+            data=_freeze(config),
+            version=version,
+            mtime_ns=mtime_ns,
+            loaded_at=time.time(),
+            load_seconds=time.perf_counter() - started,
+        )
+
+    def reload_changed(self) -> List[str]:
+        """
+        Reload interfaces whose config.yaml is new, changed or removed.
+
+        A file that fails to parse or validate keeps its previous snapshot (if any)
+        and the error is recorded in load_errors.
 
-    def get_configuration(self, interface_id: str) -> Dict[str, Any]:
+        Returns:
+            List[str]: IDs of the interfaces that were added, reloaded or removed.
+        """
+        with self._write_lock:
+            current = self.config_cache
+            on_disk = self._scan()
+            updated = dict(current)
+            changed = []
+            for interface_id, (config_path, mtime_ns) in on_disk.items():
+                previous = current.get(interface_id)
+                if previous is not None and previous.mtime_ns == mtime_ns:
+                    continue
+                if self._failed_mtimes.get(interface_id) == mtime_ns:
+                    continue
+                version = previous.version + 1 if previous else 1
+                try:
+                    updated[interface_id] = self._load(interface_id, config_path, mtime_ns, version)
+                    self.load_errors.pop(interface_id, None)
+                    self._failed_mtimes.pop(interface_id, None)
+                    changed.append(interface_id)
+                except Exception as e:
+                    self.load_errors[interface_id] = str(e)
+                    self._failed_mtimes[interface_id] = mtime_ns
+                    logging.error(f"Error loading configuration for interface {interface_id}: {e}")
+            for interface_id in set(current) - set(on_disk):
+                del updated[interface_id]
+                changed.append(interface_id)
+            for interface_id in set(self.load_errors) - set(on_disk):
+                del self.load_errors[interface_id]
+                self._failed_mtimes.pop(interface_id, None)
+            if changed:
+                # Single reference swap: readers see either the old or the new snapshot
+                self.config_cache = updated
+                self.reload_count += 1
+            return changed
+
+    def get_interface(self, interface_id: str) -> InterfaceConfig:
+        """
+        Retrieve the immutable snapshot for an interface.
+
+        Raises:
+            KeyError: If the interface is unknown or its configuration failed to load.
+        """
+        config = self.config_cache.get(interface_id)
+        if config is not None:
+            return config
+        if interface_id in self.load_errors:
+            raise KeyError(
+                f"Error loading configuration for interface {interface_id}: {self.load_errors[interface_id]}"
+            )
+        raise KeyError(f"No configuration found for interface: {interface_id}")
+
+    def get_configuration(self, interface_id: str) -> Mapping[str, Any]:
         """
         Retrieve the configuration for a specific interface.
-        
-        This method first checks the cache for the configuration. If not found,
-        it loads the configuration from the interface's config.yaml file and caches it.
-        
+
+        The configuration is served from the in-memory snapshot; no file I/O
+        happens here.
+
         Args:
             interface_id (str): The ID of the interface to get configuration for.
                               This should match the directory name in interfaces/.
-        
+
         Returns:
-            Dict[str, Any]: The configuration dictionary for the specified interface.
-            
+            Mapping[str, Any]: A read-only view of the configuration for the interface.
+
         Raises:
             KeyError: If no configuration is found for the specified interface,
                      or if there's an error loading the configuration file.
         """
-        # Check cache first
-        if interface_id in self.config_cache:
-            return self.config_cache[interface_id]
-
-        # Build the path to the interface's config file
-        config_path = os.path.join(self.interfaces_dir, interface_id, 'config.yaml')
-        
-        if not os.path.exists(config_path):
-            raise KeyError(f"No configuration found for interface: {interface_id}")
-        
-        try:
-            with open(config_path, 'r') as file:
-                config = yaml.safe_load(file) or {}
-                # Cache the configuration
-                self.config_cache[interface_id] = config
-                return config
-        except Exception as e:
-            raise KeyError(f"Error loading configuration for interface {interface_id}: {str(e)}")
-
-def get_configuration(interface_id: str) -> Dict[str, Any]:
+        return self.get_interface(interface_id).data
+
+    def interface_ids(self) -> List[str]:
+        """Return the IDs of all successfully loaded interfaces."""
+        return sorted(self.config_cache)
+
+    def load_times(self) -> Dict[str, Dict[str, float]]:
+        """Return load timestamp, duration and version for each loaded interface."""
+        return {
+            interface_id: {
+                "loaded_at": config.loaded_at,
+                "load_seconds": config.load_seconds,
+                "version": config.version,
+            }
+            for interface_id, config in self.config_cache.items()
+        }
+
+    def start_watching(self) -> None:
+        """Start a daemon thread that calls reload_changed every poll_interval seconds."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=self._watch, name="config-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        """Stop the watcher thread started by start_watching."""
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.poll_interval + 1)
+            self._watcher = None
+
+    def _watch(self) -> None:
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                changed = self.reload_changed()
+                if changed:
+                    logging.info(f"Reloaded interface configurations: {', '.join(sorted(changed))}")
+            except Exception as e:
+                logging.error(f"Error polling interface configurations: {e}")
+
+_shared_manager: Optional[ConfigManager] = None
+_shared_lock = threading.Lock()
+
+def get_config_manager() -> ConfigManager:
+    """
+    Return the process-wide ConfigManager, creating it on first use.
+    """
+    global _shared_manager
+    if _shared_manager is None:
+        with _shared_lock:
+            if _shared_manager is None:
+                _shared_manager = ConfigManager()
+    return _shared_manager
+
+def get_configuration(interface_id: str) -> Mapping[str, Any]:
     """
     Convenience function to get configuration for an interface.
-    
-    This is a shortcut that creates a ConfigManager instance and calls
-    get_configuration() on it.
-    
+
+    This is a shortcut that calls get_configuration() on the shared
+    ConfigManager returned by get_config_manager().
+
     Args:
         interface_id (str): The ID of the interface to get configuration for.
-        
+
     Returns:
-        Dict[str, Any]: The configuration dictionary for the specified interface.
+        Mapping[str, Any]: The configuration for the specified interface.
     """
-    manager = ConfigManager()
-    return manager.get_configuration(interface_id)
+    return get_config_manager().get_configuration(interface_id)
@@ -0,0 +1,61 @@
+"""
+Request deadlines.
+
+An interface may set `timeout_ms` in config.yaml, and a request may ask for a
+shorter one. A deadline covers the whole request: waiting for a scheduler
+slot, retries and failover. When it passes, the pending upstream call is
+cancelled, which closes its HTTP connection so the backend stops generating.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Mapping, Optional
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a request does not complete within its deadline.
+
+    Attributes:
+        timeout_ms: The deadline that passed, in milliseconds.
+    """
+
+    def __init__(self, timeout_ms: int):
+        super().__init__(f"Error: Request timed out after {timeout_ms} ms.")
+        self.timeout_ms = timeout_ms
+
+def effective_timeout_ms(interface_config: Mapping[str, Any], requested: Optional[int] = None) -> Optional[int]:
+    """
+    The deadline for a request: the shorter of the interface's `timeout_ms`
+    and the one the request asked for, or None when neither is set.
+    """
+    limits = [int(value) for value in (interface_config.get('timeout_ms'), requested) if value]
+    return min(limits) if limits else None
+
+class Deadline:
+    """
+    A point in time by which a request must finish, fixed when created.
+
+    guard() may wrap several separate awaits (e.g. each chunk of a stream);
+    they all share the same deadline.
+    """
+
+    def __init__(self, timeout_ms: Optional[int]):
+        self.timeout_ms = timeout_ms
+        self.when = asyncio.get_running_loop().time() + timeout_ms / 1000.0 if timeout_ms else None
+
+    @asynccontextmanager
+    async def guard(self) -> AsyncIterator[None]:
+        """
+        Cancel the block when the deadline passes.
+
+        Raises:
+            DeadlineExceeded: If the block was cancelled by the deadline.
+        """
+        scope = asyncio.timeout_at(self.when)
+        try:
+            async with scope:
+                yield
+        except TimeoutError:
+            # Only our own expiry is a deadline; other TimeoutErrors pass through
+            if scope.expired():
+                raise DeadlineExceeded(self.timeout_ms) from None
+            raise
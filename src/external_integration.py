@@ -1,13 +1,29 @@
-import importlib
+import asyncio
+from contextlib import AsyncExitStack, aclosing
 import logging
 import os
-import requests
-import httpx
-import src.log_config
-from .config_manager import ConfigManager
+import random
+from .deadline import Deadline, DeadlineExceeded, effective_timeout_ms
+from .log_config import log_event, new_correlation_id
+from .model_adaptor import Completion, ProviderError, adaptor_name, get_adaptor
+from .prompt_orchestrator import assemble_messages, count_tokens, get_prompt_orchestrator
+from .packing import max_items, max_tokens, pack_question, packing_settings, parse_pack_response
+from .metrics import (OUTPUT_TOKENS, OUTPUTS_PARSED, PACKED_ITEMS, PRECLASSIFIED, PROMPT_PREFIX_TOKENS,
+                      REQUEST_SECONDS, REQUESTS_ABORTED, SEMANTIC_CACHE_LOOKUP_SECONDS, STAGE_SECONDS, TIME_TO_FIRST_TOKEN_SECONDS, UPSTREAM_ERRORS,
+                      model_labels, record_usage)
+from .preclassifier import Prediction, Preclassifier, get_preclassifier
+from .config_manager import get_config_manager
+from .response_cache import ResponseCache, cache_key, get_response_cache
+from .semantic_cache import SemanticCache, get_semantic_cache
+from .router import AllBackendsFailed, get_router
+from .scheduler import estimate_tokens, get_scheduler, is_retryable
+from .schemas import AIResponse, ErrorInfo, Usage, error_info
+from .single_flight import get_single_flight
+from .structured_output import output_settings, parse_output, typed_fields
+from .token_budget import budget_settings, fit_input, get_tokenizer
+import threading
 import time
-import json
-from typing import Dict, Any
+from typing import AsyncIterable, AsyncIterator, Dict, Any, Iterable, List, Mapping, Optional, Tuple, Union
 
 class ConfigurationError(Exception):
     """Raised when there's an error in the configuration."""
@@ -28,165 +44,849 @@ def validate_model_config(model_config: Dict[str, Any], model_provider: str, int
     if not model_config:
         raise ConfigurationError(f"No configuration found for model provider '{model_provider}' in interface '{interface_id}'")
     
-    required_fields = {
-        'openai': ['model', 'api_key', 'system_prompt'],
-        'local_model': ['model_type', 'base_url', 'model', 'system_prompt']
-    }
+    try:
+        adaptor = get_adaptor(adaptor_name(model_provider, model_config))
+    except KeyError:
+        raise ConfigurationError(
+            f"No adaptor registered for model provider '{model_provider}' in interface '{interface_id}'"
+        )
     
-    missing_fields = [field for field in required_fields.get(model_provider, []) 
-                     if field not in model_config]
+    missing_fields = [field for field in adaptor.required_fields
+                     if field not in model_config
+                     # Several endpoints may be listed instead of a single base_url
+                     and not (field == 'base_url' and model_config.get('base_urls'))]
     
     if missing_fields:
         raise ConfigurationError(
             f"Missing required fields for {model_provider} in interface '{interface_id}': {', '.join(missing_fields)}"
         )
     
-    if model_provider == 'local_model' and model_config.get('model_type') != 'ollama':
-        raise ConfigurationError(
-            f"Unsupported local model type '{model_config.get('model_type')}' in interface '{interface_id}'. "
-            "Currently only 'ollama' is supported."
-        )
+    try:
+        adaptor.validate(model_config, interface_id)
+    except ValueError as e:
+        raise ConfigurationError(str(e))
+
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_loop_lock = threading.Lock()
 
-def load_model_client(model_provider: str, api_key: str):
+def _run_sync(coro):
     """
-    Dynamically load and initialize a client for the specified model provider.
-    
-    Args:
-        model_provider (str): Name of the model provider (e.g., 'openai', 'anthropic')
-        api_key (str): API key for the model provider
+    Run a coroutine on a long-lived background event loop and wait for the result.
     
-    Returns:
-        An initialized client for the specified model provider
+    Reusing one loop lets synchronous callers share pooled connections
+    across calls instead of opening new ones every time.
     """
-    try:
-        # Dynamically import the module based on the model provider
-        module = importlib.import_module(model_provider)
-        client_class = getattr(module, 'OpenAI')  # Assumes a standard naming convention
-        
-        # Check if secure connection should be disabled
-        disable_verify = os.environ.get('MOBAI_DISABLE_SSL_VERIFY', 'false').lower() == 'true'
-        if disable_verify:
-            http_client = httpx.Client(verify=False)
-            return client_class(api_key=api_key, http_client=http_client)
-        else:
-            return client_class(api_key=api_key)
-    except (ImportError, AttributeError) as e:
-        raise ValueError(f"Could not load client for {model_provider}: {e}")
+    global _sync_loop
+    if _sync_loop is None:
+        with _sync_loop_lock:
+            if _sync_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="mobai-sync-loop", daemon=True).start()
+                _sync_loop = loop
+    return asyncio.run_coroutine_threadsafe(coro, _sync_loop).result()
 
 def fetch_external_data(context: dict) -> str:
     """
-    Fetches data from an external AI model API based on user context or input.
+    Synchronous wrapper around fetch_external_data_async for existing callers.
+    
+    Must not be called from inside a running event loop; async code should
+    await fetch_external_data_async directly.
     
     Args:
         context: A dictionary containing configuration and query information.
-                Expected to have:
-                - 'model_provider': Name of the AI model provider
-                - 'question': Query to send to the AI
     
     Returns:
-        String containing the response from the AI model.
+        The response text, or the error message if the query failed.
+    """
+    result = _run_sync(fetch_external_data_async(context))
+    return result.response_text if result.ok else result.error.message
+
+def resolve_model_config(interface_id: str, model_provider: str) -> Tuple[Optional[ErrorInfo], Optional[Dict[str, Any]]]:
     """
-    # Generate correlation ID
-    correlation_id = f"{int(time.time())}_{context.get('interface_id', 'unknown')}"
+    Resolve and validate the provider configuration for an interface.
     
-    # Load configuration
-    config_manager = ConfigManager()
+    Args:
+        interface_id: The interface ID
+        model_provider: The name of the model provider
     
-    # Require interface_id, model_provider, and question in context
-    interface_id = context.get('interface_id')
-    if not interface_id:
-        return "Error: 'interface_id' must be provided in context."
-    model_provider = context.get('model_provider')
-    if not model_provider:
-        return "Error: 'model_provider' must be provided in context."
-    question = context.get('question')
-    if not question:
-        return "Error: 'question' must be provided in context."
+    Returns:
+        A tuple (error, resolved). On failure error is an ErrorInfo and
+        resolved is None; otherwise error is None and resolved holds
+        'interface_id', 'interface_config', 'model_provider', 'model_config',
+        'system_prompt', 'api_key' (None for local models) and 'config_version'.
+        With `output.json_mode` the model_config asks for a JSON response
+        ('response_format': 'json'), and `token_budget.max_output_tokens`
+        becomes its 'max_tokens' unless the provider sets one.
+    """
+    started = time.perf_counter()
+    # Shared, pre-loaded configuration
+    config_manager = get_config_manager()
     
     # Get model configuration from the new config structure
     try:
-        interface_config = config_manager.get_configuration(interface_id)
+        snapshot = config_manager.get_interface(interface_id)
     except KeyError:
-        return f"Error: No configuration found for interface: {interface_id}"
+        return error_info("not_found", f"Error: No configuration found for interface: {interface_id}"), None
+    interface_config = snapshot.data
     
     model_providers = interface_config.get('model_providers', {})
     model_config = model_providers.get(model_provider)
+    resolved_at = time.perf_counter()
 
     try:
         # Validate model configuration
         validate_model_config(model_config, model_provider, interface_id)
     except ConfigurationError as e:
-        return f"Configuration Error: {str(e)}"
+        return error_info("configuration", f"Configuration Error: {str(e)}"), None
+    labels = (interface_id, model_provider, str(model_config.get('model', '')))
+    STAGE_SECONDS.observe(resolved_at - started, "config", *labels)
+    STAGE_SECONDS.observe(time.perf_counter() - resolved_at, "validate", *labels)
     
-    # Extract system prompt
-    system_prompt = model_config.get('system_prompt')
-    
-    # Check if this is a local model
-    if model_provider == 'local_model':
-        try:
-            return call_local_model(model_config, system_prompt, question)
-        except requests.exceptions.ConnectionError:
-            return f"Error: Could not connect to local model service at {model_config.get('base_url')}. Please ensure the service is running."
-        except requests.exceptions.Timeout:
-            return f"Error: Request to local model service timed out. The service might be overloaded."
-        except Exception as e:
-            return f"Error fetching data from local model: {str(e)}"
-    else:
+    api_key = None
+    if get_adaptor(adaptor_name(model_provider, model_config)).requires_api_key:
         # Extract API key from environment variable
         api_key_env = model_config.get('api_key')
         api_key = os.environ.get(api_key_env)
         if not api_key:
-            return f"Error: Environment variable '{api_key_env}' for {model_provider} API key is not set."
-        
+            return error_info("configuration",
+                              f"Error: Environment variable '{api_key_env}' for {model_provider} API key is not set."), None
+    
+    output = output_settings(interface_config)
+    if output is not None and output.get('json_mode'):
+        model_config = {**model_config, "response_format": "json"}
+    budget = budget_settings(interface_config)
+    if budget is not None and budget.get('max_output_tokens') and not model_config.get('max_tokens'):
+        # Classification answers need only a few tokens; a provider's own max_tokens wins
+        model_config = {**model_config, "max_tokens": budget['max_output_tokens']}
+    
+    return None, {
+        "interface_id": interface_id,
+        "interface_config": interface_config,
+        "model_provider": model_provider,
+        "model_config": model_config,
+        "system_prompt": model_config.get('system_prompt'),
+        "api_key": api_key,
+        # Lets the prompt orchestrator reuse the system prompt compiled for this version
+        "config_version": snapshot.version,
+    }
+
+def _expand_endpoints(resolved: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Split a provider that lists several `base_urls` into one route per endpoint."""
+    base_urls = resolved['model_config'].get('base_urls')
+    if not base_urls:
+        return [resolved]
+    return [{**resolved, "model_config": {**resolved['model_config'], "base_url": base_url}}
+            for base_url in base_urls]
+
+def resolve_routes(interface_id: str, model_provider: Optional[str] = None) -> Tuple[Optional[ErrorInfo], Optional[List[Dict[str, Any]]]]:
+    """
+    Resolve every backend that may serve a query for an interface.
+    
+    With an explicit model_provider only that provider's endpoints are used.
+    Otherwise the candidates are the interface's `routing.providers`, or every
+    configured provider in config order. Misconfigured candidates are skipped
+    (and logged) as long as at least one remains.
+    
+    Args:
+        interface_id: The interface ID
+        model_provider: Optional name of the model provider to pin
+    
+    Returns:
+        A tuple (error, routes). On failure error is an ErrorInfo and routes
+        is None; otherwise routes is a list of resolve_model_config results,
+        one per provider endpoint.
+    """
+    if model_provider:
+        candidates = [model_provider]
+    else:
         try:
-            # Load and initialize the client dynamically
-            client = load_model_client(model_provider, api_key)
-
-            # Log request information
-            log_data = {
-                "correlation_id": correlation_id,
-                "event": "api_request",
-                "model_provider": model_provider,
-                "interface_id": interface_id,
-                "model": model_config.get('model'),
-                "question": question
-            }
-            logging.info(json.dumps(log_data))
-
-            # Call the API
-            response = client.chat.completions.create(
-                model=model_config.get('model'),
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": question}
-                ]
-            )
-
-            # Extract and return the response text
-            if response.choices and len(response.choices) > 0:
-                response_content = response.choices[0].message.content
-                # Log the response
-                log_data = {
-                    "correlation_id": correlation_id,
-                    "event": "api_response",
-                    "model_provider": model_provider,
-                    "interface_id": interface_id,
-                    "model": model_config.get('model'),
-                    "response": response_content
-                }
-                logging.info(json.dumps(log_data))
-                return response_content
-            else:
-                return f"Error: No response content received from {model_provider}."
+            interface_config = get_config_manager().get_configuration(interface_id)
+        except KeyError:
+            return error_info("not_found", f"Error: No configuration found for interface: {interface_id}"), None
+        routing = interface_config.get('routing') or {}
+        candidates = list(routing.get('providers') or interface_config.get('model_providers', {}).keys())
+        if not candidates:
+            return error_info("configuration", f"Error: No model providers configured for interface: {interface_id}"), None
+    
+    routes = []
+    first_error = None
+    for candidate in candidates:
+        error, resolved = resolve_model_config(interface_id, candidate)
+        if error:
+            first_error = first_error or error
+            log_event("route_skipped", logging.WARNING,
+                      interface_id=interface_id, model_provider=candidate, error=error.message)
+            continue
+        routes.extend(_expand_endpoints(resolved))
+    if not routes:
+        return first_error, None
+    return None, routes
+
+def prewarm_clients() -> int:
+    """
+    Create the pooled client of every configured backend on the running event
+    loop, so the first requests do not pay for client and TLS setup.
+    
+    Returns:
+        The number of backends prewarmed.
+    """
+    count = 0
+    for interface_id in list(get_config_manager().config_cache):
+        _, routes = resolve_routes(interface_id)
+        for route in routes or ():
+            try:
+                get_adaptor(adaptor_name(route['model_provider'], route['model_config'])).prewarm(
+                    route['model_config'], api_key=route['api_key'])
+                count += 1
+            except Exception as e:
+                log_event("prewarm_failed", logging.WARNING, interface_id=interface_id,
+                          model_provider=route['model_provider'], error=str(e))
+    return count
+
+def prewarm_tokenizers() -> int:
+    """
+    Load the tokenizer of every configured model, so the first requests do
+    not pay for loading a tiktoken encoding.
+    
+    Returns:
+        The number of tokenizers loaded.
+    """
+    models = {None}
+    for interface_id in list(get_config_manager().config_cache):
+        _, routes = resolve_routes(interface_id)
+        models.update(route['model_config'].get('model') for route in routes or ())
+    for model in models:
+        get_tokenizer(model)
+    return len(models)
+
+def prepare_query(context: dict) -> Tuple[Optional[ErrorInfo], Optional[List[Dict[str, Any]]]]:
+    """
+    Resolve and validate everything needed to call a provider for a query.
+    
+    Args:
+        context: A dictionary with 'interface_id' and 'question', and optionally
+                'model_provider' (to pin one provider), 'priority'
+                ('interactive' or 'batch'), 'correlation_id' and 'timeout_ms'.
+    
+    Returns:
+        A tuple (error, routes). On failure error is an ErrorInfo and routes
+        is None; otherwise routes holds one prepared request per
+        candidate backend: the result of resolve_model_config with
+        'question' (fitted to the interface's token budget), 'priority',
+        'correlation_id' and 'timeout_ms' (the request's deadline, see
+        src.deadline) added.
+    """
+    # Require interface_id and question in context
+    interface_id = context.get('interface_id')
+    if not interface_id:
+        return error_info("invalid_request", "Error: 'interface_id' must be provided in context."), None
+    question = context.get('question')
+    if not question:
+        return error_info("invalid_request", "Error: 'question' must be provided in context."), None
+    
+    error, routes = resolve_routes(interface_id, context.get('model_provider'))
+    if error:
+        return error, None
+    # Failover attempts share the request's id in the logs
+    correlation_id = context.get('correlation_id') or new_correlation_id()
+    shared = {
+        # Fitted once here, so retries and failover do not count the message again
+        "question": fit_input({**routes[0], "question": question, "correlation_id": correlation_id}),
+        "priority": context.get('priority', 'interactive'),
+        "correlation_id": correlation_id,
+        "timeout_ms": effective_timeout_ms(routes[0]['interface_config'], context.get('timeout_ms')),
+    }
+    return None, [{**route, **shared} for route in routes]
+
+def _preclassify(interface_id: str, interface_config: Mapping[str, Any],
+                 questions: List[str]) -> List[Optional[Prediction]]:
+    """Run the interface's pre-classifier, if enabled, over a list of questions."""
+    settings = Preclassifier.settings(interface_config)
+    if settings is None or not questions:
+        return [None] * len(questions)
+    predictions = get_preclassifier().classify(interface_id, settings, questions)
+    answered = sum(prediction is not None for prediction in predictions)
+    if answered:
+        PRECLASSIFIED.inc(answered, interface_id, "answered")
+    if answered < len(questions):
+        PRECLASSIFIED.inc(len(questions) - answered, interface_id, "forwarded")
+    return predictions
+
+async def fetch_external_data_async(context: dict) -> AIResponse:
+    """
+    Fetches data from an external AI model API based on user context or input.
+    
+    Inputs the interface's pre-classifier is confident about are answered
+    locally (see src.preclassifier). Other queries are routed across the
+    interface's backends by src.router.Router, failing over to the next
+    backend on timeouts, connection errors and overload responses.
+    
+    Args:
+        context: A dictionary containing configuration and query information.
+                Expected to have:
+                - 'interface_id': The interface to query
+                - 'question': Query to send to the AI
+                - 'model_provider' (optional): Pin a single AI model provider
+                - 'timeout_ms' (optional): Deadline for the whole query
+    
+    Returns:
+        An AIResponse with the answer (typed for interfaces with an `output`
+        section), where it came from, token usage and latency; or with an
+        ErrorInfo if the query failed or its deadline passed, in which case
+        the upstream call was cancelled.
+    """
+    started = time.perf_counter()
+    error, routes = prepare_query(context)
+    if error:
+        return AIResponse(error=error)
+    served = routes[0]
+    
+    def finish(result: AIResponse) -> AIResponse:
+        # Single-flight waiters share one result, so each gets its own copy
+        return result.model_copy(update={"latency_ms": round((time.perf_counter() - started) * 1000, 3)})
+    
+    prediction = _preclassify(served['interface_id'], served['interface_config'], [served['question']])[0]
+    if prediction is not None:
+        log_event("preclassified", correlation_id=served['correlation_id'], interface_id=served['interface_id'],
+                  label=prediction.label, confidence=prediction.confidence, source=prediction.source)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, *model_labels(served), "preclassified")
+        return finish(_answer(served, prediction.label, "preclassifier",
+                              metadata={"confidence": prediction.confidence}))
+    
+    async def attempt(route: Dict[str, Any]) -> AIResponse:
+        nonlocal served
+        served = route
+        return await query_provider_async(route)
+    
+    try:
+        async with Deadline(served['timeout_ms']).guard():
+            response = await get_router().run(routes, attempt, is_retryable)
+    except AllBackendsFailed as e:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, *model_labels(e.prepared), "error")
+        return finish(AIResponse(error=format_provider_error(e.prepared, e.error),
+                                 model_provider=e.prepared['model_provider'],
+                                 model=e.prepared['model_config'].get('model')))
+    except DeadlineExceeded as e:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, *model_labels(served), "timeout")
+        _record_abort(served, started, "timeout")
+        return finish(AIResponse(error=error_info("timeout", str(e)), model_provider=served['model_provider'],
+                                 model=served['model_config'].get('model')))
+    except asyncio.CancelledError:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, *model_labels(served), "cancelled")
+        _record_abort(served, started, "cancelled")
+        raise
+    REQUEST_SECONDS.observe(time.perf_counter() - started, *model_labels(served), "success")
+    return finish(response)
+
+def _answer(prepared: Dict[str, Any], text: str, source: str, usage: Optional[Usage] = None,
+            metadata: Optional[Dict[str, Any]] = None) -> AIResponse:
+    """Build the AIResponse for an answer already in canonical form."""
+    settings = output_settings(prepared['interface_config'])
+    return AIResponse(response_text=text, source=source, model_provider=prepared['model_provider'],
+                      model=prepared['model_config'].get('model'), usage=usage, metadata=metadata,
+                      **(typed_fields(text, settings) if settings is not None else {}))
+
+def _record_abort(prepared: Dict[str, Any], started: float, reason: str) -> None:
+    """Count a query that timed out or whose client went away, apart from errors."""
+    REQUESTS_ABORTED.inc(1, *model_labels(prepared), reason)
+    log_event(f"request_{reason}", logging.WARNING, correlation_id=prepared.get('correlation_id'),
+              interface_id=prepared['interface_id'], model_provider=prepared['model_provider'],
+              timeout_ms=prepared.get('timeout_ms'), seconds=round(time.perf_counter() - started, 4))
+
+def format_provider_error(prepared: Dict[str, Any], error: Exception) -> ErrorInfo:
+    """
+    Turn an exception raised by call_provider_async into the ErrorInfo
+    returned to callers of fetch_external_data_async.
+    
+    Transient failures (timeouts, connection errors, overload) are
+    'unavailable'; client setup failures are 'configuration'; anything else
+    the backend did is 'provider'. The backend's adaptor may word the
+    message (see ModelAdaptor.error_message).
+    """
+    model_provider = prepared['model_provider']
+    model_config = prepared['model_config']
+    kind = "unavailable" if is_retryable(error) else "provider"
+    if isinstance(error, ProviderError):
+        return error_info(kind, str(error))
+    message = get_adaptor(adaptor_name(model_provider, model_config)).error_message(model_config, error)
+    if message is not None:
+        return error_info(kind, message)
+    if isinstance(error, ImportError):
+        return error_info("configuration", f"Error: Could not import {model_provider} client. Please ensure the package is installed.")
+    if isinstance(error, ValueError):
+        return error_info("configuration", f"Error initializing {model_provider} client: {str(error)}")
+    return error_info(kind, f"Error fetching data from {model_provider}: {str(error)}")
+
+async def query_provider_async(prepared: Dict[str, Any]) -> AIResponse:
+    """
+    Answer a prepared query from the response cache, or with the answer to a
+    near-duplicate message from the semantic cache, when the interface opts in;
+    otherwise call the provider and cache the successful response.
+    
+    For interfaces with an `output` section the provider's answer is parsed
+    once, here, and the caches store its canonical value; answers that do not
+    parse are returned as they are and not cached.
+    
+    Concurrent identical queries (same interface, provider, endpoint, model,
+    system prompt, message and retry mode) share one provider call unless the
+    interface sets `single_flight: false` in config.yaml.
+    
+    Args:
+        prepared: The prepared request returned by prepare_query.
+    
+    Returns:
+        An AIResponse with the answer, its source and (from the provider) token usage.
+    
+    Raises:
+        Exception: Errors from call_provider_async; failures are never cached.
+    """
+    settings = ResponseCache.settings(prepared['interface_config'])
+    cache = get_response_cache()
+    if settings is not None:
+        cached = await cache.get(prepared, settings)
+        if cached is not None:
+            return _answer(prepared, cached, "cache")
+    # Packed prompts are mostly shared instructions, so packs of unrelated
+    # messages look alike to the embedder; only exact matches are reused
+    semantic_settings = None if prepared.get('packed') else SemanticCache.settings(prepared['interface_config'])
+    if semantic_settings is not None:
+        started = time.perf_counter()
+        cached, similarity = get_semantic_cache().get(prepared, semantic_settings)
+        SEMANTIC_CACHE_LOOKUP_SECONDS.observe(time.perf_counter() - started, prepared['interface_id'],
+                                              "hit" if cached is not None else "miss")
+        if cached is not None:
+            log_event("semantic_cache_hit", correlation_id=prepared.get('correlation_id'),
+                      interface_id=prepared['interface_id'], similarity=similarity)
+            return _answer(prepared, cached, "semantic_cache", metadata={"similarity": similarity})
+    
+    async def call() -> AIResponse:
+        completion = await call_provider_async(prepared)
+        usage = Usage(prompt_tokens=completion.prompt_tokens, completion_tokens=completion.completion_tokens,
+                      cached_tokens=completion.cached_tokens)
+        response = completion.text
+        # Packed requests answer several items at once; _run_pack parses them
+        output = None if prepared.get('packed') else output_settings(prepared['interface_config'])
+        if output is not None:
+            canonical = parse_output(response, output)
+            OUTPUTS_PARSED.inc(1, prepared['interface_id'], "parsed" if canonical is not None else "unparsed")
+            if canonical is None:
+                log_event("output_unparsed", logging.WARNING, correlation_id=prepared.get('correlation_id'),
+                          interface_id=prepared['interface_id'], response=response)
+                return _answer(prepared, response, "provider", usage)
+            response = canonical
+        if settings is not None:
+            await cache.set(prepared, settings, response)
+        if semantic_settings is not None:
+            get_semantic_cache().set(prepared, semantic_settings, response)
+        return _answer(prepared, response, "provider", usage)
+    
+    if not prepared['interface_config'].get('single_flight', True):
+        return await call()
+    key = cache_key(prepared['interface_id'], prepared['model_provider'],
+                    prepared['model_config'].get('model', ''), prepared['system_prompt'] or '',
+                    prepared['question'])
+    # Unlike cached answers, an in-flight call is tied to its endpoint and retry mode:
+    # a failover attempt must not join (and fail with) a retrying call to another backend
+    key = f"{key}:{prepared['model_config'].get('base_url') or ''}:{prepared.get('allow_retry', True)}"
+    return await get_single_flight().do(key, call)
+
+def _estimated_tokens(prepared: Dict[str, Any]) -> int:
+    return (estimate_tokens(prepared['system_prompt']) + estimate_tokens(prepared['question'])
+            + int(prepared['model_config'].get('max_tokens') or 0))
 
-        except ImportError:
-            return f"Error: Could not import {model_provider} client. Please ensure the package is installed."
-        except ValueError as e:
-            return f"Error initializing {model_provider} client: {str(e)}"
+async def call_provider_async(prepared: Dict[str, Any]) -> Completion:
+    """
+    Send a prepared query to its model provider through the provider's scheduler.
+    
+    The scheduler enforces the provider's concurrency and rate limits, serves
+    interactive requests ahead of batch ones and retries rate-limit, server and
+    connection errors with backoff (see src.scheduler.ProviderScheduler).
+    
+    Args:
+        prepared: The prepared request returned by prepare_query.
+    
+    Returns:
+        The provider's Completion: response text and token usage.
+    
+    Raises:
+        ProviderError: If the provider returns an error status or no content.
+        Exception: Transport and client errors are propagated unchanged.
+    """
+    scheduler = get_scheduler(prepared['model_provider'], prepared['model_config'])
+    router = get_router()
+    
+    async def attempt() -> Completion:
+        # Each upstream attempt feeds the router's latency window and circuit breaker
+        started = time.perf_counter()
+        try:
+            response = await _send_to_provider(prepared)
         except Exception as e:
-            return f"Error fetching data from {model_provider}: {str(e)}"
+            UPSTREAM_ERRORS.inc(1, *model_labels(prepared))
+            router.observe(prepared, time.perf_counter() - started, ok=not is_retryable(e))
+            raise
+        router.observe(prepared, time.perf_counter() - started, ok=True)
+        return response
+    
+    return await scheduler.run(
+        attempt,
+        priority=prepared.get('priority', 'interactive'),
+        tokens=_estimated_tokens(prepared),
+        # The router fails over to another backend instead of retrying this one
+        max_retries=0 if prepared.get('allow_retry') is False else None,
+        correlation_id=prepared.get('correlation_id'),
+    )
+
+async def _send_to_provider(prepared: Dict[str, Any]) -> Completion:
+    model_provider = prepared['model_provider']
+    model_config = prepared['model_config']
+    labels = model_labels(prepared)
+    correlation_id = prepared.get('correlation_id') or new_correlation_id()
+    adaptor = get_adaptor(adaptor_name(model_provider, model_config))
+    
+    # Log request information
+    log_event(
+        "api_request",
+        correlation_id=correlation_id,
+        model_provider=model_provider,
+        interface_id=prepared['interface_id'],
+        model=model_config.get('model'),
+        base_url=model_config.get('base_url'),
+        question=prepared['question'],
+    )
+    
+    orchestrator = get_prompt_orchestrator()
+    messages = orchestrator.messages(prepared)
+    PROMPT_PREFIX_TOKENS.inc(orchestrator.prefix_tokens(prepared), *labels)
+    
+    started = time.perf_counter()
+    completion = await adaptor.complete(model_config, messages, api_key=prepared['api_key'])
+    stages = completion.stages or {"upstream": time.perf_counter() - started}
+    for stage, seconds in stages.items():
+        STAGE_SECONDS.observe(seconds, stage, *labels)
+    record_usage(labels, completion.prompt_tokens, completion.completion_tokens, completion.cached_tokens)
+    if completion.completion_tokens is not None:
+        OUTPUT_TOKENS.observe(completion.completion_tokens, prepared['interface_id'])
+    
+    # Log the response
+    log_event(
+        "api_response",
+        correlation_id=correlation_id,
+        model_provider=model_provider,
+        interface_id=prepared['interface_id'],
+        model=model_config.get('model'),
+        response=completion.text,
+    )
+    return completion
+
+def fetch_external_data_batch(interface_id: str, model_provider: Optional[str], items: Iterable[Any], **kwargs) -> List[Dict[str, Any]]:
+    """
+    Synchronous wrapper around fetch_external_data_batch_async.
+    
+    Returns:
+        List of result dictionaries in input order.
+    """
+    async def collect():
+        return [result async for result in fetch_external_data_batch_async(interface_id, model_provider, items, **kwargs)]
+    return _run_sync(collect())
+
+def _batch_item(index: int, item: Any) -> Dict[str, Any]:
+    """Normalize a batch input (a string or a {'id', 'message'} dict) into an item dict."""
+    if isinstance(item, str):
+        return {"id": index, "message": item}
+    if isinstance(item, dict):
+        if isinstance(item.get("preclassified"), Prediction):
+            return item
+        if "error" in item:
+            return {"id": item.get("id", index), "error": item["error"]}
+        return {"id": item.get("id", index), "message": item.get("message")}
+    return {"id": index, "error": f"Error: Unsupported batch item type: {type(item).__name__}"}
+
+async def _enumerate_items(items: Union[Iterable[Any], AsyncIterable[Any]]) -> AsyncIterator[Tuple[int, Any]]:
+    index = 0
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield index, item
+            index += 1
+    else:
+        for item in items:
+            yield index, item
+            index += 1
+
+async def _preclassified_items(source: AsyncIterator[Tuple[int, Any]], routes: List[Dict[str, Any]],
+                              chunk_size: int) -> AsyncIterator[Tuple[int, Any]]:
+    """Attach pre-classifier answers to batch items, scoring chunk_size items at a time."""
+    chunk: List[Tuple[int, Dict[str, Any]]] = []
+    
+    def scored() -> List[Tuple[int, Dict[str, Any]]]:
+        texts = [(position, item["message"]) for position, (_, item) in enumerate(chunk)
+                 if isinstance(item.get("message"), str)]
+        predictions = _preclassify(routes[0]['interface_id'], routes[0]['interface_config'],
+                                   [text for _, text in texts])
+        for (position, _), prediction in zip(texts, predictions):
+            if prediction is not None:
+                index, item = chunk[position]
+                chunk[position] = (index, {**item, "preclassified": prediction})
+        return chunk
+    
+    async for index, item in source:
+        chunk.append((index, _batch_item(index, item)))
+        if len(chunk) >= chunk_size:
+            for entry in scored():
+                yield entry
+            chunk = []
+    if chunk:
+        for entry in scored():
+            yield entry
+
+def _typed(answer: AIResponse) -> Dict[str, Any]:
+    """The typed label or score of an answer, as extra batch result fields."""
+    return {key: value for key, value in (("label", answer.label), ("score", answer.score)) if value is not None}
+
+async def _run_batch_item(routes: List[Dict[str, Any]], index: int, item: Any,
+                          max_retries: int, retry_backoff: float) -> Dict[str, Any]:
+    item = _batch_item(index, item)
+    result = {"index": index, "id": item["id"]}
+    prediction = item.get("preclassified")
+    if isinstance(prediction, Prediction):
+        typed = _typed(_answer(routes[0], prediction.label, "preclassifier"))
+        return {**result, "response": prediction.label, **typed, "attempts": 0,
+                "preclassified": True, "confidence": prediction.confidence}
+    if "error" in item:
+        return {**result, "error": item["error"], "attempts": 0}
+    if not item["message"]:
+        return {**result, "error": "Error: 'message' must be provided.", "attempts": 0}
+    
+    correlation_id = new_correlation_id()
+    # Packed questions hold many messages, each already fitted by _run_pack
+    question = item["message"] if routes[0].get('packed') else fit_input(
+        {**routes[0], "question": item["message"], "correlation_id": correlation_id})
+    prepared = [{**route, "question": question, "priority": "batch", "correlation_id": correlation_id}
+                for route in routes]
+    started = time.perf_counter()
+    attempt = 0
+    try:
+        # The item's deadline covers its retries as well
+        async with Deadline(routes[0].get('timeout_ms')).guard():
+            while True:
+                attempt += 1
+                try:
+                    answer = await get_router().run(prepared, query_provider_async, is_retryable)
+                    return {**result, "response": answer.response_text, **_typed(answer), "attempts": attempt}
+                except AllBackendsFailed as e:
+                    if attempt > max_retries:
+                        return {**result, "error": format_provider_error(e.prepared, e.error).message,
+                                "attempts": attempt}
+                # Jittered exponential backoff before retrying just this item
+                await asyncio.sleep(min(retry_backoff * 2 ** (attempt - 1), 30) * random.uniform(0.5, 1.5))
+    except DeadlineExceeded as e:
+        _record_abort(prepared[0], started, "timeout")
+        return {**result, "error": str(e), "attempts": attempt}
+
+async def _run_pack(routes: List[Dict[str, Any]], settings: Mapping[str, Any], entries: List[Tuple[int, Dict[str, Any]]],
+                    max_retries: int, retry_backoff: float) -> List[Dict[str, Any]]:
+    """
+    Classify several batch items with one packed request (see src.packing).
+    
+    Items whose label is missing or malformed in the packed response, and items
+    without a message or already answered by the pre-classifier, are run
+    individually through _run_batch_item. If the
+    packed request itself fails, its error is reported for every packed item.
+    
+    Returns:
+        One result per entry, in entry order.
+    """
+    packable: List[Tuple[int, Dict[str, Any]]] = []
+    reissue: List[Tuple[int, Dict[str, Any]]] = []
+    for index, item in entries:
+        (packable if item.get("message") and "preclassified" not in item else reissue).append((index, item))
+    results: Dict[int, Dict[str, Any]] = {}
+    if len(packable) > 1:
+        interface_id = routes[0]['interface_id']
+        question = pack_question([fit_input({**routes[0], "question": item["message"]}) for _, item in packable])
+        # One packed answer covers every item, so the per-answer max_tokens does not apply
+        packed_routes = [{**route, "packed": True,
+                          "model_config": {k: v for k, v in route['model_config'].items() if k != 'max_tokens'}}
+                         for route in routes]
+        packed = await _run_batch_item(packed_routes, packable[0][0],
+                                       {"id": None, "message": question}, max_retries, retry_backoff)
+        if "error" in packed:
+            for index, item in packable:
+                results[index] = {"index": index, "id": item["id"], "error": packed["error"],
+                                  "attempts": packed["attempts"]}
+        else:
+            labels = parse_pack_response(packed["response"], len(packable), settings.get('labels'))
+            for item_id, (index, item) in enumerate(packable, start=1):
+                if item_id in labels:
+                    results[index] = {"index": index, "id": item["id"], "response": labels[item_id],
+                                      **_typed(_answer(routes[0], labels[item_id], "provider")),
+                                      "attempts": packed["attempts"], "packed": True}
+                else:
+                    reissue.append((index, item))
+            PACKED_ITEMS.inc(len(labels), interface_id, "packed")
+            if len(labels) < len(packable):
+                PACKED_ITEMS.inc(len(packable) - len(labels), interface_id, "reissued")
+                log_event("pack_items_reissued", logging.WARNING, interface_id=interface_id,
+                          items=len(packable), reissued=len(packable) - len(labels),
+                          response=packed["response"])
+    else:
+        reissue.extend(packable)
+    for result in await asyncio.gather(*(_run_batch_item(routes, index, item, max_retries, retry_backoff)
+                                         for index, item in reissue)):
+        results[result["index"]] = result
+    return [results[index] for index, _ in entries]
+
+async def fetch_external_data_batch_async(interface_id: str, model_provider: Optional[str],
+                                          items: Union[Iterable[Any], AsyncIterable[Any]],
+                                          concurrency: int = 16, max_retries: int = 2,
+                                          retry_backoff: float = 0.5,
+                                          ordered: bool = True,
+                                          pack: Optional[bool] = None,
+                                          timeout_ms: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run many messages for one interface with bounded concurrency.
+    
+    Items are consumed lazily, so very large (or streamed) inputs are never
+    fully materialized. Each failed item is retried on its own with jittered
+    exponential backoff; other items are unaffected.
+    
+    When packing is enabled for the interface (its `packing` section in
+    config.yaml, or the pack argument), up to `max_items` messages totalling
+    at most `max_tokens` are classified per request; see _run_pack.
+    
+    Args:
+        interface_id: The interface ID
+        model_provider: The name of the model provider, or None to route across
+                        every provider configured for the interface
+        items: Messages as strings or {'id': ..., 'message': ...} dicts (sync or async iterable)
+        concurrency: Maximum number of provider calls in flight
+        max_retries: Retries per item after the first failed attempt
+        retry_backoff: Base delay in seconds for the retry backoff
+        ordered: Yield results in input order; otherwise yield as they complete
+        pack: Enable (True) or disable (False) packing regardless of config.yaml
+        timeout_ms: Deadline for each item, including its retries; the interface's
+                    `timeout_ms` applies when it is shorter
+    
+    Yields:
+        Dicts with 'index', 'id', 'attempts' and either 'response' or 'error'.
+        For interfaces with an `output` section, parsed answers also have a
+        typed 'label' or 'score'.
+        Results taken from a packed response also have 'packed': True, and
+        results answered by the pre-classifier have 'preclassified': True and
+        its 'confidence'.
+    
+    Raises:
+        ConfigurationError: If the interface or provider configuration is invalid.
+    """
+    error, routes = resolve_routes(interface_id, model_provider)
+    if error:
+        raise ConfigurationError(error.message)
+    item_timeout_ms = effective_timeout_ms(routes[0]['interface_config'], timeout_ms)
+    routes = [{**route, "timeout_ms": item_timeout_ms} for route in routes]
+    
+    packing = packing_settings(routes[0]['interface_config'], pack)
+    pack_items = max_items(packing) if packing is not None else 1
+    pack_tokens = max_tokens(packing) if packing is not None else 0
+    
+    source = _enumerate_items(items)
+    if Preclassifier.settings(routes[0]['interface_config']) is not None:
+        # Score items in vectorized chunks before they reach the workers
+        source = _preclassified_items(source, routes, chunk_size=max(concurrency, pack_items))
+    source_lock = asyncio.Lock()
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    # In ordered mode, cap how far workers may run ahead of the oldest pending item
+    window = asyncio.Semaphore(max(concurrency * 4, pack_items * 2)) if ordered else None
+    # An item read but left for the next pack because it would exceed max_tokens
+    carried: List[Tuple[int, Dict[str, Any]]] = []
+    
+    async def take() -> List[Tuple[int, Dict[str, Any]]]:
+        taken: List[Tuple[int, Dict[str, Any]]] = []
+        tokens = 0
+        async with source_lock:
+            while len(taken) < pack_items:
+                if carried:
+                    entry = carried.pop()
+                else:
+                    if window:
+                        # Send a partial pack rather than wait on the consumer while holding items
+                        if taken and window.locked():
+                            break
+                        await window.acquire()
+                    try:
+                        index, item = await source.__anext__()
+                    except StopAsyncIteration:
+                        if window:
+                            window.release()
+                        break
+                    entry = (index, _batch_item(index, item))
+                if packing is not None:
+                    size = count_tokens(entry[1].get("message") or "")
+                    if taken and tokens + size > pack_tokens:
+                        carried.append(entry)
+                        break
+                    tokens += size
+                taken.append(entry)
+        return taken
+    
+    async def worker():
+        while True:
+            entries = await take()
+            if not entries:
+                return
+            if len(entries) == 1:
+                done = [await _run_batch_item(routes, *entries[0], max_retries, retry_backoff)]
+            else:
+                done = await _run_pack(routes, packing, entries, max_retries, retry_backoff)
+            for result in done:
+                await results.put(result)
+    
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    
+    async def finish():
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            await results.put(None)
+    finisher = asyncio.create_task(finish())
+    
+    try:
+        pending: Dict[int, Dict[str, Any]] = {}
+        next_index = 0
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            if not ordered:
+                yield result
+                continue
+            pending[result["index"]] = result
+            while next_index in pending:
+                yield pending.pop(next_index)
+                next_index += 1
+                window.release()
+        # Surface errors raised while reading the input
+        await finisher
+    finally:
+        tasks = workers + [finisher]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await source.aclose()
 
 def call_local_model(model_config: dict, system_prompt: str, question: str) -> str:
+    """
+    Synchronous wrapper around call_local_model_async for existing callers.
+    
+    Args:
+        model_config: Configuration for the local model from config.yaml
+        system_prompt: System prompt to use
+        question: User's question
+        
+    Returns:
+        String containing the response from the local model
+    """
+    return _run_sync(call_local_model_async(model_config, system_prompt, question))
+
+async def call_local_model_async(model_config: dict, system_prompt: str, question: str) -> str:
     """
     Calls a local model service (like Ollama) with the given parameters.
     
@@ -195,66 +895,147 @@ def call_local_model(model_config: dict, system_prompt: str, question: str) -> s
         system_prompt: System prompt to use
         question: User's question
         
+    Returns:
+        String containing the response from the local model, or an error
+        message if the service rejected the request
+    """
+    try:
+        return await ollama_chat(model_config, system_prompt, question)
+    except ProviderError as e:
+        return str(e)
+
+async def ollama_chat(model_config: dict, system_prompt: str, question: str,
+                      correlation_id: Optional[str] = None) -> str:
+    """
+    Calls the Ollama chat API and returns the response content.
+    
+    Args:
+        model_config: Configuration for the local model from config.yaml
+        system_prompt: System prompt to use
+        question: User's question
+        correlation_id: Id of the request in the logs (generated if omitted)
+        
     Returns:
         String containing the response from the local model
+    
+    Raises:
+        ProviderError: If the service returns an error status or an unexpected payload.
     """
     model_type = model_config.get('model_type')
     if model_type != 'ollama':  # Currently only supporting Ollama
-        return f"Error: Unsupported local model type: {model_type}"
+        raise ProviderError(f"Error: Unsupported local model type: {model_type}")
     
-    base_url = model_config.get('base_url', 'http://localhost:11434')
     model_name = model_config.get('model', 'llama3.2')
-    
-    # Generate a correlation ID
-    correlation_id = f"{int(time.time())}_local_{model_name}"
+    correlation_id = correlation_id or new_correlation_id()
     
     # Log the request using structured format
-    log_data = {
-        "correlation_id": correlation_id,
-        "event": "local_model_request",
-        "model_type": model_type,
-        "base_url": base_url,
-        "model": model_name,
-        "question": question
-    }
-    logging.info(json.dumps(log_data))
-    
-    # Ollama API endpoint for chat completions
-    api_url = f"{base_url}/api/chat"
-    
-    # Prepare the payload
-    payload = {
-        "model": model_name,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": question}
-        ],
-        "stream": False  # We want the complete response, not streaming
-    }
+    log_event(
+        "local_model_request",
+        correlation_id=correlation_id,
+        model_type=model_type,
+        base_url=model_config.get('base_url', 'http://localhost:11434'),
+        model=model_name,
+        question=question,
+    )
     
-    # Make the request
-    response = requests.post(api_url, json=payload)
+    messages = assemble_messages(system_prompt, question)
+    completion = await get_adaptor('local_model').complete(model_config, messages)
     
-    # Check if the request was successful
-    if response.status_code == 200:
-        response_data = response.json()
-        
-        # The expected format from Ollama is {"message": {"content": "..."}}
-        if "message" in response_data and "content" in response_data["message"]:
-            response_content = response_data["message"]["content"]
-            
-            # Log the response using structured format
-            log_data = {
-                "correlation_id": correlation_id,
-                "event": "local_model_response",
-                "model_type": model_type,
-                "model": model_name,
-                "response": response_content
-            }
-            logging.info(json.dumps(log_data))
-            
-            return response_content
-        else:
-            return f"Invalid response format from local model: {response_data}"
-    else:
-        return f"Error calling local model (status {response.status_code}): {response.text}"
+    # Log the response using structured format
+    log_event(
+        "local_model_response",
+        correlation_id=correlation_id,
+        model_type=model_type,
+        model=model_name,
+        response=completion.text,
+        cached_tokens=completion.cached_tokens,
+    )
+    return completion.text
+
+async def stream_external_data(prepared: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    Stream response tokens for a query resolved by prepare_query.
+    
+    Tokens are pulled from the provider only as fast as the caller consumes
+    them, so a slow consumer applies backpressure to the upstream connection
+    instead of output piling up in memory. Closing the generator early (e.g.
+    when the client disconnects) or passing the deadline closes the upstream
+    stream.
+    
+    Args:
+        prepared: The prepared request returned by prepare_query.
+    
+    Yields:
+        Text fragments in the order the provider produced them.
+    
+    Raises:
+        ProviderError: If the provider returns an error status or an error chunk.
+        DeadlineExceeded: If the stream did not finish within prepared['timeout_ms'].
+    """
+    started = time.perf_counter()
+    model_provider = prepared['model_provider']
+    model_config = prepared['model_config']
+    labels = model_labels(prepared)
+    correlation_id = prepared.get('correlation_id') or new_correlation_id()
+    
+    log_event(
+        "stream_request",
+        correlation_id=correlation_id,
+        model_provider=model_provider,
+        interface_id=prepared['interface_id'],
+        model=model_config.get('model'),
+        question=prepared['question'],
+    )
+    
+    adaptor = get_adaptor(adaptor_name(model_provider, model_config))
+    orchestrator = get_prompt_orchestrator()
+    messages = orchestrator.messages(prepared)
+    PROMPT_PREFIX_TOKENS.inc(orchestrator.prefix_tokens(prepared), *labels)
+    parts = []
+    # Each wait is guarded separately: a timeout must never span a yield
+    deadline = Deadline(prepared.get('timeout_ms'))
+    try:
+        # Streams hold a provider slot for their whole duration; they are not retried
+        scheduler = get_scheduler(model_provider, model_config)
+        async with AsyncExitStack() as stack:
+            async with deadline.guard():
+                await stack.enter_async_context(
+                    scheduler.slot(prepared.get('priority', 'interactive'), _estimated_tokens(prepared)))
+            chunks = await stack.enter_async_context(
+                aclosing(adaptor.stream(model_config, messages, api_key=prepared['api_key'])))
+            while True:
+                async with deadline.guard():
+                    chunk = await anext(chunks, None)
+                if chunk is None:
+                    break
+                if chunk.prompt_tokens or chunk.completion_tokens:
+                    record_usage(labels, chunk.prompt_tokens, chunk.completion_tokens, chunk.cached_tokens)
+                if chunk.text:
+                    if not parts:
+                        TIME_TO_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, *labels)
+                    parts.append(chunk.text)
+                    yield chunk.text
+    except DeadlineExceeded:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, *labels, "timeout")
+        _record_abort(prepared, started, "timeout")
+        raise
+    except (asyncio.CancelledError, GeneratorExit):
+        REQUEST_SECONDS.observe(time.perf_counter() - started, *labels, "cancelled")
+        _record_abort(prepared, started, "cancelled")
+        raise
+    except Exception as e:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, *labels, "error")
+        # Like non-streamed attempts, stream outcomes feed the router's latency window and circuit breaker
+        get_router().observe(prepared, time.perf_counter() - started, ok=not is_retryable(e))
+        raise
+    REQUEST_SECONDS.observe(time.perf_counter() - started, *labels, "success")
+    get_router().observe(prepared, time.perf_counter() - started, ok=True)
+    
+    log_event(
+        "stream_response",
+        correlation_id=correlation_id,
+        model_provider=model_provider,
+        interface_id=prepared['interface_id'],
+        model=model_config.get('model'),
+        response="".join(parts),
+    )
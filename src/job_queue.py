@@ -0,0 +1,375 @@
+"""
+Durable queue for queries that are submitted now and collected later.
+
+POST /v1/jobs stores a query in a local SQLite file (WAL mode) and returns a
+job id at once. A pool of workers in the server process drains the queue
+through fetch_external_data_async, at batch priority, and stores each
+AIResponse for GET /v1/jobs/{job_id}.
+
+Delivery is at-least-once. A claimed job is hidden from other workers for the
+visibility timeout, which its worker keeps extending while the query runs. If
+the process dies, the job becomes visible again and another worker runs it,
+in this process or in another one sharing the file. Resubmitting with the
+same idempotency key returns the original job instead of queueing a new one.
+
+    MOBAI_QUEUE_PATH                SQLite file (default data/job_queue.sqlite3)
+    MOBAI_QUEUE_WORKERS             workers per server process (default 4; 0 disables them)
+    MOBAI_QUEUE_VISIBILITY_TIMEOUT  seconds a claimed job stays hidden (default 60)
+    MOBAI_QUEUE_MAX_ATTEMPTS        deliveries before a job fails (default 3)
+    MOBAI_QUEUE_RETENTION_SECONDS   how long finished jobs are kept (default 7 days)
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from .external_integration import fetch_external_data_async
+from .log_config import log_event
+from .metrics import QUEUE_BACKLOG, QUEUE_JOBS, QUEUE_WAIT_SECONDS
+from .schemas import AIResponse, error_info
+
+DEFAULT_QUEUE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "job_queue.sqlite3")
+
+# Error kinds worth another delivery: the backends may be back by then
+RETRYABLE_KINDS = ("unavailable",)
+
+# Context fields that identify a request, for idempotency key checks
+_REQUEST_FIELDS = ("interface_id", "model_provider", "question")
+
+def queue_path() -> str:
+    return os.environ.get('MOBAI_QUEUE_PATH') or DEFAULT_QUEUE_PATH
+
+class JobQueue:
+    """
+    Query jobs kept in a SQLite file and claimed atomically across processes.
+
+    A job is 'queued', 'running', 'succeeded' or 'failed'. Each claim counts
+    as an attempt; its attempt number is the lease that complete(), release()
+    and extend() must present, so a worker whose lease expired cannot
+    overwrite the result of a later delivery.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or queue_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS queued_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    idempotency_key TEXT UNIQUE,
+                    interface_id TEXT NOT NULL,
+                    context TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    visible_at REAL NOT NULL,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS queued_jobs_visible ON queued_jobs (status, visible_at);
+            """)
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._conn)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def submit(self, context: Dict[str, Any], idempotency_key: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a query context (as built for fetch_external_data_async).
+
+        Returns:
+            A tuple (job, created): the job record, and False when the
+            idempotency key matched an existing job, which is returned instead.
+
+        Raises:
+            ValueError: If the idempotency key was used for a different request.
+        """
+        job_id = uuid.uuid4().hex
+        # Logs for every delivery of the job share its id
+        context = {**context, "priority": "batch", "correlation_id": job_id}
+
+        def insert(conn):
+            if idempotency_key is not None:
+                existing = conn.execute("SELECT * FROM queued_jobs WHERE idempotency_key = ?",
+                                        (idempotency_key,)).fetchone()
+                if existing is not None:
+                    stored = json.loads(existing["context"])
+                    if any(stored.get(field) != context.get(field) for field in _REQUEST_FIELDS):
+                        raise ValueError(f"Idempotency key '{idempotency_key}' was used for a different request.")
+                    return existing, False
+            now = time.time()
+            conn.execute(
+                "INSERT INTO queued_jobs VALUES (?, ?, ?, ?, 'queued', 0, ?, NULL, ?, ?)",
+                (job_id, idempotency_key, context['interface_id'], json.dumps(context), now, now, now))
+            return conn.execute("SELECT * FROM queued_jobs WHERE job_id = ?", (job_id,)).fetchone(), True
+
+        row, created = self._transaction(insert)
+        QUEUE_JOBS.inc(1, row["interface_id"], "submitted" if created else "deduplicated")
+        return self._record(row), created
+
+    def claim(self, visibility_timeout: float, max_attempts: int) -> Optional[Dict[str, Any]]:
+        """
+        Claim the oldest visible job: a queued one, or a running one whose
+        lease expired. A job that has used up max_attempts fails instead.
+
+        Returns:
+            The job record with its 'context', or None if nothing is visible.
+        """
+        # Idle workers poll often; only take the write lock when there is work
+        with self._lock:
+            visible = self._conn.execute(
+                "SELECT 1 FROM queued_jobs WHERE status IN ('queued', 'running') AND visible_at <= ? LIMIT 1",
+                (time.time(),)).fetchone()
+        if visible is None:
+            return None
+        events = []
+
+        def take(conn):
+            while True:
+                now = time.time()
+                row = conn.execute(
+                    "SELECT * FROM queued_jobs WHERE status IN ('queued', 'running') AND visible_at <= ? "
+                    "ORDER BY visible_at LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    return None
+                if row["attempts"] >= max_attempts:
+                    result = AIResponse(error=error_info(
+                        "unavailable", f"Error: Job was not completed after {row['attempts']} attempts."))
+                    conn.execute("UPDATE queued_jobs SET status = 'failed', result = ?, updated_at = ? WHERE job_id = ?",
+                                 (result.model_dump_json(exclude_none=True), now, row["job_id"]))
+                    events.append((row["interface_id"], "failed"))
+                    continue
+                if row["status"] == "running":
+                    # Its worker went away without completing or releasing it
+                    events.append((row["interface_id"], "redelivered"))
+                conn.execute(
+                    "UPDATE queued_jobs SET status = 'running', attempts = attempts + 1, visible_at = ?, updated_at = ? "
+                    "WHERE job_id = ?", (now + visibility_timeout, now, row["job_id"]))
+                return conn.execute("SELECT * FROM queued_jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+
+        row = self._transaction(take)
+        for labels in events:
+            QUEUE_JOBS.inc(1, *labels)
+        if row is None:
+            return None
+        if row["attempts"] == 1:
+            QUEUE_WAIT_SECONDS.observe(row["updated_at"] - row["created_at"], row["interface_id"])
+        return {**self._record(row), "context": json.loads(row["context"])}
+
+    def _update(self, sql: str, params: Tuple[Any, ...]) -> bool:
+        updated = self._transaction(lambda conn: conn.execute(sql, params).rowcount)
+        return updated == 1
+
+    def extend(self, job_id: str, attempt: int, visibility_timeout: float) -> bool:
+        """Keep a running job hidden for another visibility_timeout. Returns False if the lease was lost."""
+        return self._update(
+            "UPDATE queued_jobs SET visible_at = ? WHERE job_id = ? AND status = 'running' AND attempts = ?",
+            (time.time() + visibility_timeout, job_id, attempt))
+
+    def complete(self, job_id: str, attempt: int, result: AIResponse) -> bool:
+        """Store a job's final result. Returns False if the lease was lost to a later delivery."""
+        completed = self._update(
+            "UPDATE queued_jobs SET status = ?, result = ?, updated_at = ? "
+            "WHERE job_id = ? AND status = 'running' AND attempts = ?",
+            ("succeeded" if result.ok else "failed", result.model_dump_json(exclude_none=True), time.time(),
+             job_id, attempt))
+        return completed
+
+    def release(self, job_id: str, attempt: int, delay: float = 0.0) -> bool:
+        """Put a running job back in the queue, visible again after `delay` seconds."""
+        now = time.time()
+        return self._update(
+            "UPDATE queued_jobs SET status = 'queued', visible_at = ?, updated_at = ? "
+            "WHERE job_id = ? AND status = 'running' AND attempts = ?",
+            (now + delay, now, job_id, attempt))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job record, with its AIResponse as 'result' once finished, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM queued_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._record(row) if row is not None else None
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs last updated more than `older_than` seconds ago."""
+        return self._transaction(lambda conn: conn.execute(
+            "DELETE FROM queued_jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+            (time.time() - older_than,)).rowcount)
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM queued_jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def refresh_backlog(self) -> None:
+        """Set the mobai_queue_backlog gauge from the jobs now queued and running."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM queued_jobs WHERE status IN ('queued', 'running') GROUP BY status"
+            ).fetchall()
+        counts = dict(rows)
+        for status in ("queued", "running"):
+            QUEUE_BACKLOG.set(counts.get(status, 0), status)
+
+    @staticmethod
+    def _record(row: sqlite3.Row) -> Dict[str, Any]:
+        record = {key: row[key] for key in ("job_id", "interface_id", "status", "attempts", "created_at", "updated_at")}
+        if row["result"] is not None:
+            record["result"] = AIResponse.model_validate_json(row["result"])
+        return record
+
+    def close(self) -> None:
+        self._conn.close()
+
+class QueueWorkers:
+    """
+    Workers that drain a JobQueue in the current event loop.
+
+    Each worker claims one job at a time. Idle workers sleep until notify()
+    (a submit in this process) or poll_interval (a submit in another one).
+    Jobs that fail with a retryable error are released with exponential
+    backoff until max_attempts; on stop() running jobs are released at once.
+    The backlog gauge is refreshed every backlog_interval seconds.
+    """
+
+    def __init__(self, queue: JobQueue, workers: int = 4, visibility_timeout: float = 60.0,
+                 max_attempts: int = 3, retention_seconds: float = 7 * 86400.0, poll_interval: float = 0.5,
+                 retry_delay: float = 1.0, backlog_interval: float = 5.0):
+        self.queue = queue
+        self.workers = workers
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.backlog_interval = backlog_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._purged_at = 0.0
+
+    @classmethod
+    def from_env(cls, queue: JobQueue) -> "QueueWorkers":
+        return cls(
+            queue,
+            workers=int(os.environ.get('MOBAI_QUEUE_WORKERS', '4')),
+            visibility_timeout=float(os.environ.get('MOBAI_QUEUE_VISIBILITY_TIMEOUT', '60')),
+            max_attempts=int(os.environ.get('MOBAI_QUEUE_MAX_ATTEMPTS', '3')),
+            retention_seconds=float(os.environ.get('MOBAI_QUEUE_RETENTION_SECONDS', str(7 * 86400))),
+        )
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        """Start the workers in the running event loop."""
+        if self._tasks or self.workers <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._refresh_backlog()))
+        log_event("queue_workers_started", workers=self.workers, path=self.queue.path)
+
+    def notify(self) -> None:
+        """Wake an idle worker after a submit in this process."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        """Stop the workers, returning the jobs they were running to the queue."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _work(self) -> None:
+        while True:
+            job = await asyncio.to_thread(self.queue.claim, self.visibility_timeout, self.max_attempts)
+            if job is not None:
+                await self._run(job)
+                continue
+            if time.time() - self._purged_at > 60.0:
+                self._purged_at = time.time()
+                await asyncio.to_thread(self.queue.purge, self.retention_seconds)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except TimeoutError:
+                pass
+
+    async def _refresh_backlog(self) -> None:
+        while True:
+            await asyncio.to_thread(self.queue.refresh_backlog)
+            await asyncio.sleep(self.backlog_interval)
+
+    async def _heartbeat(self, job: Dict[str, Any]) -> None:
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            await asyncio.to_thread(self.queue.extend, job["job_id"], job["attempts"], self.visibility_timeout)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        job_id, attempt, interface_id = job["job_id"], job["attempts"], job["interface_id"]
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            result = await fetch_external_data_async(job["context"])
+        except asyncio.CancelledError:
+            # Shutting down: let the next worker pick it up straight away
+            await asyncio.shield(asyncio.to_thread(self.queue.release, job_id, attempt))
+            raise
+        except Exception as e:
+            result = AIResponse(error=error_info("unavailable", f"Error: {str(e)}"))
+        finally:
+            heartbeat.cancel()
+        if result.error is not None and result.error.kind in RETRYABLE_KINDS and attempt < self.max_attempts:
+            delay = min(60.0, self.retry_delay * 2 ** (attempt - 1))
+            await asyncio.to_thread(self.queue.release, job_id, attempt, delay)
+            QUEUE_JOBS.inc(1, interface_id, "retried")
+            log_event("queue_job_retried", logging.WARNING, correlation_id=job_id, interface_id=interface_id,
+                      attempt=attempt, delay=delay, error=result.error.message)
+            return
+        if await asyncio.to_thread(self.queue.complete, job_id, attempt, result):
+            QUEUE_JOBS.inc(1, interface_id, "succeeded" if result.ok else "failed")
+        else:
+            log_event("queue_lease_lost", logging.WARNING, correlation_id=job_id, interface_id=interface_id,
+                      attempt=attempt)
+
+_shared_queue: Optional[JobQueue] = None
+_shared_workers: Optional[QueueWorkers] = None
+_queue_lock = threading.Lock()
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide JobQueue at MOBAI_QUEUE_PATH, opening it on first use."""
+    global _shared_queue
+    path = queue_path()
+    if _shared_queue is None or _shared_queue.path != path:
+        with _queue_lock:
+            if _shared_queue is None or _shared_queue.path != path:
+                _shared_queue = JobQueue(path)
+    return _shared_queue
+
+def get_queue_workers() -> QueueWorkers:
+    """Return the process-wide QueueWorkers, configured from the environment."""
+    global _shared_workers
+    if _shared_workers is None:
+        queue = get_job_queue()
+        with _queue_lock:
+            if _shared_workers is None:
+                _shared_workers = QueueWorkers.from_env(queue)
+    return _shared_workers
@@ -0,0 +1,31 @@
+"""
+Deferred imports for heavy dependencies that only some interfaces use.
+"""
+import importlib.util
+import sys
+from types import ModuleType
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Return module `name`, postponing its actual import until an attribute is first used.
+
+    Args:
+        name: Absolute module name, e.g. 'numpy'
+
+    Returns:
+        The module; already-imported modules are returned as they are.
+
+    Raises:
+        ModuleNotFoundError: If the module is not installed (checked eagerly).
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
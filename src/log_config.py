@@ -1,13 +1,255 @@
+import atexit
+import json
 import logging
 import os
+import queue
+import random
+import threading
+import time
+import uuid
+import zlib
+from logging.handlers import QueueHandler
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # optional fast encoder
+    orjson = None
 
 # Set up logs directory and log file path
 LOG_DIR = os.path.join(os.path.dirname(__file__), "..", "logs")
-os.makedirs(LOG_DIR, exist_ok=True)
 LOG_FILE = os.path.join(LOG_DIR, "external_integration.log")
+LOG_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+
+# Fields that carry prompts or model output and may be truncated or sampled out
+PAYLOAD_FIELDS = ("question", "response", "system_prompt", "messages")
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False, default=str)
+
+def dumps(data: Any) -> str:
+    """Encode a log payload as JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, default=str).decode()
+    return _json_encoder.encode(data)
+
+def new_correlation_id() -> str:
+    """Return a unique id that ties a request's log events together."""
+    return uuid.uuid4().hex
+
+def limit_payload(data: Dict[str, Any], max_chars: int, sample_rate: float) -> Dict[str, Any]:
+    """
+    Truncate or drop large prompt/response fields of a log event in place.
+
+    Payloads are kept for a `sample_rate` fraction of correlation ids (so a
+    request and its response are sampled together) and cut to `max_chars`
+    characters; dropped or cut fields record their full length in
+    '<field>_chars'.
+    """
+    if sample_rate >= 1.0:
+        keep = True
+    elif data.get("correlation_id") is not None:
+        # Any id works, including ones supplied by callers
+        keep = zlib.crc32(str(data["correlation_id"]).encode()) / 0xFFFFFFFF < sample_rate
+    else:
+        keep = random.random() < sample_rate
+    for field in PAYLOAD_FIELDS:
+        value = data.get(field)
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            value = dumps(value)
+        if not keep:
+            data[field] = None
+            data[f"{field}_chars"] = len(value)
+        elif max_chars and len(value) > max_chars:
+            data[field] = value[:max_chars]
+            data[f"{field}_chars"] = len(value)
+    return data
+
+class LogWriter(threading.Thread):
+    """
+    Background thread that drains queued log records into a file.
+
+    Records are formatted (and dict messages JSON-encoded) on this thread and
+    written in batches, so request handlers only pay for an enqueue. The file
+    is rotated when it grows past `max_bytes` or is older than
+    `rotate_seconds`, keeping `backup_count` old files (file.1, file.2, ...).
+    """
+
+    def __init__(self, records: "queue.Queue[Optional[logging.LogRecord]]", path: str,
+                 max_bytes: int = 0, backup_count: int = 5, rotate_seconds: float = 0,
+                 batch_size: int = 512, flush_interval: float = 0.5):
+        super().__init__(name="mobai-log-writer", daemon=True)
+        self.records = records
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_seconds = rotate_seconds
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.formatter = logging.Formatter(LOG_FORMAT)
+        self._stream = None
+        self._opened_at = 0.0
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._stream = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.time()
+
+    def _rotate(self) -> None:
+        self._stream.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{i}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def _should_rotate(self) -> bool:
+        if self.max_bytes and self._stream.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self._opened_at >= self.rotate_seconds
+
+    def format(self, record: logging.LogRecord) -> str:
+        if isinstance(record.msg, dict):
+            record.msg = dumps(record.msg)
+            record.args = None
+        return self.formatter.format(record) + "\n"
+
+    def _write(self, batch: List[logging.LogRecord]) -> None:
+        if self._stream is None:
+            # Opened on the first record so importing the app touches no files
+            self._open()
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                lines.append(f"{time.strftime('%Y-%m-%d %H:%M:%S')} ERROR unformattable log record: {record.msg!r}\n")
+        self._stream.write("".join(lines))
+        self._stream.flush()
+        if self._should_rotate():
+            self._rotate()
+
+    def run(self) -> None:
+        try:
+            while True:
+                try:
+                    record = self.records.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                stop = record is None
+                batch = [] if stop else [record]
+                while not stop and len(batch) < self.batch_size:
+                    try:
+                        record = self.records.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is None:
+                        stop = True
+                    else:
+                        batch.append(record)
+                if batch:
+                    self._write(batch)
+                if stop:
+                    return
+        finally:
+            if self._stream is not None:
+                self._stream.close()
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to a LogWriter without formatting them on the caller's thread.
+
+    When the queue is full the record is dropped and counted rather than
+    blocking the request.
+    """
+
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # Tracebacks must be rendered while the frames are still alive
+            return super().prepare(record)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_handler: Optional[NonBlockingQueueHandler] = None
+_writer: Optional[LogWriter] = None
+_max_field_chars = 2000
+_payload_sample_rate = 1.0
+
+def configure_logging() -> None:
+    """
+    Route the root logger through a queue to a background LogWriter.
+
+    Settings are read from the environment:
+        MOBAI_LOG_FILE                 (default logs/external_integration.log)
+        MOBAI_LOG_LEVEL                (default INFO)
+        MOBAI_LOG_MAX_BYTES            rotate above this size (default 52428800, 0 = never)
+        MOBAI_LOG_ROTATE_SECONDS       rotate after this age (default 0 = never)
+        MOBAI_LOG_BACKUP_COUNT         rotated files to keep (default 5)
+        MOBAI_LOG_QUEUE_SIZE           records buffered before dropping (default 10000)
+        MOBAI_LOG_MAX_FIELD_CHARS      truncate prompts/responses (default 2000, 0 = never)
+        MOBAI_LOG_PAYLOAD_SAMPLE_RATE  fraction of requests whose payloads are logged (default 1.0)
+    """
+    global _handler, _writer, _max_field_chars, _payload_sample_rate
+    if _handler is not None:
+        return
+    _max_field_chars = int(os.environ.get('MOBAI_LOG_MAX_FIELD_CHARS', 2000))
+    _payload_sample_rate = float(os.environ.get('MOBAI_LOG_PAYLOAD_SAMPLE_RATE', 1.0))
+    records: queue.Queue = queue.Queue(maxsize=int(os.environ.get('MOBAI_LOG_QUEUE_SIZE', 10000)))
+    _writer = LogWriter(
+        records,
+        os.environ.get('MOBAI_LOG_FILE', LOG_FILE),
+        max_bytes=int(os.environ.get('MOBAI_LOG_MAX_BYTES', 50 * 1024 * 1024)),
+        backup_count=int(os.environ.get('MOBAI_LOG_BACKUP_COUNT', 5)),
+        rotate_seconds=float(os.environ.get('MOBAI_LOG_ROTATE_SECONDS', 0)),
+    )
+    _writer.start()
+    _handler = NonBlockingQueueHandler(records)
+    root = logging.getLogger()
+    root.setLevel(os.environ.get('MOBAI_LOG_LEVEL', 'INFO').upper())
+    root.addHandler(_handler)
+    atexit.register(shutdown_logging)
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _handler, _writer
+    if _handler is None:
+        return
+    logging.getLogger().removeHandler(_handler)
+    _handler.queue.put(None)
+    _writer.join(timeout=5)
+    _handler = _writer = None
+
+def log_event(event: str, level: int = logging.INFO, **fields: Any) -> None:
+    """
+    Log a structured event; encoding happens on the writer thread.
+
+    Prompt and response fields are truncated or sampled out according to
+    MOBAI_LOG_MAX_FIELD_CHARS and MOBAI_LOG_PAYLOAD_SAMPLE_RATE.
+    """
+    logger = logging.getLogger()
+    if not logger.isEnabledFor(level):
+        return
+    data = limit_payload({"event": event, **fields}, _max_field_chars, _payload_sample_rate)
+    logger.log(level, data)
+
+def log_stats() -> Dict[str, int]:
+    """Return the number of queued and dropped log records."""
+    if _handler is None:
+        return {"queued": 0, "dropped": 0}
+    return {"queued": _handler.queue.qsize(), "dropped": _handler.dropped}
 
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s %(message)s"
-)
+configure_logging()
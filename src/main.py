@@ -1,45 +1,337 @@
-from fastapi import FastAPI, HTTPException
+# Imported first so the startup time it reports covers the other imports
+from src.startup import get_warmup
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Awaitable, Iterator, Optional
+
+from src.client_pool import get_client_pool
+from src.external_integration import (
+    fetch_external_data_async,
+    fetch_external_data_batch_async,
+    format_provider_error,
+    prepare_query,
+    resolve_routes,
+    stream_external_data,
+)
+from src.config_manager import get_config_manager
+from src.deadline import DeadlineExceeded
+from src.job_queue import get_job_queue, get_queue_workers
+from src import metrics
+from src.model_adaptor import adaptor_name, get_adaptor
+from src.preclassifier import get_preclassifier
+from src.prompt_orchestrator import get_prompt_orchestrator
+from src.response_cache import get_response_cache
+from src.semantic_cache import get_semantic_cache
+from src.router import backend_name, get_router
+from src.scheduler import scheduler_stats
+from src.schemas import AIResponse
+from src.single_flight import get_single_flight
 
-from src.external_integration import fetch_external_data
-from src.config_manager import ConfigManager
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Parse every interface config and prewarm the adaptors and clients they use
+    # before accepting traffic, then watch for changes
+    warmup = get_warmup()
+    warmup.start()
+    config_manager = get_config_manager()
+    config_manager.start_watching()
+    # Drain /v1/jobs in the background; jobs left running are released on shutdown
+    queue_workers = get_queue_workers()
+    queue_workers.start()
+    yield
+    await queue_workers.stop()
+    await warmup.stop()
+    config_manager.stop_watching()
+    await asyncio.to_thread(get_semantic_cache().save)
+    await get_client_pool().aclose()
 
-app = FastAPI(title="AI Platform")
+app = FastAPI(title="AI Platform", lifespan=lifespan)
 
 class QueryRequest(BaseModel):
     message: str
     interface_id: str
     model_provider: Optional[str] = None  # Optional field for explicit model selection
+    timeout_ms: Optional[int] = None  # Deadline; the interface's timeout_ms applies when shorter
 
-@app.post("/v1/query")
-async def handle_query(request: QueryRequest):
+class JobRequest(QueryRequest):
+    idempotency_key: Optional[str] = None  # Or the Idempotency-Key header
+
+def build_context(request: QueryRequest) -> dict:
+    """
+    Validate a QueryRequest and build the context for external integration.
+    
+    Raises:
+        HTTPException: If the request or interface configuration is invalid.
+    """
     if not request.interface_id or not request.message:
         raise HTTPException(status_code=400, detail="Both 'interface_id' and 'message' must be provided.")
+    if request.timeout_ms is not None and request.timeout_ms <= 0:
+        raise HTTPException(status_code=400, detail="'timeout_ms' must be positive.")
     
-    # Get interface configuration
-    config_manager = ConfigManager()
-    try:
-        interface_config = config_manager.get_configuration(request.interface_id)
-    except KeyError:
-        raise HTTPException(status_code=400, detail=f"No configuration found for interface: {request.interface_id}")
-    
-    # If model_provider is not specified, use the first available provider from config
-    model_provider = request.model_provider
-    if not model_provider:
-        available_providers = list(interface_config.get('model_providers', {}).keys())
-        if not available_providers:
-            raise HTTPException(status_code=400, detail=f"No model providers configured for interface: {request.interface_id}")
-        model_provider = available_providers[0]
-    
-    # Prepare context for external integration
-    context = {
+    return {
         "interface_id": request.interface_id,
-        "model_provider": model_provider,
-        "question": request.message
+        # None lets the router choose among the interface's providers
+        "model_provider": request.model_provider,
+        "question": request.message,
+        "timeout_ms": request.timeout_ms,
     }
+
+async def _disconnected(http_request: Request) -> None:
+    # The body has been read, so the next message is the disconnect
+    while (await http_request.receive())["type"] != "http.disconnect":
+        pass
+
+async def _unless_disconnected(http_request: Request, work: Awaitable[Any]) -> Any:
+    """
+    Await `work`, cancelling it (and its upstream call) if the client disconnects first.
+
+    Returns:
+        The result of `work`, or None if the client went away.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_disconnected(http_request))
+    try:
+        await asyncio.wait((task, watcher), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    return None if task.cancelled() else task.result()
+
+@app.post("/v1/query")
+async def handle_query(request: QueryRequest, http_request: Request):
+    """
+    Answer one message.
+    
+    The body has 'response' plus, when known, the typed 'label' or 'score',
+    'source', 'model_provider', 'model', 'usage' and 'latency_ms'. Failures
+    answer the status of their ErrorInfo kind (see src.schemas.ERROR_STATUS).
+    """
+    context = build_context(request)
+    result = await _unless_disconnected(http_request, fetch_external_data_async(context))
+    if result is None:
+        # Nobody is left to read it (499 as in nginx's "client closed request")
+        return Response(status_code=499)
+    if result.error:
+        raise HTTPException(status_code=result.error.status_code, detail=result.error.message)
+    return _response_body(result)
+
+def _response_body(result: AIResponse) -> dict:
+    return {"response": result.response_text,
+            **result.model_dump(exclude={"response_text", "error"}, exclude_none=True)}
+
+def _job_body(job: dict) -> dict:
+    """A queued job as returned by /v1/jobs, with its response or error once finished."""
+    body = {key: value for key, value in job.items() if key != "result"}
+    result = job.get("result")
+    if result is not None:
+        if result.error:
+            body["error"] = {"detail": result.error.message, "kind": result.error.kind,
+                             "status_code": result.error.status_code}
+        else:
+            body["result"] = _response_body(result)
+    return body
+
+@app.post("/v1/jobs", status_code=202)
+async def submit_job(request: JobRequest, response: Response,
+                     idempotency_key: Optional[str] = Header(None)):
+    """
+    Queue one message and return its job at once; poll GET /v1/jobs/{job_id} for the result.
+    
+    Resubmitting with the same idempotency key (body field or Idempotency-Key
+    header) returns the original job with 200 instead of queueing it again.
+    The job's `timeout_ms` starts when a worker picks it up.
+    """
+    context = build_context(request)
+    error, _ = resolve_routes(request.interface_id, request.model_provider)
+    if error:
+        raise HTTPException(status_code=error.status_code, detail=error.message)
+    try:
+        job, created = await asyncio.to_thread(
+            get_job_queue().submit, context, idempotency_key or request.idempotency_key)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if created:
+        get_queue_workers().notify()
+    else:
+        response.status_code = 200
+    return _job_body(job)
+
+@app.get("/v1/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    A job's status ('queued', 'running', 'succeeded' or 'failed') and
+    attempts, with 'result' (the /v1/query body) or 'error' once finished.
+    """
+    job = await asyncio.to_thread(get_job_queue().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No job found: {job_id}")
+    return _job_body(job)
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/v1/query/stream")
+async def handle_query_stream(request: QueryRequest):
+    """
+    Relay response tokens as Server-Sent Events.
+    
+    Each token is sent as a 'data: {"token": ...}' event, followed by a final
+    'done' event, or an 'error' event if the provider fails mid-stream or the
+    deadline passes. Streams go to the router's preferred backend and do not
+    fail over, though their outcome still feeds its circuit breaker; a client
+    disconnect closes the upstream stream.
+    """
+    context = build_context(request)
+    error, routes = prepare_query(context)
+    if error:
+        raise HTTPException(status_code=error.status_code, detail=error.message)
+    prepared = get_router().order(routes)[0]
+    
+    async def events():
+        try:
+            async for token in stream_external_data(prepared):
+                yield _sse({"token": token})
+        except DeadlineExceeded as e:
+            yield _sse({"detail": str(e), "kind": "timeout"}, event="error")
+            return
+        except Exception as e:
+            error = format_provider_error(prepared, e)
+            yield _sse({"detail": error.message, "kind": error.kind}, event="error")
+            return
+        yield _sse({}, event="done")
     
-    result = fetch_external_data(context)
-    if result.startswith("Error:"):
-        raise HTTPException(status_code=400, detail=result)
-    return {"response": result}
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _ndjson_items(body: bytes) -> Iterator[Any]:
+    """Parse an NDJSON body lazily, one line at a time."""
+    for line_number, line in enumerate(body.split(b"\n"), start=1):
+        if line.strip():
+            yield _parse_ndjson_line(line, line_number)
+
+def _parse_ndjson_line(line: bytes, line_number: int) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return {"error": f"Error: Invalid JSON on line {line_number}: {e}"}
+
+@app.post("/v1/batch")
+async def handle_batch(
+    request: Request,
+    interface_id: str,
+    model_provider: Optional[str] = None,
+    concurrency: int = Query(16, ge=1, le=256),
+    max_retries: int = Query(2, ge=0, le=10),
+    ordered: bool = True,
+    pack: Optional[bool] = None,
+    timeout_ms: Optional[int] = Query(None, ge=1),
+):
+    """
+    Run many messages for one interface and stream results back as NDJSON.
+    
+    The body is either a JSON array or NDJSON (Content-Type: application/x-ndjson),
+    where each entry is a message string or {"id": ..., "message": ...}. Each result
+    line carries the item's 'index' and 'id' plus either 'response' (and the typed
+    'label' or 'score' where the interface declares an `output`) or 'error'.
+    `timeout_ms` is a deadline per item, including its retries.
+    """
+    error, _ = resolve_routes(interface_id, model_provider)
+    if error:
+        raise HTTPException(status_code=error.status_code, detail=error.message)
+    
+    # The body is read up front: StreamingResponse listens for client disconnects
+    # on the same receive channel, so it cannot be consumed while responding.
+    if "ndjson" in request.headers.get("content-type", ""):
+        items = _ndjson_items(await request.body())
+    else:
+        try:
+            items = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON.")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON.")
+    
+    async def results():
+        async for result in fetch_external_data_batch_async(
+            interface_id, model_provider, items,
+            concurrency=concurrency, max_retries=max_retries, ordered=ordered, pack=pack,
+            timeout_ms=timeout_ms,
+        ):
+            yield json.dumps(result) + "\n"
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/ready")
+async def readiness():
+    """200 once warmup has finished, 503 before then and while shutting down."""
+    warmup = get_warmup()
+    return JSONResponse(warmup.snapshot(), status_code=200 if warmup.ready else 503)
+
+@app.get("/v1/interfaces")
+async def list_interfaces():
+    config_manager = get_config_manager()
+    return {
+        "reload_count": config_manager.reload_count,
+        "interfaces": config_manager.load_times(),
+        "errors": dict(config_manager.load_errors),
+    }
+
+@app.get("/v1/pool/stats")
+async def pool_stats():
+    return get_client_pool().stats()
+
+@app.get("/v1/cache/stats")
+async def cache_stats():
+    return {**get_response_cache().snapshot(), "single_flight": get_single_flight().stats(),
+            "semantic": get_semantic_cache().snapshot()}
+
+@app.get("/v1/scheduler/stats")
+async def scheduler_queue_stats():
+    return scheduler_stats()
+
+@app.get("/v1/interfaces/{interface_id}/health")
+async def interface_health(interface_id: str):
+    """Probe every backend that can serve the interface."""
+    error, routes = resolve_routes(interface_id)
+    if error:
+        raise HTTPException(status_code=error.status_code, detail=error.message)
+    
+    async def probe(route):
+        adaptor = get_adaptor(adaptor_name(route['model_provider'], route['model_config']))
+        return await adaptor.health(route['model_config'], api_key=route['api_key'])
+    
+    results = await asyncio.gather(*(probe(route) for route in routes))
+    return {backend_name(route): result for route, result in zip(routes, results)}
+
+@app.get("/v1/queue/stats")
+async def queue_stats():
+    workers = get_queue_workers()
+    return {"workers": workers.workers if workers.running else 0,
+            "jobs": await asyncio.to_thread(get_job_queue().counts)}
+
+@app.get("/v1/router/stats")
+async def router_stats():
+    return get_router().stats()
+
+@app.get("/v1/prompts/stats")
+async def prompt_stats():
+    return get_prompt_orchestrator().stats()
+
+@app.get("/v1/preclassifier/stats")
+async def preclassifier_stats():
+    return get_preclassifier().stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,189 @@
+import bisect
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+# Latency buckets in seconds, from cache hits up to long generations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """
+    Monotonic counter with a fixed set of label names.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {value}" for labels, value in values]
+
+class Gauge(Counter):
+    """
+    Value that can go up and down, with a fixed set of label names.
+    """
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+class Histogram:
+    """
+    Cumulative histogram with a fixed set of label names.
+
+    observe() costs one bisect and a few additions under a lock, so it is
+    cheap enough for the request path.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._values.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(series)) for labels, series in self._values.items()]
+        lines = []
+        for labels, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+_registry: List[object] = []
+
+def register(metric):
+    """Add a metric to the /metrics output and return it."""
+    _registry.append(metric)
+    return metric
+
+def render() -> str:
+    """Render every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+MODEL_LABELS = ("interface", "provider", "model")
+
+REQUEST_SECONDS = register(Histogram(
+    "mobai_request_duration_seconds", "End-to-end query latency, including routing and retries.",
+    MODEL_LABELS + ("outcome",)))
+STAGE_SECONDS = register(Histogram(
+    "mobai_stage_duration_seconds",
+    "Latency of each query stage: config, validate, client, upstream, extract.",
+    ("stage",) + MODEL_LABELS))
+TIME_TO_FIRST_TOKEN_SECONDS = register(Histogram(
+    "mobai_time_to_first_token_seconds", "Time until a streamed response produced its first token.",
+    MODEL_LABELS))
+REQUESTS_ABORTED = register(Counter(
+    "mobai_requests_aborted_total",
+    "Requests stopped before completing, by reason (timeout: deadline passed; cancelled: client went away).",
+    MODEL_LABELS + ("reason",)))
+UPSTREAM_ERRORS = register(Counter(
+    "mobai_upstream_errors_total", "Failed upstream provider attempts.", MODEL_LABELS))
+TOKENS = register(Counter(
+    "mobai_tokens_total", "Tokens reported by providers, by kind (prompt, completion or cached).",
+    MODEL_LABELS + ("kind",)))
+PROMPT_PREFIX_TOKENS = register(Counter(
+    "mobai_prompt_prefix_tokens_total", "Tokens of the static system prefix sent to providers.",
+    MODEL_LABELS))
+PACKED_ITEMS = register(Counter(
+    "mobai_packed_items_total",
+    "Batch items sent in packed requests, by outcome (packed, or reissued after malformed output).",
+    ("interface", "outcome")))
+PRECLASSIFIED = register(Counter(
+    "mobai_preclassifier_total",
+    "Inputs seen by the pre-classifier, by outcome (answered locally or forwarded to the provider).",
+    ("interface", "outcome")))
+OUTPUTS_PARSED = register(Counter(
+    "mobai_outputs_parsed_total",
+    "Provider answers for interfaces with typed output, by outcome (parsed or unparsed).",
+    ("interface", "outcome")))
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+INPUT_TOKENS = register(Histogram(
+    "mobai_input_tokens", "Tokens in each user message, counted before truncation.", ("interface",),
+    buckets=TOKEN_BUCKETS))
+OUTPUT_TOKENS = register(Histogram(
+    "mobai_output_tokens", "Completion tokens reported by providers per answer.", ("interface",),
+    buckets=TOKEN_BUCKETS))
+INPUTS_TRUNCATED = register(Counter(
+    "mobai_inputs_truncated_total", "User messages truncated to the interface's max_input_tokens.", ("interface",)))
+QUEUE_JOBS = register(Counter(
+    "mobai_queue_jobs_total",
+    "Queued query jobs by event (submitted, deduplicated, succeeded, failed, retried or redelivered).",
+    ("interface", "event")))
+QUEUE_WAIT_SECONDS = register(Histogram(
+    "mobai_queue_wait_seconds", "Time a queued job waited before a worker claimed it.", ("interface",)))
+QUEUE_BACKLOG = register(Gauge(
+    "mobai_queue_backlog", "Queued query jobs not yet finished, by status (queued or running).", ("status",)))
+SEMANTIC_CACHE_LOOKUP_SECONDS = register(Histogram(
+    "mobai_semantic_cache_lookup_seconds", "Time to embed a message and search the semantic cache.",
+    ("interface", "outcome")))
+
+def model_labels(prepared) -> Tuple[str, str, str]:
+    """Return the (interface, provider, model) labels for a prepared query."""
+    return (prepared['interface_id'], prepared['model_provider'], str(prepared['model_config'].get('model', '')))
+
+def record_usage(labels: Tuple[str, str, str], prompt_tokens, completion_tokens, cached_tokens=None) -> None:
+    """
+    Count provider-reported token usage; missing counts are skipped.
+
+    cached_tokens is the part of prompt_tokens the provider served from its prompt cache.
+    """
+    if prompt_tokens:
+        TOKENS.inc(prompt_tokens, *labels, "prompt")
+    if completion_tokens:
+        TOKENS.inc(completion_tokens, *labels, "completion")
+    if cached_tokens:
+        TOKENS.inc(cached_tokens, *labels, "cached")
@@ -1,17 +1,437 @@
-import random
+import asyncio
+import importlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterable, List, Mapping, Optional, Sequence, Union
 
-def call_model(model_id: str, prompt: str, parameters: dict) -> str:
+import httpx
+
+from .client_pool import get_client_pool
+from .log_config import log_event
+
+Messages = Sequence[Mapping[str, str]]
+
+class ProviderError(Exception):
+    """Raised when a model provider returns an error status or an unusable response."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+@dataclass
+class Completion:
+    """
+    A model response, or one streamed piece of it.
+
+    Attributes:
+        text: Generated text (a delta when streaming).
+        prompt_tokens: Provider-reported prompt tokens, if known.
+        completion_tokens: Provider-reported completion tokens, if known.
+        cached_tokens: Prompt tokens the provider served from its prompt cache, if reported.
+        stages: Seconds spent in named stages ('client', 'upstream', 'extract').
+    """
+    text: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    stages: Dict[str, float] = field(default_factory=dict)
+
+class ModelAdaptor:
+    """
+    Base class for model provider adaptors.
+
+    An adaptor turns chat messages into a provider call. Adaptors are
+    registered by name and looked up through a provider's `adaptor` key in
+    config.yaml (defaulting to the provider's own name), so an
+    OpenAI-compatible server such as vLLM or llama.cpp can be added with
+    config alone:
+
+        model_providers:
+          vllm:
+            adaptor: openai
+            base_url: http://vllm:8000/v1
+            api_key: VLLM_API_KEY
+            model: meta-llama/Llama-3.1-8B-Instruct
+            system_prompt: ...
+
+    Subclasses implement complete() and stream(), and may override
+    validate(), batch(), _probe() and error_message().
+    """
+
+    name = ""
+    # Fields every provider section using this adaptor must define
+    required_fields: Sequence[str] = ("model", "system_prompt")
+    # Whether `api_key` names an environment variable that must be set
+    requires_api_key = False
+
+    def validate(self, model_config: Mapping[str, Any], interface_id: str) -> None:
+        """
+        Check adaptor-specific settings beyond the required fields.
+
+        Raises:
+            ValueError: If the configuration cannot be served by this adaptor.
+        """
+
+    async def complete(self, model_config: Mapping[str, Any], messages: Messages,
+                       api_key: Optional[str] = None) -> Completion:
+        """Return the full response to a conversation."""
+        raise NotImplementedError
+
+    async def stream(self, model_config: Mapping[str, Any], messages: Messages,
+                     api_key: Optional[str] = None) -> AsyncIterator[Completion]:
+        """Yield response text as it is generated; usage may arrive on an empty final piece."""
+        raise NotImplementedError
+        yield  # pragma: no cover - makes this an async generator
+
+    async def batch(self, model_config: Mapping[str, Any], conversations: Sequence[Messages],
+                    api_key: Optional[str] = None, concurrency: int = 8) -> List[Union[Completion, Exception]]:
+        """
+        Answer several conversations; failures are returned in place of their result.
+
+        The default runs complete() with bounded concurrency. Adaptors for
+        servers with native batching can override it.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(messages: Messages) -> Completion:
+            async with semaphore:
+                return await self.complete(model_config, messages, api_key=api_key)
+        return await asyncio.gather(*(one(messages) for messages in conversations), return_exceptions=True)
+
+    async def health(self, model_config: Mapping[str, Any], api_key: Optional[str] = None) -> Dict[str, Any]:
+        """Probe the backend and report whether it is reachable and how long the probe took."""
+        started = time.perf_counter()
+        try:
+            await self._probe(model_config, api_key)
+        except Exception as e:
+            return {"ok": False, "error": str(e), "seconds": time.perf_counter() - started}
+        return {"ok": True, "seconds": time.perf_counter() - started}
+
+    async def _probe(self, model_config: Mapping[str, Any], api_key: Optional[str]) -> None:
+        pass
+
+    def prewarm(self, model_config: Mapping[str, Any], api_key: Optional[str] = None) -> None:
+        """Create the pooled client for a backend ahead of its first request (no network I/O)."""
+        pass
+
+    def error_message(self, model_config: Mapping[str, Any], error: Exception) -> Optional[str]:
+        """
+        Describe a failed call for the caller, or return None to use the
+        generic message of src.external_integration.format_provider_error.
+        """
+        return None
+
+class OpenAIAdaptor(ModelAdaptor):
+    """
+    OpenAI chat completions, or any server implementing the same API
+    (set `base_url` in the provider config).
+    """
+
+    name = "openai"
+    required_fields = ("model", "api_key", "system_prompt")
+    requires_api_key = True
+
+    def __init__(self):
+        # Resolved once at registration instead of on every request
+        from openai import AsyncOpenAI
+        self.client_class = AsyncOpenAI
+
+    def client(self, model_config: Mapping[str, Any], api_key: Optional[str]):
+        return get_client_pool().get_openai_client(self.name, api_key, model_config.get('base_url'),
+                                                   client_class=self.client_class)
+
+    async def complete(self, model_config, messages, api_key=None) -> Completion:
+        started = time.perf_counter()
+        client = self.client(model_config, api_key)
+        sent = time.perf_counter()
+        response = await client.chat.completions.create(model=model_config.get('model'), messages=list(messages),
+                                                        **openai_options(model_config))
+        received = time.perf_counter()
+        if not response.choices:
+            raise ProviderError(f"Error: No response content received from {self.name}.")
+        usage = getattr(response, 'usage', None)
+        completion = Completion(
+            response.choices[0].message.content,
+            prompt_tokens=getattr(usage, 'prompt_tokens', None),
+            completion_tokens=getattr(usage, 'completion_tokens', None),
+            cached_tokens=_cached_tokens(usage),
+        )
+        completion.stages = {"client": sent - started, "upstream": received - sent,
+                             "extract": time.perf_counter() - received}
+        return completion
+
+    async def stream(self, model_config, messages, api_key=None) -> AsyncIterator[Completion]:
+        client = self.client(model_config, api_key)
+        stream = await client.chat.completions.create(
+            model=model_config.get('model'),
+            messages=list(messages),
+            stream=True,
+            # The final chunk then reports token usage
+            stream_options={"include_usage": True},
+            **openai_options(model_config),
+        )
+        try:
+            async for chunk in stream:
+                usage = getattr(chunk, 'usage', None)
+                if usage is not None:
+                    yield Completion("", usage.prompt_tokens, usage.completion_tokens, _cached_tokens(usage))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield Completion(chunk.choices[0].delta.content)
+        finally:
+            await stream.close()
+
+    async def _probe(self, model_config, api_key) -> None:
+        await self.client(model_config, api_key).models.list()
+
+    def prewarm(self, model_config, api_key=None) -> None:
+        self.client(model_config, api_key)
+
+def openai_options(model_config: Mapping[str, Any]) -> Dict[str, Any]:
+    """Optional chat completion parameters taken from a provider config."""
+    options: Dict[str, Any] = {}
+    if model_config.get('response_format') == 'json':
+        options["response_format"] = {"type": "json_object"}
+    if model_config.get('max_tokens'):
+        options["max_tokens"] = int(model_config['max_tokens'])
+    return options
+
+def _cached_tokens(usage) -> Optional[int]:
+    # OpenAI reports automatic prompt-cache hits under prompt_tokens_details
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return getattr(details, 'cached_tokens', None)
+
+def _retry_after_header(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers['retry-after'])
+    except (KeyError, ValueError):
+        return None
+
+class OllamaAdaptor(ModelAdaptor):
     """
-    Stub function to simulate calling an external or local AI model.
-    In production, you'd integrate with the model's API here.
+    Ollama's /api/chat over the pooled keep-alive client for each base_url.
     """
-    # Example logic: if model_id is "chatgpt-4", call the OpenAI ChatCompletion API.
-    # If model_id is "local-llm", we might run an inference on a local GPU-based server.
 
-    # For demonstration, we just return a mocked response:
-    responses = [
-        "This is a mock response for demonstration purposes.",
-        "Model output might appear here in a real environment.",
-        "Hello, I'm your AI assistant. How can I help you further?"
-    ]
-    return random.choice(responses)
\ No newline at end of file
+    name = "local_model"
+    required_fields = ("model_type", "base_url", "model", "system_prompt")
+
+    def validate(self, model_config, interface_id) -> None:
+        if model_config.get('model_type') != 'ollama':
+            raise ValueError(
+                f"Unsupported local model type '{model_config.get('model_type')}' in interface '{interface_id}'. "
+                "Currently only 'ollama' is supported."
+            )
+
+    @staticmethod
+    def _endpoint(model_config) -> str:
+        return model_config.get('base_url', 'http://localhost:11434')
+
+    @staticmethod
+    def _payload(model_config, messages, stream: bool) -> Dict[str, Any]:
+        payload = {"model": model_config.get('model', 'llama3.2'), "messages": list(messages), "stream": stream}
+        # Keeping the model loaded lets Ollama reuse the evaluated system prompt prefix
+        if model_config.get('keep_alive') is not None:
+            payload["keep_alive"] = model_config['keep_alive']
+        if model_config.get('response_format') == 'json':
+            payload["format"] = "json"
+        if model_config.get('max_tokens'):
+            payload["options"] = {"num_predict": int(model_config['max_tokens'])}
+        return payload
+
+    async def complete(self, model_config, messages, api_key=None) -> Completion:
+        base_url = self._endpoint(model_config)
+        payload = self._payload(model_config, messages, stream=False)
+        http_client = get_client_pool().get_http_client('local_model', base_url)
+        started = time.perf_counter()
+        response = await http_client.post(f"{base_url}/api/chat", json=payload)
+        received = time.perf_counter()
+        if response.status_code != 200:
+            raise ProviderError(
+                f"Error calling local model (status {response.status_code}): {response.text}",
+                status_code=response.status_code,
+                retry_after=_retry_after_header(response),
+            )
+        response_data = response.json()
+        # The expected format from Ollama is {"message": {"content": "..."}}
+        if "message" not in response_data or "content" not in response_data["message"]:
+            raise ProviderError(f"Invalid response format from local model: {response_data}")
+        return Completion(
+            response_data["message"]["content"],
+            prompt_tokens=response_data.get('prompt_eval_count'),
+            completion_tokens=response_data.get('eval_count'),
+            stages={"upstream": received - started, "extract": time.perf_counter() - received},
+        )
+
+    async def stream(self, model_config, messages, api_key=None) -> AsyncIterator[Completion]:
+        base_url = self._endpoint(model_config)
+        http_client = get_client_pool().get_http_client('local_model', base_url)
+        payload = self._payload(model_config, messages, stream=True)
+        async with http_client.stream("POST", f"{base_url}/api/chat", json=payload) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                raise ProviderError(
+                    f"Error calling local model (status {response.status_code}): {body.decode(errors='replace')}",
+                    status_code=response.status_code,
+                )
+            # Ollama streams one JSON object per line
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise ProviderError(f"Error from local model: {chunk['error']}")
+                content = chunk.get("message", {}).get("content")
+                if content:
+                    yield Completion(content)
+                if chunk.get("done"):
+                    yield Completion("", chunk.get('prompt_eval_count'), chunk.get('eval_count'))
+                    break
+
+    async def _probe(self, model_config, api_key) -> None:
+        base_url = self._endpoint(model_config)
+        response = await get_client_pool().get_http_client('local_model', base_url).get(f"{base_url}/api/tags")
+        response.raise_for_status()
+
+    def prewarm(self, model_config, api_key=None) -> None:
+        get_client_pool().get_http_client('local_model', self._endpoint(model_config))
+
+    def error_message(self, model_config, error) -> Optional[str]:
+        if isinstance(error, httpx.ConnectError):
+            return (f"Error: Could not connect to local model service at {model_config.get('base_url')}. "
+                    "Please ensure the service is running.")
+        if isinstance(error, httpx.TimeoutException):
+            return "Error: Request to local model service timed out. The service might be overloaded."
+        return f"Error fetching data from local model: {str(error)}"
+
+class MockAdaptor(ModelAdaptor):
+    """
+    In-process adaptor for tests and benchmarks; no network access.
+
+    Provider settings: `response` (fixed reply, default echoes the last
+    message), `latency` (seconds before replying) and `error` (raise a
+    ProviderError with this message).
+    """
+
+    name = "mock"
+    required_fields = ("system_prompt",)
+
+    @staticmethod
+    def _reply(model_config, messages) -> str:
+        if model_config.get('error'):
+            raise ProviderError(f"Error from mock model: {model_config['error']}", status_code=500)
+        return model_config.get('response') or f"Mock response to: {messages[-1]['content']}"
+
+    @staticmethod
+    def _usage(messages, text: str) -> Dict[str, int]:
+        prompt = sum(len(message.get('content') or '') for message in messages)
+        return {"prompt_tokens": prompt // 4 + 1, "completion_tokens": len(text) // 4 + 1}
+
+    async def complete(self, model_config, messages, api_key=None) -> Completion:
+        await asyncio.sleep(float(model_config.get('latency', 0)))
+        text = self._reply(model_config, messages)
+        return Completion(text, **self._usage(messages, text))
+
+    async def stream(self, model_config, messages, api_key=None) -> AsyncIterator[Completion]:
+        await asyncio.sleep(float(model_config.get('latency', 0)))
+        text = self._reply(model_config, messages)
+        for word in text.split(" "):
+            yield Completion(word + " ")
+        yield Completion("", **self._usage(messages, text))
+
+BUILTIN_ADAPTORS = {
+    "openai": OpenAIAdaptor,
+    "local_model": OllamaAdaptor,
+    "mock": MockAdaptor,
+}
+
+_adaptors: Dict[str, ModelAdaptor] = {}
+_classes: Dict[str, Union[type, str]] = {}
+
+def register_adaptor(name: str, adaptor: ModelAdaptor) -> None:
+    """Make an adaptor available to provider sections under `name`."""
+    _adaptors[name] = adaptor
+
+def _load_class(path: str):
+    module_name, _, class_name = path.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+def _adaptor_classes() -> Dict[str, Union[type, str]]:
+    # The built-ins plus any listed in MOBAI_ADAPTORS ("name=package.module:Class,...")
+    if not _classes:
+        _classes.update(BUILTIN_ADAPTORS)
+        for entry in filter(None, os.environ.get('MOBAI_ADAPTORS', '').split(',')):
+            name, _, path = entry.strip().partition("=")
+            _classes[name] = path
+    return _classes
+
+def _instantiate(name: str) -> Optional[ModelAdaptor]:
+    adaptor_class = _adaptor_classes().get(name)
+    if adaptor_class is None:
+        return None
+    try:
+        if isinstance(adaptor_class, str):
+            adaptor_class = _load_class(adaptor_class)
+        register_adaptor(name, adaptor_class())
+    except (ImportError, AttributeError) as e:
+        log_event("adaptor_unavailable", logging.WARNING, adaptor=name, error=str(e))
+        return None
+    return _adaptors[name]
+
+def load_adaptors(names: Optional[Iterable[str]] = None) -> Dict[str, ModelAdaptor]:
+    """
+    Instantiate adaptors ahead of their first request.
+
+    Adaptors import their provider SDK when instantiated, so passing the
+    names the configured interfaces use keeps other SDKs out of the process.
+    An adaptor whose dependencies are missing is skipped with a warning, so
+    the others remain usable.
+
+    Args:
+        names: Adaptors to load; None loads the built-ins plus any listed in
+               MOBAI_ADAPTORS ("name=package.module:Class,...").
+
+    Returns:
+        All adaptors instantiated so far, by name.
+    """
+    for name in (_adaptor_classes() if names is None else names):
+        if name not in _adaptors:
+            _instantiate(name)
+    return _adaptors
+
+def get_adaptor(name: str) -> ModelAdaptor:
+    """
+    Return the adaptor called `name`, instantiating it on first use.
+
+    Raises:
+        KeyError: If no adaptor is registered under that name or its
+                  dependencies are missing.
+    """
+    adaptor = _adaptors.get(name) or _instantiate(name)
+    if adaptor is None:
+        raise KeyError(name)
+    return adaptor
+
+def adaptor_name(model_provider: str, model_config: Mapping[str, Any]) -> str:
+    """A provider section uses the adaptor named by its `adaptor` key, or its own name."""
+    return model_config.get('adaptor') or model_provider
+
+def call_model(model_id: str, prompt: str, parameters: dict) -> str:
+    """
+    Synchronously answer a single prompt with the adaptor registered as model_id.
+
+    Args:
+        model_id: Adaptor name (e.g. 'openai', 'local_model' or 'mock')
+        prompt: The user prompt
+        parameters: Provider settings as they would appear in config.yaml;
+                    'api_key' is passed to the adaptor as-is.
+
+    Returns:
+        The response text.
+    """
+    from .external_integration import _run_sync  # imports this module
+    messages = [{"role": "user", "content": prompt}]
+    completion = _run_sync(get_adaptor(model_id).complete(parameters, messages, api_key=parameters.get('api_key')))
+    return completion.text
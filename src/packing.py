@@ -0,0 +1,101 @@
+"""
+Multi-message packing for classification interfaces.
+
+Short texts are grouped into a single request: the interface's system prompt
+followed by a numbered JSON list of texts and an output schema. The reply is
+parsed into one label per text; texts whose label is missing or malformed are
+re-issued on their own by the caller (see fetch_external_data_batch_async).
+
+Enabled per interface in config.yaml:
+
+    packing:
+      enabled: true
+      max_items: 20      # texts per request
+      max_tokens: 1000   # estimated tokens of packed texts per request
+      labels: ["0", "1", "2"]   # optional: accepted labels
+"""
+import json
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+DEFAULT_MAX_ITEMS = 20
+DEFAULT_MAX_TOKENS = 1000
+
+def packing_settings(interface_config: Mapping[str, Any], enabled: Optional[bool] = None) -> Optional[Mapping[str, Any]]:
+    """
+    Return the interface's packing settings, or None if packing is not enabled.
+
+    Args:
+        interface_config: The interface configuration.
+        enabled: Overrides the `enabled` flag from config.yaml when not None.
+    """
+    settings = interface_config.get('packing') or {}
+    if enabled is None:
+        enabled = bool(settings.get('enabled'))
+    return settings if enabled else None
+
+def max_items(settings: Mapping[str, Any]) -> int:
+    return max(1, int(settings.get('max_items', DEFAULT_MAX_ITEMS)))
+
+def max_tokens(settings: Mapping[str, Any]) -> int:
+    return int(settings.get('max_tokens', DEFAULT_MAX_TOKENS))
+
+def pack_question(messages: Sequence[str]) -> str:
+    """
+    Build the user message for a pack of texts.
+
+    The texts are JSON-encoded so that newlines or numbering inside a text can
+    not be confused with the list itself.
+    """
+    texts = json.dumps([{"id": i, "text": message} for i, message in enumerate(messages, start=1)],
+                       ensure_ascii=False)
+    return (
+        f"Apply the instructions above to each of the following {len(messages)} texts independently.\n"
+        'Respond with only a JSON object of the form {"results": [{"id": 1, "label": "..."}]}, '
+        f"with exactly one entry for every id from 1 to {len(messages)} and no other text.\n\n"
+        f"Texts:\n{texts}"
+    )
+
+def _json_object(text: str) -> Any:
+    # Tolerate code fences or a sentence around the JSON
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("No JSON object in response")
+    return json.loads(text[start:end + 1])
+
+def parse_pack_response(text: str, count: int, labels: Optional[Sequence[Any]] = None) -> Dict[int, str]:
+    """
+    Parse a packed response into labels by 1-based item id.
+
+    Items that are missing, repeated, out of range, not a string or number, or
+    not one of `labels` (when given) are left out, so the caller can re-issue
+    them individually.
+
+    Returns:
+        Dict mapping item ids to their label.
+    """
+    try:
+        results = _json_object(text).get("results")
+    except (ValueError, AttributeError):
+        return {}
+    if not isinstance(results, list):
+        return {}
+    allowed = {str(label) for label in labels} if labels else None
+    parsed: Dict[int, str] = {}
+    repeated = set()
+    for entry in results:
+        if not isinstance(entry, dict):
+            continue
+        item_id, label = entry.get("id"), entry.get("label")
+        if isinstance(item_id, bool) or not isinstance(item_id, int) or not 1 <= item_id <= count:
+            continue
+        if isinstance(label, bool) or not isinstance(label, (str, int, float)):
+            continue
+        label = str(label).strip()
+        if not label or (allowed is not None and label not in allowed):
+            continue
+        if item_id in parsed:
+            repeated.add(item_id)
+        parsed[item_id] = label
+    for item_id in repeated:
+        del parsed[item_id]
+    return parsed
@@ -0,0 +1,333 @@
+"""
+In-process pre-classification that answers obvious inputs without a provider call.
+
+Each interface may configure keyword/regex rules and a hashed n-gram linear
+model (multinomial logistic regression in NumPy). An input is answered locally
+only if a rule matches or the model's confidence reaches the interface's
+threshold; everything else is forwarded to the LLM.
+
+    preclassifier:
+      enabled: true
+      threshold: 0.9             # minimum model confidence to answer locally
+      empty_label: "0"           # answer for blank input
+      rules:
+        - pattern: "switch(ing)? to (t-mobile|at&t)"
+          label: "10"
+          confidence: 0.99       # default 1.0
+      model: preclassifier.npz   # relative to the interface directory
+
+Models are trained from logged LLM answers (api_request/api_response events):
+
+Usage:
+    python -m src.preclassifier train at_risk logs/external_integration.log --output interfaces/at_risk/preclassifier.npz
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from .lazy_import import lazy_import
+
+# Loaded on first use, so interfaces without a pre-classifier never import NumPy
+np = lazy_import('numpy')
+
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_FEATURES = 2 ** 18
+_TOKEN = re.compile(r"\w+")
+
+@dataclass(frozen=True)
+class Prediction:
+    """
+    A local answer for one input.
+
+    Attributes:
+        label: The answer returned instead of the LLM's.
+        confidence: Rule confidence or model probability of the label.
+        source: 'empty', 'rule' or 'model'.
+    """
+    label: str
+    confidence: float
+    source: str
+
+class HashedNgramModel:
+    """
+    Multinomial logistic regression over hashed word n-grams.
+
+    Features are CRC32 hashes of lower-cased word unigrams and bigrams, so the
+    model needs no vocabulary and scores any text. Each document's features
+    are L2-normalized.
+    """
+
+    def __init__(self, labels: Sequence[str], n_features: int = DEFAULT_FEATURES,
+                 weights: Optional[np.ndarray] = None, bias: Optional[np.ndarray] = None):
+        self.labels = [str(label) for label in labels]
+        self.n_features = n_features
+        self.weights = weights if weights is not None else np.zeros((n_features, len(self.labels)), np.float32)
+        self.bias = bias if bias is not None else np.zeros(len(self.labels), np.float32)
+
+    def features(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Hash texts into a sparse matrix.
+
+        Returns:
+            (doc, index, value) arrays: one entry per feature occurrence.
+        """
+        docs, indexes, values = [], [], []
+        for doc, text in enumerate(texts):
+            tokens = _TOKEN.findall(text.lower())
+            grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            if not grams:
+                continue
+            docs.extend([doc] * len(grams))
+            indexes.extend(zlib.crc32(gram.encode()) % self.n_features for gram in grams)
+            values.extend([1.0 / np.sqrt(len(grams))] * len(grams))
+        return (np.asarray(docs, np.int64), np.asarray(indexes, np.int64), np.asarray(values, np.float32))
+
+    def _logits(self, n_docs: int, docs: np.ndarray, indexes: np.ndarray, values: np.ndarray) -> np.ndarray:
+        logits = np.tile(self.bias, (n_docs, 1))
+        np.add.at(logits, docs, self.weights[indexes] * values[:, None])
+        return logits
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """Return an (n_texts, n_labels) array of class probabilities."""
+        logits = self._logits(len(texts), *self.features(texts))
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def fit(self, texts: Sequence[str], labels: Sequence[str], epochs: int = 200,
+            learning_rate: float = 1.0, l2: float = 1e-4) -> "HashedNgramModel":
+        """Train with full-batch gradient descent on the cross-entropy loss."""
+        targets = np.zeros((len(texts), len(self.labels)), np.float32)
+        targets[np.arange(len(texts)), [self.labels.index(str(label)) for label in labels]] = 1.0
+        docs, indexes, values = self.features(texts)
+        for _ in range(epochs):
+            logits = self._logits(len(texts), docs, indexes, values)
+            logits -= logits.max(axis=1, keepdims=True)
+            probabilities = np.exp(logits)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            error = (probabilities - targets) / len(texts)
+            gradient = np.zeros_like(self.weights)
+            np.add.at(gradient, indexes, error[docs] * values[:, None])
+            self.weights -= learning_rate * (gradient + l2 * self.weights)
+            self.bias -= learning_rate * error.sum(axis=0)
+        return self
+
+    def save(self, path: str) -> None:
+        # np.savez appends .npz unless the path already ends with it
+        np.savez_compressed(path, weights=self.weights, bias=self.bias, labels=np.asarray(self.labels),
+                            n_features=np.asarray(self.n_features))
+
+    @classmethod
+    def load(cls, path: str) -> "HashedNgramModel":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["labels"].tolist(), int(data["n_features"]), data["weights"], data["bias"])
+
+@dataclass(frozen=True)
+class _Compiled:
+    rules: Tuple[Tuple[re.Pattern, str, float], ...]
+    model: Optional[HashedNgramModel]
+    threshold: float
+    empty_label: Optional[str]
+
+class PreclassifierStats:
+    """Per-interface counters."""
+
+    def __init__(self):
+        self.requests = 0
+        self.hits: Dict[str, int] = {}
+
+    def as_dict(self, threshold: Optional[float]) -> Dict[str, Any]:
+        answered = sum(self.hits.values())
+        return {
+            "threshold": threshold,
+            "requests": self.requests,
+            "answered": answered,
+            "forwarded": self.requests - answered,
+            "hit_rate": answered / self.requests if self.requests else 0.0,
+            "by_source": dict(self.hits),
+        }
+
+class Preclassifier:
+    """
+    Applies each interface's rules and model, compiled once per config snapshot.
+    """
+
+    def __init__(self, interfaces_dir: Optional[str] = None):
+        self.interfaces_dir = interfaces_dir
+        self._compiled: Dict[str, Tuple[Mapping[str, Any], _Compiled]] = {}
+        self._stats: Dict[str, PreclassifierStats] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def settings(interface_config: Mapping[str, Any]) -> Optional[Mapping[str, Any]]:
+        """Return the interface's preclassifier settings, or None if it is not enabled."""
+        settings = interface_config.get('preclassifier') or {}
+        return settings if settings.get('enabled') else None
+
+    def _model_path(self, interface_id: str, path: str) -> str:
+        if os.path.isabs(path):
+            return path
+        interfaces_dir = self.interfaces_dir
+        if interfaces_dir is None:
+            from .config_manager import get_config_manager
+            interfaces_dir = get_config_manager().interfaces_dir
+        return os.path.join(interfaces_dir, interface_id, path)
+
+    def _compile(self, interface_id: str, settings: Mapping[str, Any]) -> _Compiled:
+        cached = self._compiled.get(interface_id)
+        # Config snapshots are immutable, so the same object means the same settings
+        if cached is not None and cached[0] is settings:
+            return cached[1]
+        rules = tuple((re.compile(rule['pattern'], re.IGNORECASE), str(rule['label']),
+                       float(rule.get('confidence', 1.0))) for rule in settings.get('rules') or ())
+        model = None
+        if settings.get('model'):
+            model = HashedNgramModel.load(self._model_path(interface_id, settings['model']))
+        empty_label = settings.get('empty_label')
+        compiled = _Compiled(rules, model, float(settings.get('threshold', DEFAULT_THRESHOLD)),
+                             None if empty_label is None else str(empty_label))
+        self._compiled[interface_id] = (settings, compiled)
+        return compiled
+
+    def _stats_for(self, interface_id: str) -> PreclassifierStats:
+        stats = self._stats.get(interface_id)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(interface_id, PreclassifierStats())
+        return stats
+
+    def classify(self, interface_id: str, settings: Mapping[str, Any],
+                 texts: Sequence[str]) -> List[Optional[Prediction]]:
+        """
+        Answer the texts that are confidently classifiable.
+
+        Rules are tried first; the remaining texts are scored by the model in
+        one vectorized pass.
+
+        Returns:
+            One Prediction per text, or None where the text must go to the LLM.
+        """
+        compiled = self._compile(interface_id, settings)
+        predictions: List[Optional[Prediction]] = [None] * len(texts)
+        undecided = []
+        for i, text in enumerate(texts):
+            if not text.strip():
+                if compiled.empty_label is not None:
+                    predictions[i] = Prediction(compiled.empty_label, 1.0, "empty")
+                continue
+            for pattern, label, confidence in compiled.rules:
+                if pattern.search(text):
+                    if confidence >= compiled.threshold:
+                        predictions[i] = Prediction(label, confidence, "rule")
+                    break
+            else:
+                undecided.append(i)
+        if compiled.model is not None and undecided:
+            probabilities = compiled.model.predict_proba([texts[i] for i in undecided])
+            best = probabilities.argmax(axis=1)
+            for i, label_index, confidence in zip(undecided, best, probabilities.max(axis=1)):
+                if confidence >= compiled.threshold:
+                    predictions[i] = Prediction(compiled.model.labels[label_index], float(confidence), "model")
+
+        stats = self._stats_for(interface_id)
+        with self._lock:
+            stats.requests += len(texts)
+            for prediction in predictions:
+                if prediction is not None:
+                    stats.hits[prediction.source] = stats.hits.get(prediction.source, 0) + 1
+        return predictions
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {interface_id: stats.as_dict(self._compiled[interface_id][1].threshold
+                                            if interface_id in self._compiled else None)
+                for interface_id, stats in self._stats.items()}
+
+_shared_preclassifier: Optional[Preclassifier] = None
+
+def get_preclassifier() -> Preclassifier:
+    """
+    Return the process-wide Preclassifier, creating it on first use.
+    """
+    global _shared_preclassifier
+    if _shared_preclassifier is None:
+        _shared_preclassifier = Preclassifier()
+    return _shared_preclassifier
+
+def _log_payload(line: str) -> Optional[Dict[str, Any]]:
+    # Log lines are "<time> <level> <json>"; other lines are skipped
+    start = line.find("{")
+    if start == -1:
+        return None
+    try:
+        payload = json.loads(line[start:])
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+def examples_from_logs(lines: Iterable[str], interface_id: str) -> List[Tuple[str, str]]:
+    """
+    Collect (question, answer) pairs for an interface from JSON log lines.
+
+    api_request and api_response events are joined on correlation_id. Events
+    whose question or response was truncated or dropped by payload limits
+    are skipped.
+    """
+    questions: Dict[str, str] = {}
+    examples = []
+    for line in lines:
+        payload = _log_payload(line)
+        if payload is None or payload.get("interface_id") != interface_id:
+            continue
+        correlation_id = payload.get("correlation_id")
+        if payload.get("event") == "api_request" and "question" in payload and "question_chars" not in payload:
+            questions[correlation_id] = payload["question"]
+        elif payload.get("event") == "api_response" and "response" in payload and "response_chars" not in payload:
+            question = questions.pop(correlation_id, None)
+            if question is not None and payload["response"] is not None:
+                examples.append((question, str(payload["response"]).strip()))
+    return examples
+
+def train(examples: Sequence[Tuple[str, str]], min_examples: int = 5, **kwargs) -> HashedNgramModel:
+    """
+    Train a HashedNgramModel on (text, label) pairs.
+
+    Labels with fewer than min_examples examples (usually free-form answers)
+    are left out.
+
+    Raises:
+        ValueError: If fewer than two labels have enough examples.
+    """
+    counts: Dict[str, int] = {}
+    for _, label in examples:
+        counts[label] = counts.get(label, 0) + 1
+    labels = sorted(label for label, count in counts.items() if count >= min_examples)
+    if len(labels) < 2:
+        raise ValueError(f"Need at least two labels with {min_examples}+ examples, got {counts}")
+    kept = [(text, label) for text, label in examples if label in labels]
+    return HashedNgramModel(labels).fit([text for text, _ in kept], [label for _, label in kept], **kwargs)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train a pre-classifier from logged LLM answers")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train_parser = commands.add_parser("train")
+    train_parser.add_argument("interface_id")
+    train_parser.add_argument("logs", nargs="+", help="Log files with api_request/api_response events")
+    train_parser.add_argument("--output", required=True, help="Path of the .npz model to write")
+    train_parser.add_argument("--min-examples", type=int, default=5)
+    train_parser.add_argument("--epochs", type=int, default=200)
+    args = parser.parse_args()
+
+    pairs = []
+    for log_path in args.logs:
+        with open(log_path, encoding="utf-8", errors="replace") as log_file:
+            pairs.extend(examples_from_logs(log_file, args.interface_id))
+    trained = train(pairs, min_examples=args.min_examples, epochs=args.epochs)
+    trained.save(args.output)
+    print(json.dumps({"examples": len(pairs), "labels": trained.labels, "output": args.output}))
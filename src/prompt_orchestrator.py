@@ -1,27 +1,153 @@
-from typing import Dict
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from .structured_output import json_instruction, output_settings
+from .token_budget import get_tokenizer
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens with tiktoken when it is installed (and its encoding is
+    available offline), otherwise estimate about four characters per token.
+    """
+    return get_tokenizer().count(text)
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """
+    A system prompt prepared once per interface config version.
+
+    Attributes:
+        version: Config version it was compiled from (None if unversioned).
+        system_prompt: The interned prompt text.
+        system_message: The shared, never-mutated system message.
+        tokens: Token count of the system message.
+    """
+    version: Optional[int]
+    system_prompt: str
+    system_message: Mapping[str, str]
+    tokens: int
+
+class PromptStats:
+    """Per-interface prompt counters."""
+
+    def __init__(self):
+        self.requests = 0
+        self.compilations = 0
+        self.prefix_tokens = 0
+
+    def as_dict(self, compiled: Optional[CompiledPrompt]) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "compilations": self.compilations,
+            "system_prompt_tokens": compiled.tokens if compiled else 0,
+            "prefix_tokens_sent": self.prefix_tokens,
+        }
+
+class PromptOrchestrator:
+    """
+    The single place where chat messages are assembled.
+
+    Each interface's system prompt is interned and token-counted once per
+    config version, then reused as the same message object on every request.
+    Messages always start with that static prefix and end with the dynamic
+    user content, so identical prefixes can be served from provider prompt
+    caches (OpenAI) or a still-loaded model's context (Ollama `keep_alive`).
+    """
+
+    def __init__(self):
+        self._compiled: Dict[Tuple[str, str], CompiledPrompt] = {}
+        self._stats: Dict[str, PromptStats] = {}
+        self._lock = threading.Lock()
+
+    def _stats_for(self, interface_id: str) -> PromptStats:
+        stats = self._stats.get(interface_id)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(interface_id, PromptStats())
+        return stats
+
+    def compile(self, prepared: Mapping[str, Any]) -> CompiledPrompt:
+        """Return the compiled system prompt for a prepared query, compiling it on first use."""
+        key = (prepared['interface_id'], prepared['model_provider'])
+        version = prepared.get('config_version')
+        system_prompt = prepared['system_prompt'] or ''
+        output = output_settings(prepared.get('interface_config') or {})
+        if output is not None and output.get('json_mode'):
+            system_prompt = f"{system_prompt}\n\n{json_instruction(output)}"
+        compiled = self._compiled.get(key)
+        if compiled is not None and compiled.version == version and (
+                version is not None or compiled.system_prompt == system_prompt):
+            return compiled
+        # A newer config version replaces the old entry for this interface and provider
+        system_prompt = sys.intern(system_prompt)
+        compiled = CompiledPrompt(
+            version=version,
+            system_prompt=system_prompt,
+            system_message={"role": "system", "content": system_prompt},
+            tokens=get_tokenizer((prepared.get('model_config') or {}).get('model')).count(system_prompt),
+        )
+        self._compiled[key] = compiled
+        self._stats_for(prepared['interface_id']).compilations += 1
+        return compiled
+
+    def messages(self, prepared: Mapping[str, Any]) -> List[Mapping[str, str]]:
+        """
+        Assemble the chat messages for a prepared query: static system prefix first,
+        then the user's question, already fitted to the interface's token budget
+        by prepare_query or the batch runners.
+        """
+        compiled = self.compile(prepared)
+        stats = self._stats_for(prepared['interface_id'])
+        stats.requests += 1
+        stats.prefix_tokens += compiled.tokens
+        return [compiled.system_message, {"role": "user", "content": prepared['question']}]
+
+    def prefix_tokens(self, prepared: Mapping[str, Any]) -> int:
+        """Token count of the stable prefix sent with a prepared query."""
+        return self.compile(prepared).tokens
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        compiled_by_interface = {interface_id: compiled for (interface_id, _), compiled in self._compiled.items()}
+        return {interface_id: stats.as_dict(compiled_by_interface.get(interface_id))
+                for interface_id, stats in self._stats.items()}
+
+def assemble_messages(system_prompt: str, question: str) -> List[Dict[str, str]]:
+    """Assemble messages for callers without an interface (e.g. call_local_model)."""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": question}
+    ]
+
+_shared_orchestrator: Optional[PromptOrchestrator] = None
+
+def get_prompt_orchestrator() -> PromptOrchestrator:
+    """
+    Return the process-wide PromptOrchestrator, creating it on first use.
+    """
+    global _shared_orchestrator
+    if _shared_orchestrator is None:
+        _shared_orchestrator = PromptOrchestrator()
+    return _shared_orchestrator
 
 def build_prompt(system_prompt: str, user_input: str, user_context: Dict) -> str:
     """
-    Merges the system prompt, user input, and any relevant user context.
-    Handles external data from third-party APIs if available.
+    Merges the system prompt, user input, and any relevant user context
+    into a single completion-style prompt. The system prompt stays first so
+    the prefix is identical across requests.
     """
-    # Build context string
     context_parts = []
-    
+
     # Extract external data if available
     external_data = user_context.get('external_data')
     if external_data:
         context_parts.append(f"External API Data: {external_data}")
-    
+
     # Add other context information
     other_context = {k: v for k, v in user_context.items() if k not in ['external_data', 'question']}
     if other_context:
         context_parts.append(f"User Context: {other_context}")
-    
-    # Combine all context parts
-    context_str = ""
-    if context_parts:
-        context_str = "\n[" + "\n".join(context_parts) + "]"
-    
-    final_prompt = f"{system_prompt}\n{context_str}\nUser: {user_input}\nAI:"
-    return final_prompt
+
+    context_str = "\n[" + "\n".join(context_parts) + "]" if context_parts else ""
+    return "".join((system_prompt, "\n", context_str, "\nUser: ", user_input, "\nAI:"))
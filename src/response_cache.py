@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from .shared_state import worker_count
+
+DEFAULT_DISK_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "response_cache.sqlite3")
+
+def normalize_message(message: str, case_sensitive: bool = True) -> str:
+    """Collapse whitespace (and optionally case) so trivially different texts share a key."""
+    normalized = " ".join(message.split())
+    return normalized if case_sensitive else normalized.casefold()
+
+def cache_key(interface_id: str, model_provider: str, model: str, system_prompt: str, message: str) -> str:
+    """Hash everything that determines a provider's answer into a fixed-size key."""
+    payload = json.dumps([interface_id, model_provider, model, system_prompt, message], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class CacheStats:
+    """Hit/miss/eviction counters for one interface."""
+
+    def __init__(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+class DiskCache:
+    """
+    SQLite tier that keeps cached responses across restarts.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, interface_id TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        return row
+
+    def set(self, key: str, interface_id: str, value: str, expires_at: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                               (key, interface_id, value, expires_at))
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._prune()
+
+    def _prune(self) -> None:
+        self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        excess = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY expires_at LIMIT ?)",
+                (excess,))
+
+    def close(self) -> None:
+        self._conn.close()
+
+class ResponseCache:
+    """
+    Two-tier response cache: an in-memory LRU with per-entry TTL, backed by an
+    optional SQLite tier that survives restarts.
+
+    Caching is opt-in per interface through a `cache` section in config.yaml:
+
+        cache:
+          enabled: true
+          ttl_seconds: 86400      # default 3600
+          disk: true              # also persist to the SQLite tier
+          case_sensitive: false   # treat "Great service" and "great service" alike
+
+    Process-wide limits come from the environment:
+        MOBAI_CACHE_MAX_ENTRIES       in-memory entries across interfaces (default 10000)
+        MOBAI_CACHE_DISK_PATH         SQLite file (default data/response_cache.sqlite3)
+        MOBAI_CACHE_DISK_MAX_ENTRIES  rows kept on disk (default 1000000)
+
+    With several workers (MOBAI_WORKERS > 1) the SQLite tier is used for every
+    cached interface, so workers share answers instead of each calling the
+    provider.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, disk_path: Optional[str] = None,
+                 disk_max_entries: Optional[int] = None, shared: Optional[bool] = None):
+        self.max_entries = max_entries or int(os.environ.get('MOBAI_CACHE_MAX_ENTRIES', 10000))
+        self.disk_path = disk_path or os.environ.get('MOBAI_CACHE_DISK_PATH', DEFAULT_DISK_PATH)
+        self.disk_max_entries = disk_max_entries or int(os.environ.get('MOBAI_CACHE_DISK_MAX_ENTRIES', 1000000))
+        self._entries: "OrderedDict[str, Tuple[str, float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[DiskCache] = None
+        self._disk_lock = threading.Lock()
+        self.stats: Dict[str, CacheStats] = {}
+        self.shared = worker_count() > 1 if shared is None else shared
+
+    @staticmethod
+    def settings(interface_config: Mapping[str, Any]) -> Optional[Mapping[str, Any]]:
+        """Return the interface's cache settings, or None if caching is not enabled."""
+        settings = interface_config.get('cache') or {}
+        return settings if settings.get('enabled') else None
+
+    def _stats(self, interface_id: str) -> CacheStats:
+        stats = self.stats.get(interface_id)
+        if stats is None:
+            stats = self.stats[interface_id] = CacheStats()
+        return stats
+
+    def _disk_cache(self) -> DiskCache:
+        if self._disk is None:
+            with self._disk_lock:
+                if self._disk is None:
+                    self._disk = DiskCache(self.disk_path, self.disk_max_entries)
+        return self._disk
+
+    def key_for(self, prepared: Dict[str, Any], settings: Mapping[str, Any]) -> str:
+        message = normalize_message(prepared['question'], settings.get('case_sensitive', True))
+        return cache_key(prepared['interface_id'], prepared['model_provider'],
+                         prepared['model_config'].get('model', ''), prepared['system_prompt'] or '', message)
+
+    def _remember(self, key: str, value: str, expires_at: float, interface_id: str) -> None:
+        with self._lock:
+            self._entries[key] = (value, expires_at, interface_id)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                _, (_, _, evicted_interface) = self._entries.popitem(last=False)
+                self._stats(evicted_interface).evictions += 1
+
+    def _lookup(self, key: str, now: float, stats: CacheStats) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] > now:
+                self._entries.move_to_end(key)
+                return entry[0]
+            del self._entries[key]
+            stats.expirations += 1
+            return None
+
+    async def get(self, prepared: Dict[str, Any], settings: Mapping[str, Any]) -> Optional[str]:
+        """Return the cached response for a prepared query, or None on a miss."""
+        interface_id = prepared['interface_id']
+        stats = self._stats(interface_id)
+        key = self.key_for(prepared, settings)
+        now = time.time()
+        value = self._lookup(key, now, stats)
+        if value is not None:
+            stats.hits += 1
+            return value
+        if settings.get('disk') or self.shared:
+            row = await asyncio.to_thread(self._disk_cache().get, key)
+            if row is not None and row[1] > now:
+                self._remember(key, row[0], row[1], interface_id)
+                stats.hits += 1
+                stats.disk_hits += 1
+                return row[0]
+        stats.misses += 1
+        return None
+
+    async def set(self, prepared: Dict[str, Any], settings: Mapping[str, Any], value: str) -> None:
+        """Store a successful response for a prepared query."""
+        key = self.key_for(prepared, settings)
+        expires_at = time.time() + float(settings.get('ttl_seconds', 3600))
+        self._remember(key, value, expires_at, prepared['interface_id'])
+        if settings.get('disk') or self.shared:
+            await asyncio.to_thread(self._disk_cache().set, key, prepared['interface_id'], value, expires_at)
+
+    def clear(self) -> None:
+        """Drop all in-memory entries (the disk tier is left untouched)."""
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return entry counts and per-interface counters."""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "interfaces": {interface_id: stats.as_dict() for interface_id, stats in self.stats.items()},
+        }
+
+_shared_cache: Optional[ResponseCache] = None
+
+def get_response_cache() -> ResponseCache:
+    """
+    Return the process-wide ResponseCache, creating it on first use.
+    """
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = ResponseCache()
+    return _shared_cache
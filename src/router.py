@@ -0,0 +1,237 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Mapping, Optional
+
+from .log_config import log_event
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+def backend_name(prepared: Mapping[str, Any]) -> str:
+    """Identify a routing target by provider and endpoint."""
+    return f"{prepared['model_provider']}@{prepared['model_config'].get('base_url') or 'default'}"
+
+class AllBackendsFailed(Exception):
+    """
+    Raised when every candidate backend failed.
+
+    Attributes:
+        prepared: The last backend that was tried.
+        error: The error it raised.
+    """
+
+    def __init__(self, prepared: Dict[str, Any], error: Exception):
+        super().__init__(str(error))
+        self.prepared = prepared
+        self.error = error
+
+class BackendHealth:
+    """
+    Rolling latency window, error rate and circuit breaker for one backend.
+    """
+
+    def __init__(self, window: int = 200):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        # True while the one request allowed through a half-open circuit is in flight
+        self.probing = False
+        self._percentiles: Optional[Dict[str, float]] = None
+
+    def percentiles(self) -> Dict[str, float]:
+        if self._percentiles is None:
+            ordered = sorted(self.latencies)
+            if not ordered:
+                self._percentiles = {"p50": 0.0, "p95": 0.0}
+            else:
+                self._percentiles = {
+                    "p50": ordered[len(ordered) // 2],
+                    "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                }
+        return self._percentiles
+
+    def record(self, seconds: float, ok: bool, failure_threshold: int) -> None:
+        self.requests += 1
+        self.probing = False
+        # Exponentially weighted so recent errors dominate
+        self.error_rate = self.error_rate * 0.9 + (0.0 if ok else 0.1)
+        if ok:
+            self.latencies.append(seconds)
+            self._percentiles = None
+            self.consecutive_failures = 0
+            self.state = CLOSED
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def available(self, reset_timeout: float) -> bool:
+        """
+        Closed backends take traffic; open ones turn half-open once reset_timeout
+        has passed and are then available until a probe request is in flight.
+        """
+        if self.state == OPEN and time.monotonic() - self.opened_at >= reset_timeout:
+            self.state = HALF_OPEN
+            self.probing = False
+        return self.state == CLOSED or (self.state == HALF_OPEN and not self.probing)
+
+    def begin_probe(self) -> bool:
+        """Claim the probe of a half-open circuit. Returns False if another request holds it."""
+        if self.probing:
+            return False
+        self.probing = True
+        return True
+
+    def score(self) -> float:
+        """Lower is better: tail latency inflated by the recent error rate."""
+        p = self.percentiles()
+        return (p["p50"] + p["p95"]) / 2 * (1 + 10 * self.error_rate)
+
+class Router:
+    """
+    Chooses and fails over between the backends that can serve an interface.
+
+    Routing is configured per interface in config.yaml:
+
+        routing:
+          policy: latency            # 'ordered' (default) or 'latency'
+          providers: [local_model, openai]   # default: every configured provider
+          failover: true             # try the next backend on transient errors
+          failure_threshold: 5       # consecutive failures before a circuit opens
+          reset_timeout: 30          # seconds before an open circuit is re-probed
+
+    A provider may list several endpoints with `base_urls` to spread load across
+    them. With the 'latency' policy the first backend is picked at random,
+    weighted by observed p50/p95 latency and error rate; the rest follow as
+    failover targets in score order. Backends whose circuit is open are only
+    tried when nothing else is available. A half-open circuit lets one probe
+    request through at a time; other requests fail over past it until the
+    probe succeeds and closes the circuit.
+    """
+
+    def __init__(self):
+        self._health: Dict[str, BackendHealth] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def settings(prepared: Mapping[str, Any]) -> Mapping[str, Any]:
+        return prepared['interface_config'].get('routing') or {}
+
+    def health(self, name: str) -> BackendHealth:
+        health = self._health.get(name)
+        if health is None:
+            with self._lock:
+                health = self._health.setdefault(name, BackendHealth())
+        return health
+
+    def observe(self, prepared: Mapping[str, Any], seconds: float, ok: bool) -> None:
+        """Record the outcome of an upstream call to a backend."""
+        settings = self.settings(prepared)
+        name = backend_name(prepared)
+        health = self.health(name)
+        previous_state = health.state
+        health.record(seconds, ok, int(settings.get('failure_threshold', 5)))
+        if health.state != previous_state and health.state != HALF_OPEN:
+            log_event(f"circuit_{health.state}", logging.WARNING, backend=name)
+
+    def order(self, routes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return routes in the order they should be tried."""
+        if len(routes) <= 1:
+            return list(routes)
+        settings = self.settings(routes[0])
+        reset_timeout = float(settings.get('reset_timeout', 30))
+        healthy, tripped = [], []
+        for route in routes:
+            (healthy if self.health(backend_name(route)).available(reset_timeout) else tripped).append(route)
+        if settings.get('policy', 'ordered') == 'latency' and len(healthy) > 1:
+            healthy = self._by_latency(healthy)
+        return healthy + tripped
+
+    def _by_latency(self, routes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        healths = [self.health(backend_name(route)) for route in routes]
+        scores = [health.score() for health in healths]
+        known = [score for score, health in zip(scores, healths) if len(health.latencies) >= 5 and score > 0]
+        best = min(known) if known else 1.0
+        # Backends with too few samples get the best weight so they are explored
+        weights = [1.0 / (score if len(health.latencies) >= 5 and score > 0 else best)
+                   for score, health in zip(scores, healths)]
+        first = random.choices(range(len(routes)), weights=weights)[0]
+        rest = sorted((i for i in range(len(routes)) if i != first), key=lambda i: scores[i])
+        return [routes[first]] + [routes[i] for i in rest]
+
+    async def run(self, routes: List[Dict[str, Any]], fn: Callable[[Dict[str, Any]], Awaitable[Any]],
+                  is_transient: Callable[[Exception], bool]) -> Any:
+        """
+        Call fn(route) on routes in routing order until one succeeds.
+
+        Only transient errors (timeouts, connection failures, overload) move on to
+        the next backend. Every route except the last is marked with
+        'allow_retry': False so it fails over instead of retrying in place.
+        A half-open backend whose probe is already in flight is skipped unless
+        it is the last route left.
+
+        Raises:
+            AllBackendsFailed: With the last route tried and its error.
+        """
+        ordered = self.order(routes)
+        if not self.settings(ordered[0]).get('failover', True):
+            ordered = ordered[:1]
+        failed = None
+        for position, route in enumerate(ordered):
+            last = position == len(ordered) - 1
+            health = self.health(backend_name(route))
+            with self._lock:
+                probe = health.state == HALF_OPEN and health.begin_probe()
+                busy = health.state == HALF_OPEN and not probe
+            if busy and not last:
+                # Another request is probing this backend; don't wait for its verdict
+                continue
+            if failed:
+                # Logged only now, so "to" names the backend actually tried rather than a skipped one
+                failed_route, error = failed
+                log_event("provider_failover", logging.WARNING, correlation_id=failed_route.get('correlation_id'),
+                          **{"from": backend_name(failed_route), "to": backend_name(route)}, error=str(error))
+            attempt = route if last else {**route, "allow_retry": False}
+            try:
+                return await fn(attempt)
+            except Exception as e:
+                if last or not is_transient(e):
+                    raise AllBackendsFailed(attempt, e)
+                failed = (route, e)
+            finally:
+                if probe:
+                    # Calls that end without an outcome (e.g. cancelled) free the probe
+                    health.probing = False
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "state": health.state,
+                "requests": health.requests,
+                "failures": health.failures,
+                "error_rate": health.error_rate,
+                **health.percentiles(),
+            }
+            for name, health in self._health.items()
+        }
+
+_shared_router: Optional[Router] = None
+
+def get_router() -> Router:
+    """
+    Return the process-wide Router, creating it on first use.
+    """
+    global _shared_router
+    if _shared_router is None:
+        _shared_router = Router()
+    return _shared_router
@@ -0,0 +1,307 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
+import httpx
+
+from .log_config import log_event
+from .shared_state import BucketStore, get_bucket_store, per_worker
+
+# Lower value = served first
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+DEFAULT_LIMITS = {
+    "openai": {"max_concurrency": 64},
+    # A single Ollama instance processes only a few requests in parallel
+    "local_model": {"max_concurrency": 4},
+}
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Rough token estimate (about four characters per token) for rate limiting."""
+    return len(text or "") // 4 + 1
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute` tokens per minute.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_minute / 60.0)
+        self.updated = now
+
+    async def take(self, amount: float) -> float:
+        """Wait until `amount` tokens are available and take them. Returns seconds waited."""
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return waited
+            delay = (amount - self.tokens) * 60.0 / self.per_minute
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float) -> None:
+        """Drain the bucket so no request is admitted for roughly `seconds` (used on 429)."""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.per_minute / 60.0)
+
+class SharedTokenBucket:
+    """
+    TokenBucket whose state lives in a BucketStore shared by all worker processes.
+    """
+
+    def __init__(self, store: BucketStore, key: str, per_minute: float):
+        self.store = store
+        self.key = key
+        self.per_minute = per_minute
+        self.capacity = per_minute
+
+    async def take(self, amount: float) -> float:
+        """Wait until `amount` tokens are available and take them. Returns seconds waited."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            delay = await asyncio.to_thread(self.store.take, self.key, amount, self.per_minute)
+            if not delay:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float) -> None:
+        self.store.pause(self.key, seconds, self.per_minute)
+
+def _bucket(name: str, kind: str, per_minute: float):
+    store = get_bucket_store()
+    if store is None:
+        return TokenBucket(per_minute)
+    return SharedTokenBucket(store, f"{name}:{kind}", per_minute)
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Return the Retry-After delay in seconds carried by a provider error, if any."""
+    delay = getattr(error, "retry_after", None)
+    if delay is not None:
+        return float(delay)
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and connection failures are worth retrying."""
+    if isinstance(error, httpx.TransportError):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in (408, 409, 429) or status_code >= 500
+    # openai.APIConnectionError / APITimeoutError carry no status code
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+class ProviderScheduler:
+    """
+    Admission control for one provider endpoint.
+
+    Requests take one of `max_concurrency` slots, handed out by priority
+    (interactive before batch, FIFO within a priority), then wait for
+    requests-per-minute and tokens-per-minute budget. Retryable failures are
+    retried with jittered exponential backoff; a Retry-After from the provider
+    is honoured and also pauses the RPM bucket so other requests back off too.
+
+    Limits come from a `limits` block under the provider in config.yaml. They
+    apply to the whole server: with several workers, max_concurrency is split
+    between them and the rate buckets are shared (see src.shared_state).
+
+        limits:
+          max_concurrency: 8
+          requests_per_minute: 500
+          tokens_per_minute: 30000
+          max_retries: 3
+          backoff_base: 0.5     # seconds
+          backoff_max: 30       # seconds
+    """
+
+    def __init__(self, name: str, limits: Mapping[str, Any]):
+        self.name = name
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self.active = 0
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._limits: Optional[Mapping[str, Any]] = None
+        self.configure(limits)
+
+    def configure(self, limits: Mapping[str, Any]) -> None:
+        """Apply (possibly reloaded) limits; buckets are rebuilt only when their rate changes."""
+        if limits == self._limits:
+            return
+        self._limits = limits
+        self.max_concurrency = per_worker(int(limits.get("max_concurrency", 32)))
+        self.max_retries = int(limits.get("max_retries", 3))
+        self.backoff_base = float(limits.get("backoff_base", 0.5))
+        self.backoff_max = float(limits.get("backoff_max", 30))
+        rpm = limits.get("requests_per_minute")
+        tpm = limits.get("tokens_per_minute")
+        if not rpm:
+            self.rpm_bucket = None
+        elif getattr(self, "rpm_bucket", None) is None or self.rpm_bucket.per_minute != rpm:
+            self.rpm_bucket = _bucket(self.name, "rpm", float(rpm))
+        if not tpm:
+            self.tpm_bucket = None
+        elif getattr(self, "tpm_bucket", None) is None or self.tpm_bucket.per_minute != tpm:
+            self.tpm_bucket = _bucket(self.name, "tpm", float(tpm))
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.active < self.max_concurrency:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+    async def _acquire_slot(self, priority: int) -> None:
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        # Skips over entries left behind by cancelled waiters
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled
+                self._release_slot()
+            raise
+
+    def _release_slot(self) -> None:
+        self.active -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive", tokens: int = 0) -> AsyncIterator[None]:
+        """Hold a concurrency slot (and rate budget) for the duration of the block."""
+        started = time.perf_counter()
+        await self._acquire_slot(PRIORITIES.get(priority, 0))
+        try:
+            if self.rpm_bucket:
+                await self.rpm_bucket.take(1)
+            if self.tpm_bucket and tokens:
+                await self.tpm_bucket.take(tokens)
+            waited = time.perf_counter() - started
+            self.requests += 1
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            yield
+        finally:
+            self._release_slot()
+
+    async def run(self, fn: Callable[[], Awaitable[Any]], priority: str = "interactive", tokens: int = 0,
+                  max_retries: Optional[int] = None, correlation_id: Optional[str] = None) -> Any:
+        """
+        Run fn() under this scheduler, retrying retryable failures.
+
+        Args:
+            max_retries: Overrides the configured retry count for this call.
+            correlation_id: The request's id, for the retry log events.
+
+        Raises:
+            Exception: The last error once retries are exhausted, or any non-retryable error.
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(priority, tokens):
+                    return await fn()
+            except Exception as e:
+                if attempt >= max_retries or not is_retryable(e):
+                    raise
+                attempt += 1
+                self.retries += 1
+                delay = retry_after(e)
+                if getattr(e, "status_code", None) == 429:
+                    self.rate_limited += 1
+                    if delay and isinstance(self.rpm_bucket, SharedTokenBucket):
+                        # A SQLite write that may wait on other workers; keep it off the event loop
+                        await asyncio.to_thread(self.rpm_bucket.pause, delay)
+                    elif delay and self.rpm_bucket:
+                        self.rpm_bucket.pause(delay)
+                if delay is None:
+                    delay = min(self.backoff_base * 2 ** (attempt - 1), self.backoff_max) * random.uniform(0.5, 1.5)
+                log_event("provider_retry", logging.WARNING, correlation_id=correlation_id, scheduler=self.name,
+                          attempt=attempt, delay_seconds=round(delay, 3), error=str(e))
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        queued = {name: 0 for name in PRIORITIES}
+        names = {value: name for name, value in PRIORITIES.items()}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                queued[names.get(priority, str(priority))] += 1
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "queued": queued,
+            "queue_depth": sum(queued.values()),
+            "requests": self.requests,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "avg_wait_seconds": self.total_wait_seconds / self.requests if self.requests else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+        }
+
+# Futures belong to the loop that created them, so each loop keeps its own schedulers.
+_schedulers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, ProviderScheduler]]" = weakref.WeakKeyDictionary()
+
+def scheduler_name(model_provider: str, model_config: Mapping[str, Any]) -> str:
+    """Requests to the same account or server share a scheduler."""
+    endpoint = model_config.get("base_url") or model_config.get("api_key") or ""
+    return f"{model_provider}@{endpoint}"
+
+def get_scheduler(model_provider: str, model_config: Mapping[str, Any]) -> ProviderScheduler:
+    """
+    Return the scheduler for a provider endpoint on the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    schedulers = _schedulers.get(loop)
+    if schedulers is None:
+        schedulers = _schedulers[loop] = {}
+    name = scheduler_name(model_provider, model_config)
+    limits = model_config.get("limits") or DEFAULT_LIMITS.get(model_provider, {})
+    scheduler = schedulers.get(name)
+    if scheduler is None:
+        scheduler = schedulers[name] = ProviderScheduler(name, limits)
+    else:
+        scheduler.configure(limits)
+    return scheduler
+
+def scheduler_stats() -> Dict[str, Dict[str, Any]]:
+    """Return stats for every scheduler on the running event loop."""
+    schedulers = _schedulers.get(asyncio.get_running_loop(), {})
+    return {name: scheduler.stats() for name, scheduler in schedulers.items()}
@@ -1,11 +1,61 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional
 
 class UserQueryRequest(BaseModel):
-    interface_id: str   
+    interface_id: str
     user_input: str
     user_context: Optional[dict] = None  # Could include user ID, role, session data, etc.
 
+# HTTP status for each kind of query error
+ERROR_STATUS = {
+    "invalid_request": 400,   # the caller sent something unusable
+    "not_found": 404,         # no such interface
+    "configuration": 500,     # the interface or its environment is misconfigured
+    "provider": 502,          # the backend rejected the query or answered garbage
+    "unavailable": 503,       # every backend was down, overloaded or unreachable
+    "timeout": 504,           # the request's deadline passed
+}
+
+class ErrorInfo(BaseModel):
+    """Why a query failed, decided where the failure happened."""
+    model_config = ConfigDict(frozen=True)
+
+    kind: str
+    message: str
+    status_code: int
+
+    def __str__(self) -> str:
+        return self.message
+
+def error_info(kind: str, message: str) -> ErrorInfo:
+    """Build an ErrorInfo of one of the ERROR_STATUS kinds."""
+    return ErrorInfo(kind=kind, message=message, status_code=ERROR_STATUS[kind])
+
+class Usage(BaseModel):
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+
 class AIResponse(BaseModel):
-    response_text: str
-    metadata: Optional[dict] = None
\ No newline at end of file
+    """
+    The result of a query: either response_text or error is set.
+
+    For interfaces with an `output` section (see src.structured_output),
+    response_text is the canonical label or score and `label`/`score` hold it
+    typed. `source` says where the answer came from: provider, cache,
+    semantic_cache or preclassifier.
+    """
+    response_text: Optional[str] = None
+    label: Optional[str] = None
+    score: Optional[int] = None
+    error: Optional[ErrorInfo] = None
+    source: Optional[str] = None
+    model_provider: Optional[str] = None
+    model: Optional[str] = None
+    usage: Optional[Usage] = None
+    latency_ms: Optional[float] = None
+    metadata: Optional[dict] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
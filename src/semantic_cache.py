@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Any, Deque, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from .lazy_import import lazy_import
+from .response_cache import cache_key
+
+# Loaded on first use, so interfaces without a semantic cache never import NumPy
+np = lazy_import('numpy')
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "semantic_cache")
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_DIMENSIONS = 512
+_TOKEN = re.compile(r"\w+")
+
+class HashedEmbedder:
+    """
+    Embeds text as a signed hashed bag of words and character trigrams.
+
+    Needs no model download and costs microseconds per message. It matches
+    near-duplicates ("My calls keep dropping!" / "calls keep dropping") but not
+    paraphrases with different words; use `embedding_model` for those.
+    """
+
+    def __init__(self, dimensions: int = DEFAULT_DIMENSIONS):
+        self.dimensions = dimensions
+        self.name = f"hashed-{dimensions}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), np.float32)
+        for row, text in enumerate(texts):
+            for word in _TOKEN.findall(text.lower()):
+                padded = f"<{word}>"
+                for feature in [word] + [padded[i:i + 3] for i in range(len(word))]:
+                    hashed = zlib.crc32(feature.encode())
+                    vectors[row, hashed % self.dimensions] += 1.0 if hashed & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+class SentenceTransformerEmbedder:
+    """Embeds text with a local sentence-transformers model on the CPU (optional dependency)."""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+        self.name = model_name
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return self.model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+class VectorIndex:
+    """
+    Brute-force cosine-similarity index over unit vectors.
+
+    Rows live in one contiguous float32 matrix, so a lookup is a single
+    matrix-vector product. When full, the oldest entry is overwritten.
+    A snapshot loaded from disk stays memory-mapped until the first insert.
+    """
+
+    def __init__(self, dimensions: int, max_entries: int):
+        self.dimensions = dimensions
+        self.max_entries = max_entries
+        self.vectors = np.zeros((0, dimensions), np.float32)
+        self.expires = np.zeros(0, np.float64)
+        self.answers: List[str] = []
+        self.next_row = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.answers)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.vectors[:len(self)].nbytes + self.expires[:len(self)].nbytes)
+
+    def search(self, vector: np.ndarray, now: float) -> Tuple[Optional[str], float]:
+        """Return the best unexpired answer and its similarity (None, 0.0 if empty)."""
+        with self.lock:
+            size = len(self.answers)
+            if not size:
+                return None, 0.0
+            scores = self.vectors[:size] @ vector
+            scores[self.expires[:size] <= now] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] < 0:
+                return None, 0.0
+            return self.answers[best], float(scores[best])
+
+    def add(self, vector: np.ndarray, answer: str, expires_at: float) -> None:
+        with self.lock:
+            size = len(self.answers)
+            if size < self.max_entries:
+                if size == len(self.vectors) or not self.vectors.flags.writeable:
+                    self._grow(max(64, min(self.max_entries, size * 2)))
+                row = size
+                self.answers.append(answer)
+            else:
+                if not self.vectors.flags.writeable:
+                    self._grow(len(self.vectors))
+                row = self.next_row
+                self.answers[row] = answer
+            self.vectors[row] = vector
+            self.expires[row] = expires_at
+            self.next_row = (row + 1) % self.max_entries
+
+    def _grow(self, capacity: int) -> None:
+        # Also copies a memory-mapped snapshot into writable memory
+        size = len(self.answers)
+        vectors = np.zeros((capacity, self.dimensions), np.float32)
+        vectors[:size] = self.vectors[:size]
+        expires = np.zeros(capacity, np.float64)
+        expires[:size] = self.expires[:size]
+        self.vectors, self.expires = vectors, expires
+
+    def save(self, path: str) -> None:
+        """Write `<path>.npy` (vectors) and `<path>.json` (answers and expiry)."""
+        with self.lock:
+            size = len(self.answers)
+            with open(f"{path}.npy.tmp", "wb") as f:
+                np.save(f, np.ascontiguousarray(self.vectors[:size]), allow_pickle=False)
+            with open(f"{path}.json.tmp", "w", encoding="utf-8") as f:
+                json.dump({"answers": self.answers, "expires": self.expires[:size].tolist(),
+                           "next_row": self.next_row}, f, ensure_ascii=False)
+        # Replace atomically; readers still holding the old memory map keep its data
+        os.replace(f"{path}.npy.tmp", f"{path}.npy")
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+
+    @classmethod
+    def load(cls, path: str, dimensions: int, max_entries: int) -> "VectorIndex":
+        index = cls(dimensions, max_entries)
+        with open(f"{path}.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(f"{path}.npy", mmap_mode="r")
+        if vectors.shape[1:] != (dimensions,):
+            raise ValueError(f"Snapshot {path} has dimensions {vectors.shape[1:]}, expected {dimensions}")
+        keep = min(len(meta["answers"]), max_entries)
+        index.vectors = vectors[:keep]
+        index.expires = np.asarray(meta["expires"][:keep], np.float64)
+        index.answers = meta["answers"][:keep]
+        index.next_row = meta.get("next_row", keep) % max_entries
+        return index
+
+class SemanticCacheStats:
+    """Lookup counters and recent lookup latencies for one interface."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.latencies: Deque[float] = deque(maxlen=1000)
+
+    def as_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        latencies = sorted(self.latencies)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "lookup_ms_p50": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+            "lookup_ms_p99": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        }
+
+class SemanticCache:
+    """
+    Near-duplicate response cache keyed by message embeddings.
+
+    Opt-in per interface through a `semantic_cache` section in config.yaml:
+
+        semantic_cache:
+          enabled: true
+          threshold: 0.9          # minimum cosine similarity to reuse an answer
+          ttl_seconds: 86400      # default 3600
+          max_entries: 10000      # per interface, provider, model and system prompt
+          embedding_model: all-MiniLM-L6-v2   # optional; needs sentence-transformers
+
+    Answers are only reused within the same interface, provider, model and
+    system prompt. Snapshots are written to MOBAI_SEMANTIC_CACHE_DIR (default
+    data/semantic_cache) by save() and memory-mapped back on first use.
+    """
+
+    def __init__(self, snapshot_dir: Optional[str] = None):
+        self.snapshot_dir = snapshot_dir or os.environ.get('MOBAI_SEMANTIC_CACHE_DIR', DEFAULT_SNAPSHOT_DIR)
+        self._embedders: Dict[str, Any] = {}
+        self._indexes: Dict[str, Tuple[str, VectorIndex]] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, SemanticCacheStats] = {}
+
+    @staticmethod
+    def settings(interface_config: Mapping[str, Any]) -> Optional[Mapping[str, Any]]:
+        """Return the interface's semantic cache settings, or None if it is not enabled."""
+        settings = interface_config.get('semantic_cache') or {}
+        return settings if settings.get('enabled') else None
+
+    def _embedder(self, settings: Mapping[str, Any]):
+        name = settings.get('embedding_model') or f"hashed-{int(settings.get('dimensions', DEFAULT_DIMENSIONS))}"
+        embedder = self._embedders.get(name)
+        if embedder is None:
+            with self._lock:
+                embedder = self._embedders.get(name)
+                if embedder is None:
+                    if settings.get('embedding_model'):
+                        embedder = SentenceTransformerEmbedder(settings['embedding_model'])
+                    else:
+                        embedder = HashedEmbedder(int(settings.get('dimensions', DEFAULT_DIMENSIONS)))
+                    self._embedders[name] = embedder
+        return embedder
+
+    def _index(self, prepared: Dict[str, Any], settings: Mapping[str, Any], embedder) -> VectorIndex:
+        namespace = cache_key(prepared['interface_id'], prepared['model_provider'],
+                              prepared['model_config'].get('model', ''), prepared['system_prompt'] or '',
+                              embedder.name)
+        entry = self._indexes.get(namespace)
+        if entry is None:
+            with self._lock:
+                entry = self._indexes.get(namespace)
+                if entry is None:
+                    max_entries = int(settings.get('max_entries', 10000))
+                    path = os.path.join(self.snapshot_dir, namespace)
+                    index = None
+                    if os.path.exists(f"{path}.json"):
+                        try:
+                            index = VectorIndex.load(path, embedder.dimensions, max_entries)
+                        except (OSError, ValueError):
+                            index = None
+                    entry = self._indexes[namespace] = (prepared['interface_id'],
+                                                        index or VectorIndex(embedder.dimensions, max_entries))
+        return entry[1]
+
+    def _stats(self, interface_id: str) -> SemanticCacheStats:
+        stats = self.stats.get(interface_id)
+        if stats is None:
+            stats = self.stats[interface_id] = SemanticCacheStats()
+        return stats
+
+    def get(self, prepared: Dict[str, Any], settings: Mapping[str, Any]) -> Tuple[Optional[str], float]:
+        """
+        Return (answer, similarity) for the nearest cached message, or (None,
+        similarity) when nothing reaches the interface's threshold.
+        """
+        started = time.perf_counter()
+        embedder = self._embedder(settings)
+        vector = embedder.embed([prepared['question']])[0]
+        answer, similarity = self._index(prepared, settings, embedder).search(vector, time.time())
+        stats = self._stats(prepared['interface_id'])
+        stats.latencies.append(time.perf_counter() - started)
+        if answer is not None and similarity >= float(settings.get('threshold', DEFAULT_THRESHOLD)):
+            stats.hits += 1
+            return answer, similarity
+        stats.misses += 1
+        return None, similarity
+
+    def set(self, prepared: Dict[str, Any], settings: Mapping[str, Any], value: str) -> None:
+        """Index a successful response under its message's embedding."""
+        embedder = self._embedder(settings)
+        vector = embedder.embed([prepared['question']])[0]
+        expires_at = time.time() + float(settings.get('ttl_seconds', 3600))
+        self._index(prepared, settings, embedder).add(vector, value, expires_at)
+
+    def save(self) -> None:
+        """Snapshot every index to the snapshot directory."""
+        for namespace, (_, index) in list(self._indexes.items()):
+            if len(index):
+                os.makedirs(self.snapshot_dir, exist_ok=True)
+                index.save(os.path.join(self.snapshot_dir, namespace))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return index sizes and per-interface counters."""
+        sizes: Dict[str, Dict[str, int]] = {}
+        for interface_id, index in list(self._indexes.values()):
+            size = sizes.setdefault(interface_id, {"entries": 0, "bytes": 0})
+            size["entries"] += len(index)
+            size["bytes"] += index.nbytes
+        return {
+            "interfaces": {interface_id: {**stats.as_dict(), **sizes.get(interface_id, {"entries": 0, "bytes": 0})}
+                           for interface_id, stats in self.stats.items()},
+        }
+
+_shared_cache: Optional[SemanticCache] = None
+
+def get_semantic_cache() -> SemanticCache:
+    """
+    Return the process-wide SemanticCache, creating it on first use.
+    """
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = SemanticCache()
+    return _shared_cache
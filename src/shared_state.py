@@ -0,0 +1,100 @@
+"""
+State shared by the worker processes of one server.
+
+With several workers (see run.py --production), each process has its own
+event loop, schedulers and in-memory caches. Rate-limit buckets and the
+response cache are shared through a SQLite file so the workers together
+respect a provider's limits and reuse each other's answers:
+
+    MOBAI_WORKERS             number of worker processes (default 1)
+    MOBAI_SHARED_STATE_PATH   SQLite file for shared rate-limit buckets; unset
+                              means in-process state (single worker)
+
+Provider concurrency limits are split evenly between the workers.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+def worker_count() -> int:
+    """Number of worker processes serving this app."""
+    return max(1, int(os.environ.get('MOBAI_WORKERS', '1')))
+
+def per_worker(limit: int) -> int:
+    """Split a server-wide limit between the workers, rounding up."""
+    return max(1, math.ceil(limit / worker_count()))
+
+def shared_state_path() -> Optional[str]:
+    return os.environ.get('MOBAI_SHARED_STATE_PATH') or None
+
+class BucketStore:
+    """
+    Token buckets kept in a SQLite file and updated atomically across processes.
+
+    Each take() runs in an IMMEDIATE transaction, so concurrent workers never
+    spend the same tokens twice.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _update(self, key: str, per_minute: float, change) -> float:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = per_minute if row is None else min(per_minute, row[0] + (now - row[1]) * per_minute / 60.0)
+                tokens, result = change(tokens)
+                self._conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (key, tokens, now))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def take(self, key: str, amount: float, per_minute: float) -> float:
+        """Take `amount` tokens if available. Returns 0.0, or the seconds to wait before trying again."""
+        def change(tokens):
+            if tokens >= amount:
+                return tokens - amount, 0.0
+            return tokens, (amount - tokens) * 60.0 / per_minute
+        return self._update(key, per_minute, change)
+
+    def pause(self, key: str, seconds: float, per_minute: float) -> None:
+        """Drain a bucket so no worker is admitted for roughly `seconds`."""
+        self._update(key, per_minute, lambda tokens: (min(tokens, -seconds * per_minute / 60.0), None))
+
+    def close(self) -> None:
+        self._conn.close()
+
+_shared_store: Optional[BucketStore] = None
+_store_lock = threading.Lock()
+
+def get_bucket_store() -> Optional[BucketStore]:
+    """
+    Return the process-wide BucketStore, or None when MOBAI_SHARED_STATE_PATH
+    is unset and buckets stay in-process.
+    """
+    global _shared_store
+    path = shared_state_path()
+    if path is None:
+        return None
+    if _shared_store is None or _shared_store.path != path:
+        with _store_lock:
+            if _shared_store is None or _shared_store.path != path:
+                _shared_store = BucketStore(path)
+    return _shared_store
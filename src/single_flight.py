@@ -0,0 +1,72 @@
+import asyncio
+import weakref
+from typing import Any, Awaitable, Callable, Dict
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one upstream call.
+
+    The first caller for a key starts the call; callers arriving while it is in
+    flight await the same result. Exceptions reach every waiter and nothing is
+    remembered once the call finishes, so failures are never cached. The shared
+    call is cancelled only when every waiter has gone away.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.upstream_calls = 0
+        self.deduplicated = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn() for key, or join the call already in flight for it.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.upstream_calls += 1
+        else:
+            self.deduplicated += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled():
+            # Mark the exception as retrieved even if every waiter was cancelled
+            call.task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "upstream_calls": self.upstream_calls,
+            "deduplicated": self.deduplicated,
+            "in_flight": len(self._calls),
+        }
+
+# Tasks belong to the loop that created them, so each loop gets its own group.
+_groups: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SingleFlight]" = weakref.WeakKeyDictionary()
+
+def get_single_flight() -> SingleFlight:
+    """
+    Return the SingleFlight group for the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    group = _groups.get(loop)
+    if group is None:
+        group = _groups[loop] = SingleFlight()
+    return group
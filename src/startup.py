@@ -0,0 +1,127 @@
+"""
+Warmup phase run before the server reports itself ready.
+
+Warmup parses every interface config, instantiates only the adaptors (and so
+the provider SDKs) those interfaces use, creates their pooled clients and
+loads the tokenizers of their models.
+With MOBAI_WARMUP_PING=1 it also probes each backend once in the background;
+GET /ready answers 503 until that finishes.
+
+Phase durations are reported by GET /ready, together with `startup_seconds`:
+the time from the first import of this module (early in src.main) until ready.
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from .log_config import log_event
+
+_imported_at = time.perf_counter()
+
+class Warmup:
+    """
+    Tracks warmup phases and whether the server is ready for traffic.
+    """
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = _imported_at if started is None else started
+        self.phases: Dict[str, float] = {}
+        self.backends: Dict[str, Dict[str, Any]] = {}
+        self.ready = False
+        self.startup_seconds: Optional[float] = None
+        self._pings: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def ping_enabled() -> bool:
+        return os.environ.get('MOBAI_WARMUP_PING', '0').lower() in ('1', 'true', 'yes')
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def start(self, ping: Optional[bool] = None) -> None:
+        """
+        Load configs and prewarm clients on the running event loop, then
+        either mark the server ready or start pinging the backends.
+        """
+        from .config_manager import get_config_manager
+        from .external_integration import prewarm_clients, prewarm_tokenizers
+
+        self.phases["imports"] = time.perf_counter() - self.started
+        with self.phase("configs"):
+            get_config_manager()
+        with self.phase("clients"):
+            prewarm_clients()
+        with self.phase("tokenizers"):
+            prewarm_tokenizers()
+        if self.ping_enabled() if ping is None else ping:
+            self._pings = asyncio.create_task(self._ping_backends())
+        else:
+            self._mark_ready()
+
+    async def _ping_backends(self) -> None:
+        from .config_manager import get_config_manager
+        from .external_integration import resolve_routes
+        from .model_adaptor import adaptor_name, get_adaptor
+        from .router import backend_name
+
+        async def probe(route):
+            try:
+                adaptor = get_adaptor(adaptor_name(route['model_provider'], route['model_config']))
+                return await adaptor.health(route['model_config'], api_key=route['api_key'])
+            except Exception as e:
+                return {"ok": False, "error": str(e)}
+
+        with self.phase("ping"):
+            routes = {}
+            for interface_id in list(get_config_manager().config_cache):
+                for route in resolve_routes(interface_id)[1] or ():
+                    routes.setdefault(backend_name(route), route)
+            results = await asyncio.gather(*(probe(route) for route in routes.values()))
+            self.backends = dict(zip(routes, results))
+        for name, result in self.backends.items():
+            if not result["ok"]:
+                log_event("warmup_ping_failed", logging.WARNING, backend=name, error=result.get("error"))
+        self._mark_ready()
+
+    def _mark_ready(self) -> None:
+        self.startup_seconds = time.perf_counter() - self.started
+        self.ready = True
+        log_event("ready", startup_seconds=round(self.startup_seconds, 4),
+                  phases={name: round(seconds, 4) for name, seconds in self.phases.items()})
+
+    async def stop(self) -> None:
+        """Report not-ready while shutting down and cancel pings still in flight."""
+        self.ready = False
+        if self._pings is not None and not self._pings.done():
+            self._pings.cancel()
+            try:
+                await self._pings
+            except asyncio.CancelledError:
+                pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "startup_seconds": self.startup_seconds,
+            "phases": dict(self.phases),
+            "backends": dict(self.backends),
+        }
+
+_warmup: Optional[Warmup] = None
+
+def get_warmup() -> Warmup:
+    """
+    Return the process-wide Warmup, creating it on first use.
+    """
+    global _warmup
+    if _warmup is None:
+        _warmup = Warmup()
+    return _warmup
@@ -0,0 +1,96 @@
+"""
+Typed classification outputs, parsed once where the provider's answer arrives.
+
+An interface whose answers are a label or a score declares them in config.yaml:
+
+    output:
+      type: label                # or 'score'
+      labels: [Positive, Negative, Neutral]
+      min: 0                     # score range, default 0-10
+      max: 10
+      json_mode: true            # ask the provider for {"label": ...} / {"score": n}
+
+An answer is reduced to its canonical value ('Negative', '7'), which is what
+the caches store and what AIResponse.response_text carries, with the typed
+value in AIResponse.label or AIResponse.score. Answers that cannot be parsed
+are returned as they are and never cached.
+"""
+import json
+import re
+from typing import Any, Dict, Mapping, Optional
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+def output_settings(interface_config: Mapping[str, Any]) -> Optional[Mapping[str, Any]]:
+    """Return the interface's `output` section, or None when it declares no typed output."""
+    settings = interface_config.get('output')
+    if not settings or settings.get('type') not in ('label', 'score'):
+        return None
+    return settings
+
+def _score_range(settings: Mapping[str, Any]):
+    return int(settings.get('min', 0)), int(settings.get('max', 10))
+
+def json_instruction(settings: Mapping[str, Any]) -> str:
+    """The system prompt suffix that asks for a JSON answer in json_mode."""
+    if settings['type'] == 'label':
+        choices = ", ".join(f'"{label}"' for label in settings.get('labels', ()))
+        return f'Reply only with JSON: {{"label": <one of {choices}>}}.'
+    low, high = _score_range(settings)
+    return f'Reply only with JSON: {{"score": <integer from {low} to {high}>}}.'
+
+def _label(text: str, labels) -> Optional[str]:
+    by_name = {str(label).lower(): str(label) for label in labels}
+    exact = by_name.get(text.strip().strip('"\'.!` ').lower())
+    if exact is not None:
+        return exact
+    # Otherwise accept a sentence that names exactly one of the labels
+    found = {by_name[match.lower()] for match in re.findall(
+        r"\b(" + "|".join(re.escape(name) for name in by_name) + r")\b", text, re.IGNORECASE)} if by_name else set()
+    return found.pop() if len(found) == 1 else None
+
+def _score(value: Any, settings: Mapping[str, Any]) -> Optional[str]:
+    low, high = _score_range(settings)
+    if isinstance(value, str):
+        # "On a scale of 0 to 10: 8" names three scores; only an unambiguous one is accepted
+        scores = {score for score in (round(float(number)) for number in _NUMBER.findall(value))
+                  if low <= score <= high}
+        return str(scores.pop()) if len(scores) == 1 else None
+    try:
+        score = round(float(value))
+    except (TypeError, ValueError):
+        return None
+    return str(score) if low <= score <= high else None
+
+def parse_output(text: str, settings: Mapping[str, Any]) -> Optional[str]:
+    """
+    Reduce a provider answer to its canonical label or score.
+
+    Accepts a JSON object with a 'label' or 'score' key (json_mode), a bare
+    value, or free text naming exactly one label / one in-range score.
+
+    Returns:
+        The canonical value as a string, or None if the answer does not parse.
+    """
+    key = settings['type']
+    value: Any = text
+    stripped = text.strip()
+    if stripped.startswith("{"):
+        try:
+            value = json.loads(stripped).get(key)
+        except (ValueError, AttributeError):
+            pass
+    if value is None:
+        return None
+    if key == 'score':
+        return _score(value, settings)
+    return _label(str(value), settings.get('labels', ()))
+
+def typed_fields(canonical: str, settings: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    The AIResponse fields for a canonical value: {'label': ...} or {'score': ...},
+    or {} for a value that is not canonical (e.g. cached before `output` was configured).
+    """
+    if settings['type'] == 'score':
+        return {"score": int(canonical)} if canonical.lstrip('-').isdigit() else {}
+    return {"label": canonical} if canonical in {str(label) for label in settings.get('labels', ())} else {}
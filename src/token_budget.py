@@ -0,0 +1,109 @@
+"""
+Token budgets for the messages sent to providers and the answers they return.
+
+An interface can cap both in config.yaml:
+
+    token_budget:
+      max_input_tokens: 512    # longer user messages are truncated
+      max_output_tokens: 5     # sent to the provider as max_tokens
+      truncation: head_tail    # keep the 'head', the 'tail', or both ends ('head_tail', default)
+
+Tokens are counted with tiktoken's encoding for the configured model when
+tiktoken is installed, loaded once per model, and otherwise estimated at
+about four characters per token.
+"""
+import logging
+from functools import lru_cache
+from typing import Any, List, Mapping, Optional
+
+from .log_config import log_event
+from .metrics import INPUT_TOKENS, INPUTS_TRUNCATED
+from .scheduler import estimate_tokens
+
+CHARS_PER_TOKEN = 4
+# Marks where head_tail truncation dropped the middle of a message
+ELLIPSIS = "\n[...]\n"
+
+class Tokenizer:
+    """
+    Counts and slices text in tokens of one tiktoken encoding, or in
+    four-character pieces when no encoding is available.
+    """
+
+    def __init__(self, encoding=None):
+        self.encoding = encoding
+
+    def encode(self, text: str) -> List[Any]:
+        if self.encoding is None:
+            return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+        return self.encoding.encode(text, disallowed_special=())
+
+    def decode(self, tokens: List[Any]) -> str:
+        return "".join(tokens) if self.encoding is None else self.encoding.decode(tokens)
+
+    def count(self, text: str) -> int:
+        if self.encoding is None:
+            return estimate_tokens(text)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model: Optional[str] = None) -> Tokenizer:
+    """
+    Return the tokenizer for a model, loading its encoding on first use.
+
+    Models tiktoken does not know (e.g. local ones) use o200k_base as an
+    approximation; without tiktoken, or offline without a cached encoding,
+    tokens are estimated.
+    """
+    try:
+        import tiktoken  # optional exact tokenizer
+    except ImportError:
+        return Tokenizer()
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model) if model else None
+        except KeyError:
+            encoding = None
+        return Tokenizer(encoding or tiktoken.get_encoding("o200k_base"))
+    except Exception as e:
+        log_event("tokenizer_unavailable", logging.WARNING, model=model, error=str(e))
+        return Tokenizer()
+
+def budget_settings(interface_config: Mapping[str, Any]) -> Optional[Mapping[str, Any]]:
+    """Return the interface's `token_budget` section, or None when it sets no budget."""
+    settings = interface_config.get('token_budget')
+    if not settings or not (settings.get('max_input_tokens') or settings.get('max_output_tokens')):
+        return None
+    return settings
+
+def truncate(tokenizer: Tokenizer, tokens: List[Any], max_tokens: int, strategy: str = "head_tail") -> str:
+    """Cut encoded text down to max_tokens, keeping its start, its end, or both."""
+    if strategy == "head":
+        return tokenizer.decode(tokens[:max_tokens])
+    if strategy == "tail":
+        return tokenizer.decode(tokens[-max_tokens:])
+    keep = max(max_tokens - len(tokenizer.encode(ELLIPSIS)), 0)
+    head, tail = keep - keep // 2, keep // 2
+    return tokenizer.decode(tokens[:head]) + ELLIPSIS + (tokenizer.decode(tokens[-tail:]) if tail else "")
+
+def fit_input(prepared: Mapping[str, Any]) -> str:
+    """
+    Return a prepared query's question within the interface's max_input_tokens,
+    truncated by its `truncation` strategy if needed, and record its size.
+    """
+    interface_id = prepared['interface_id']
+    question = prepared['question']
+    tokenizer = get_tokenizer((prepared.get('model_config') or {}).get('model'))
+    settings = budget_settings(prepared.get('interface_config') or {})
+    max_input = settings.get('max_input_tokens') if settings is not None else None
+    if not max_input:
+        INPUT_TOKENS.observe(tokenizer.count(question), interface_id)
+        return question
+    tokens = tokenizer.encode(question)
+    INPUT_TOKENS.observe(len(tokens), interface_id)
+    if len(tokens) <= max_input:
+        return question
+    INPUTS_TRUNCATED.inc(1, interface_id)
+    log_event("input_truncated", correlation_id=prepared.get('correlation_id'), interface_id=interface_id,
+              tokens=len(tokens), max_input_tokens=max_input)
+    return truncate(tokenizer, tokens, max_input, settings.get('truncation', 'head_tail'))
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# src.log_config starts its writer on import; keep test runs out of logs/
+os.environ.setdefault("MOBAI_LOG_FILE", os.path.join(tempfile.mkdtemp(prefix="mobai-test-logs-"), "test.log"))
@@ -0,0 +1,28 @@
+import os
+import shutil
+import tempfile
+import unittest
+from typing import Mapping
+from unittest.mock import patch
+
+from src import config_manager
+from src.config_manager import ConfigManager
+
+def serve_interfaces(test: unittest.TestCase, configs: Mapping[str, str]) -> str:
+    """
+    Write each interface's config.yaml to a temporary directory and serve them
+    through the shared ConfigManager until the test ends.
+
+    Returns:
+        str: The temporary directory, also usable for the test's own files.
+    """
+    interfaces_dir = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, interfaces_dir)
+    for interface_id, config in configs.items():
+        os.makedirs(os.path.join(interfaces_dir, interface_id))
+        with open(os.path.join(interfaces_dir, interface_id, "config.yaml"), "w") as file:
+            file.write(config)
+    manager = patch.object(config_manager, "_shared_manager", ConfigManager(interfaces_dir))
+    manager.start()
+    test.addCleanup(manager.stop)
+    return interfaces_dir
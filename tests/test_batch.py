@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from src import external_integration
+from src.external_integration import ConfigurationError, fetch_external_data_batch_async
+from src.schemas import AIResponse, error_info
+
+RESOLVED = {
+    "interface_id": "sentiment_analysis",
+    "interface_config": {},
+    "model_provider": "local_model",
+    "model_config": {"model_type": "ollama", "base_url": "http://localhost:11434", "model": "llama3.2"},
+    "system_prompt": "Classify",
+    "api_key": None,
+}
+
+class TestBatch(unittest.IsolatedAsyncioTestCase):
+
+    async def run_batch(self, items, provider, **kwargs):
+        async def answer(prepared):
+            return AIResponse(response_text=await provider(prepared))
+
+        with patch.object(external_integration, "resolve_model_config", return_value=(None, RESOLVED)), \
+             patch.object(external_integration, "query_provider_async", side_effect=answer):
+            return [r async for r in fetch_external_data_batch_async(
+                "sentiment_analysis", "local_model", items, retry_backoff=0, **kwargs)]
+
+    async def test_results_are_ordered_with_bounded_concurrency(self):
+        in_flight = 0
+        peak = 0
+
+        async def provider(prepared):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            # Later items finish first to exercise reordering
+            await asyncio.sleep(0.001 * (50 - int(prepared["question"])))
+            in_flight -= 1
+            return prepared["question"]
+
+        results = await self.run_batch([str(i) for i in range(50)], provider, concurrency=4)
+        self.assertEqual([r["response"] for r in results], [str(i) for i in range(50)])
+        self.assertLessEqual(peak, 4)
+
+    async def test_failed_items_are_retried_individually(self):
+        calls = {}
+
+        async def provider(prepared):
+            question = prepared["question"]
+            calls[question] = calls.get(question, 0) + 1
+            if question == "flaky" and calls[question] < 2:
+                raise ConnectionError("reset")
+            if question == "broken":
+                raise ConnectionError("down")
+            return "Neutral"
+
+        results = await self.run_batch(
+            [{"id": "a", "message": "ok"}, {"id": "b", "message": "flaky"}, {"id": "c", "message": "broken"}],
+            provider, max_retries=2)
+        self.assertEqual(results[0]["attempts"], 1)
+        self.assertEqual(results[1], {"index": 1, "id": "b", "response": "Neutral", "attempts": 2})
+        self.assertEqual(results[2]["attempts"], 3)
+        self.assertIn("down", results[2]["error"])
+        self.assertEqual(calls["ok"], 1)
+
+    async def test_packed_items_and_malformed_labels_are_reissued(self):
+        questions = []
+
+        async def provider(prepared):
+            questions.append(prepared["question"])
+            if "Texts:" in prepared["question"]:
+                # Items 3 and 4 are missing from the packed answer
+                return '```json\n{"results": [{"id": 1, "label": "Positive"}, {"id": 2, "label": "Negative"}]}\n```'
+            return "Neutral"
+
+        results = await self.run_batch(["good", "bad", "meh", "fine"], provider, pack=True, concurrency=1,
+                                       ordered=True)
+        self.assertEqual([r["response"] for r in results], ["Positive", "Negative", "Neutral", "Neutral"])
+        self.assertTrue(results[0]["packed"])
+        self.assertNotIn("packed", results[2])
+        self.assertEqual(len(questions), 3)
+        self.assertIn('"text": "fine"', questions[0])
+
+    async def test_invalid_configuration_raises(self):
+        with patch.object(external_integration, "resolve_model_config", return_value=(error_info("not_found", "Error: nope"), None)):
+            with self.assertRaises(ConfigurationError):
+                [r async for r in fetch_external_data_batch_async("missing", "openai", ["x"])]
+
+if __name__ == "__main__":
+    unittest.main()
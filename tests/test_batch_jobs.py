@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src import batch_jobs
+from src.batch_jobs import BatchJobManager, FakeBatchProvider, JobStore, read_input_file
+from src.external_integration import ConfigurationError
+
+RESOLVED = {
+    "interface_id": "sentiment_analysis",
+    "interface_config": {},
+    "model_provider": "openai",
+    "model_config": {"model": "gpt-4.1-2025-04-14", "api_key": "OPENAI_API_KEY", "system_prompt": "Classify"},
+    "system_prompt": "Classify",
+    "api_key": "sk-test",
+}
+
+def responder(body):
+    message = body["messages"][-1]["content"]
+    if message == "explode":
+        raise RuntimeError("rate limited")
+    return "Positive" if "love" in message else "Negative"
+
+class TestBatchJobs(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp, "jobs.sqlite3")
+        self.provider = FakeBatchProvider(responder, polls_until_complete=2)
+        patcher = patch.object(batch_jobs, "resolve_model_config", return_value=(None, RESOLVED))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def manager(self, **kwargs):
+        return BatchJobManager(JobStore(self.db_path), lambda resolved: self.provider, **kwargs)
+
+    async def test_job_joins_results_to_input_ids(self):
+        manager = self.manager(max_requests_per_batch=2)
+        items = [{"id": "r1", "message": "love it"}, {"id": "r2", "message": "dropped calls"},
+                 {"id": "r3", "message": "explode"}]
+        job_id = await manager.submit("sentiment_analysis", items)
+        self.assertEqual(manager.status(job_id)["status"], "submitted")
+        self.assertEqual(await manager.wait(job_id, poll_interval=0), "completed")
+
+        results = list(manager.results(job_id))
+        self.assertEqual([r["id"] for r in results], ["r1", "r2", "r3"])
+        self.assertEqual(results[0]["response"], "Positive")
+        self.assertEqual(results[1]["response"], "Negative")
+        self.assertIn("rate limited", results[2]["error"])
+        self.assertEqual(len(self.provider.batches), 2)
+
+        request = self.provider.files[next(iter(self.provider.batches.values()))["input_file_id"]]
+        self.assertIn(b'"model": "gpt-4.1-2025-04-14"', request)
+        self.assertIn(b'"content": "Classify"', request)
+
+    async def test_empty_messages_fail_without_displacing_other_items(self):
+        manager = self.manager(max_requests_per_batch=1)
+        items = [{"id": "a", "message": "love it"}, {"id": "b", "message": ""}, {"id": "c", "message": "calls drop"}]
+        job_id = await manager.submit("sentiment_analysis", items)
+        self.assertEqual(await manager.wait(job_id, poll_interval=0), "completed")
+
+        results = list(manager.results(job_id))
+        self.assertEqual([r["id"] for r in results], ["a", "b", "c"])
+        self.assertEqual((results[0]["response"], results[2]["response"]), ("Positive", "Negative"))
+        self.assertEqual(results[1]["error"], "Error: 'message' must be provided.")
+        self.assertEqual(len(self.provider.batches), 2)
+        self.assertEqual(manager.status(job_id)["failed"], 1)
+
+    async def test_restarted_manager_resumes_in_flight_jobs(self):
+        job_id = await self.manager().submit("sentiment_analysis", [{"id": 1, "message": "love it"}])
+
+        restarted = self.manager()
+        self.assertEqual(await restarted.resume_jobs(poll_interval=0), {job_id: "completed"})
+        self.assertEqual(list(restarted.results(job_id))[0]["response"], "Positive")
+        self.assertEqual(len(self.provider.batches), 1)
+
+    async def test_batch_support_follows_the_adaptor(self):
+        manager = BatchJobManager(JobStore(self.db_path))
+        vllm = {**RESOLVED, "model_provider": "vllm",
+                "model_config": {**RESOLVED["model_config"], "adaptor": "openai", "base_url": "http://vllm:8000/v1"}}
+        with patch.object(batch_jobs, "resolve_model_config", return_value=(None, vllm)):
+            resolved = manager._resolve("sentiment_analysis", "vllm")
+        client = manager._provider(resolved).client
+        self.assertEqual(str(client.base_url), "http://vllm:8000/v1/")
+        mock = {**RESOLVED, "model_provider": "mock", "model_config": {"system_prompt": "Classify"}}
+        with patch.object(batch_jobs, "resolve_model_config", return_value=(None, mock)):
+            with self.assertRaises(ConfigurationError):
+                manager._resolve("sentiment_analysis", "mock")
+
+    def test_read_input_file_accepts_ndjson_and_arrays(self):
+        ndjson = os.path.join(self.tmp, "in.ndjson")
+        with open(ndjson, "w") as file:
+            file.write('{"id": "a", "message": "hi"}\n"plain"\n')
+        self.assertEqual(list(read_input_file(ndjson)), [{"id": "a", "message": "hi"}, {"id": 1, "message": "plain"}])
+
+        array = os.path.join(self.tmp, "in.json")
+        with open(array, "w") as file:
+            file.write('["one", {"message": "two"}]')
+        self.assertEqual(list(read_input_file(array)), [{"id": 0, "message": "one"}, {"id": 1, "message": "two"}])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from fastapi.testclient import TestClient
+
+from benchmarks.mock_llm import MockSettings, create_app
+from benchmarks.run_benchmark import Gateway, compare, percentile
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertIsNone(percentile([], 95))
+
+    def test_compare_flags_throughput_and_p95_regressions(self):
+        def report(throughput, p95):
+            return {"results": [{"scenario": "query", "provider": "openai", "concurrency": 8,
+                                 "throughput_per_s": throughput, "latency_ms": {"p95": p95}}]}
+        self.assertEqual(compare(report(100, 50), report(95, 55), threshold=0.2), [])
+        self.assertEqual(len(compare(report(100, 50), report(50, 100), threshold=0.2)), 2)
+
+    def test_compare_flags_startup_regression(self):
+        baseline = {"startup": {"seconds": 1.0}, "results": []}
+        self.assertEqual(compare(baseline, {"startup": {"seconds": 1.1}, "results": []}, threshold=0.2), [])
+        self.assertEqual(compare(baseline, {"startup": {"seconds": 2.0}, "results": []}, threshold=0.2),
+                         ["startup: 1.0 -> 2.0 s"])
+
+    def test_gateway_keeps_its_state_in_the_workdir(self):
+        env = Gateway("/tmp/bench-run").env()
+        paths = {name: value for name, value in env.items()
+                 if name in ("MOBAI_LOG_FILE", "MOBAI_QUEUE_PATH", "MOBAI_CACHE_DISK_PATH",
+                             "MOBAI_SEMANTIC_CACHE_DIR", "MOBAI_JOB_DB")}
+        self.assertEqual(len(paths), 5)
+        self.assertTrue(all(path.startswith("/tmp/bench-run/") for path in paths.values()))
+
+    def test_mock_server_speaks_both_apis_and_injects_errors(self):
+        client = TestClient(create_app(MockSettings(latency=0, tokens_per_second=0, response_tokens=3)))
+        openai = client.post("/v1/chat/completions", json={"model": "m", "messages": [{"role": "user", "content": "hi"}]})
+        self.assertEqual(openai.json()["choices"][0]["message"]["content"], "tok0 tok1 tok2 ")
+        self.assertEqual(openai.json()["usage"]["completion_tokens"], 3)
+        ollama = client.post("/api/chat", json={"model": "m", "messages": [], "stream": True})
+        self.assertEqual(len(ollama.text.splitlines()), 4)
+
+        failing = TestClient(create_app(MockSettings(error_rate=1.0, error_status=429)))
+        response = failing.post("/api/chat", json={"model": "m", "messages": [], "stream": False})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("retry-after", response.headers)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.client_pool import ClientPool, get_client_pool
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, so a second request can reuse the first connection
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"models": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TestClientPool(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    async def test_clients_are_reused_within_a_loop_and_separate_across_loops(self):
+        pool = get_client_pool()
+        self.assertIs(get_client_pool(), pool)
+        openai = pool.get_openai_client("openai", "sk-test")
+        self.assertIs(pool.get_openai_client("openai", "sk-test"), openai)
+        self.assertIsNot(pool.get_openai_client("openai", "sk-test", "http://vllm:8000/v1"), openai)
+        self.assertIsNot(pool.get_openai_client("openai", "sk-other"), openai)
+        http = pool.get_http_client("local_model", self.base_url)
+        self.assertIs(pool.get_http_client("local_model", self.base_url), http)
+
+        async def other_loop():
+            return get_client_pool()
+
+        # httpx connections are bound to their loop, so another loop gets another pool
+        self.assertIsNot(await asyncio.to_thread(asyncio.run, other_loop()), pool)
+        self.assertNotIn("sk-test", "".join(pool.stats()))
+
+    async def test_stats_count_requests_and_reused_connections(self):
+        pool = ClientPool()
+        client = pool.get_http_client("local_model", self.base_url)
+        for _ in range(3):
+            self.assertEqual((await client.get(f"{self.base_url}/api/tags")).status_code, 200)
+        stats = pool.stats()[f"local_model@{self.base_url}"]
+        self.assertEqual((stats["requests"], stats["new_connections"], stats["open_connections"]), (3, 1, 1))
+        self.assertAlmostEqual(stats["reuse_ratio"], 2 / 3)
+        self.assertGreaterEqual(stats["total_wait_seconds"], 0.0)
+        await pool.aclose()
+
+    async def test_aclose_closes_clients_and_forgets_them(self):
+        pool = ClientPool()
+        client = pool.get_http_client("local_model", self.base_url)
+        await client.get(f"{self.base_url}/api/tags")
+        await pool.aclose()
+        self.assertTrue(client.is_closed)
+        self.assertEqual(pool.stats(), {})
+        # The next caller gets a fresh client rather than the closed one
+        self.assertIsNot(pool.get_http_client("local_model", self.base_url), client)
+        await pool.aclose()
+
+if __name__ == "__main__":
+    unittest.main()
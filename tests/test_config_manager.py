@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.config_manager import ConfigManager
+
+class TestConfigManager(unittest.TestCase):
+
+    def setUp(self):
+        self.interfaces_dir = tempfile.mkdtemp()
+        self.write_config("sentiment", "model_providers:\n  openai:\n    model: gpt-4.1\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.interfaces_dir)
+
+    def write_config(self, interface_id, content, mtime_ns=None):
+        os.makedirs(os.path.join(self.interfaces_dir, interface_id), exist_ok=True)
+        path = os.path.join(self.interfaces_dir, interface_id, "config.yaml")
+        with open(path, "w") as file:
+            file.write(content)
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    def test_loads_all_interfaces_at_startup(self):
+        manager = ConfigManager(self.interfaces_dir)
+        config = manager.get_configuration("sentiment")
+        self.assertEqual(config["model_providers"]["openai"]["model"], "gpt-4.1")
+        self.assertEqual(manager.reload_count, 1)
+        self.assertIn("sentiment", manager.load_times())
+
+    def test_configuration_is_read_only(self):
+        manager = ConfigManager(self.interfaces_dir)
+        with self.assertRaises(TypeError):
+            manager.get_configuration("sentiment")["model_providers"]["openai"]["model"] = "other"
+
+    def test_reloads_only_changed_interfaces(self):
+        self.write_config("at_risk", "model_providers: {}\n")
+        manager = ConfigManager(self.interfaces_dir)
+        self.assertEqual(manager.reload_changed(), [])
+
+        self.write_config("sentiment", "model_providers:\n  openai:\n    model: gpt-5\n", mtime_ns=1)
+        self.assertEqual(manager.reload_changed(), ["sentiment"])
+        self.assertEqual(manager.get_configuration("sentiment")["model_providers"]["openai"]["model"], "gpt-5")
+        self.assertEqual(manager.get_interface("sentiment").version, 2)
+        self.assertEqual(manager.get_interface("at_risk").version, 1)
+
+    def test_invalid_reload_keeps_previous_snapshot(self):
+        manager = ConfigManager(self.interfaces_dir)
+        self.write_config("sentiment", "model_providers: [1, 2]\n", mtime_ns=1)
+        self.assertEqual(manager.reload_changed(), [])
+        self.assertIn("sentiment", manager.load_errors)
+        self.assertEqual(manager.get_configuration("sentiment")["model_providers"]["openai"]["model"], "gpt-4.1")
+
+    def test_unknown_interface_raises_key_error(self):
+        manager = ConfigManager(self.interfaces_dir)
+        with self.assertRaises(KeyError):
+            manager.get_configuration("missing")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from src.deadline import DeadlineExceeded
+from src.external_integration import (fetch_external_data_async, fetch_external_data_batch_async,
+                                      prepare_query, stream_external_data)
+from src.main import _unless_disconnected
+from src.metrics import REQUESTS_ABORTED
+from src.model_adaptor import Completion, MockAdaptor
+
+from helpers import serve_interfaces
+
+CONFIG = """
+timeout_ms: 5000
+single_flight: false
+model_providers:
+  mock:
+    system_prompt: Classify
+    latency: 0.5
+"""
+
+class TestDeadline(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        serve_interfaces(self, {"slow": CONFIG})
+
+    async def test_query_and_batch_items_time_out_with_the_shorter_deadline(self):
+        timeouts = REQUESTS_ABORTED.value("slow", "mock", "", "timeout")
+        started = time.perf_counter()
+        result = await fetch_external_data_async({"interface_id": "slow", "question": "hi", "timeout_ms": 50})
+        self.assertLess(time.perf_counter() - started, 0.4)
+        self.assertEqual((result.error.kind, result.error.status_code), ("timeout", 504))
+
+        results = [r async for r in fetch_external_data_batch_async("slow", None, ["a", "b"], timeout_ms=50)]
+        self.assertEqual([r["error"] for r in results], ["Error: Request timed out after 50 ms."] * 2)
+        self.assertEqual(REQUESTS_ABORTED.value("slow", "mock", "", "timeout") - timeouts, 3)
+
+    async def test_stream_deadline_and_early_close_close_the_upstream_stream(self):
+        closed = []
+
+        async def stream(adaptor, model_config, messages, api_key=None):
+            try:
+                for word in ("one", "two", "three"):
+                    yield Completion(word)
+                    await asyncio.sleep(0.2)
+            finally:
+                closed.append(True)
+
+        with patch.object(MockAdaptor, "stream", stream):
+            _, routes = prepare_query({"interface_id": "slow", "question": "hi", "timeout_ms": 100})
+            tokens = []
+            with self.assertRaises(DeadlineExceeded):
+                async for token in stream_external_data(routes[0]):
+                    tokens.append(token)
+            self.assertEqual((tokens, closed), (["one"], [True]))
+
+            cancelled = REQUESTS_ABORTED.value("slow", "mock", "", "cancelled")
+            _, routes = prepare_query({"interface_id": "slow", "question": "hi"})
+            chunks = stream_external_data(routes[0])
+            self.assertEqual(await anext(chunks), "one")
+            await chunks.aclose()
+            self.assertEqual(closed, [True, True])
+            self.assertEqual(REQUESTS_ABORTED.value("slow", "mock", "", "cancelled") - cancelled, 1)
+
+    async def test_client_disconnect_cancels_the_query(self):
+        class Disconnecting:
+            async def receive(self):
+                await asyncio.sleep(0.05)
+                return {"type": "http.disconnect"}
+
+        cancelled = REQUESTS_ABORTED.value("slow", "mock", "", "cancelled")
+        work = fetch_external_data_async({"interface_id": "slow", "question": "hi"})
+        self.assertIsNone(await _unless_disconnected(Disconnecting(), work))
+        self.assertEqual(REQUESTS_ABORTED.value("slow", "mock", "", "cancelled") - cancelled, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import sqlite3
+import time
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from src import job_queue
+from src.job_queue import JobQueue, QueueWorkers
+from src.main import app
+from src.metrics import QUEUE_BACKLOG, QUEUE_JOBS
+from src.schemas import AIResponse, error_info
+
+from helpers import serve_interfaces
+
+CONFIG = """
+single_flight: false
+model_providers:
+  mock:
+    system_prompt: Classify
+"""
+
+def context(question, interface_id="queued"):
+    return {"interface_id": interface_id, "model_provider": None, "question": question, "timeout_ms": None}
+
+class TestJobQueue(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        tmp = serve_interfaces(self, {"queued": CONFIG})
+        self.queue = JobQueue(os.path.join(tmp, "queue.sqlite3"))
+
+    def tearDown(self):
+        self.queue.close()
+
+    def test_idempotent_submit_and_leases(self):
+        job, created = self.queue.submit(context("love it"), idempotency_key="k1")
+        again, created_again = self.queue.submit(context("love it"), idempotency_key="k1")
+        self.assertEqual((created, created_again, again["job_id"]), (True, False, job["job_id"]))
+        with self.assertRaises(ValueError):
+            self.queue.submit(context("something else"), idempotency_key="k1")
+
+        claimed = self.queue.claim(visibility_timeout=0, max_attempts=2)
+        self.assertEqual((claimed["attempts"], claimed["context"]["priority"]), (1, "batch"))
+        # The lease expired at once, so the job is delivered again and the first worker's lease is void
+        redelivered = self.queue.claim(visibility_timeout=60, max_attempts=2)
+        self.assertEqual(redelivered["attempts"], 2)
+        self.assertIsNone(self.queue.claim(visibility_timeout=60, max_attempts=2))
+        self.assertFalse(self.queue.complete(job["job_id"], 1, AIResponse(response_text="stale")))
+        self.assertTrue(self.queue.complete(job["job_id"], 2, AIResponse(response_text="Positive")))
+        self.assertEqual(self.queue.get(job["job_id"])["result"].response_text, "Positive")
+        self.assertEqual(self.queue.counts(), {"succeeded": 1})
+
+    def test_idle_claims_skip_the_write_lock_and_backlog_is_refreshed_on_demand(self):
+        writer = sqlite3.connect(self.queue.path, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            started = time.monotonic()
+            self.assertIsNone(self.queue.claim(visibility_timeout=60, max_attempts=3))
+            self.assertLess(time.monotonic() - started, 1)
+        finally:
+            writer.execute("ROLLBACK")
+            writer.close()
+
+        self.queue.submit(context("a"))
+        self.queue.submit(context("b"))
+        self.queue.claim(visibility_timeout=60, max_attempts=3)
+        self.queue.refresh_backlog()
+        self.assertEqual((QUEUE_BACKLOG.value("queued"), QUEUE_BACKLOG.value("running")), (1, 1))
+
+    async def test_workers_drain_the_queue_and_retry_unavailable_backends(self):
+        outcomes = iter([AIResponse(error=error_info("unavailable", "Error: every backend is down"))])
+
+        async def fetch(context):
+            return next(outcomes, None) or AIResponse(response_text=f"Answer to {context['question']}")
+
+        retried = QUEUE_JOBS.value("queued", "retried")
+        workers = QueueWorkers(self.queue, workers=2, max_attempts=3, poll_interval=0.01, retry_delay=0)
+        jobs = [self.queue.submit(context(question))[0]["job_id"] for question in ("a", "b", "c")]
+        with patch.object(job_queue, "fetch_external_data_async", fetch):
+            workers.start()
+            for _ in range(200):
+                if self.queue.counts().get("succeeded") == 3:
+                    break
+                await asyncio.sleep(0.01)
+            await workers.stop()
+        results = [self.queue.get(job_id)["result"].response_text for job_id in jobs]
+        self.assertEqual(results, ["Answer to a", "Answer to b", "Answer to c"])
+        self.assertEqual(QUEUE_JOBS.value("queued", "retried") - retried, 1)
+        self.assertEqual(sorted(self.queue.get(job_id)["attempts"] for job_id in jobs), [1, 1, 2])
+
+    def test_http_submit_and_poll(self):
+        client = TestClient(app)
+        with patch.dict(os.environ, {"MOBAI_QUEUE_PATH": self.queue.path}):
+            response = client.post("/v1/jobs", json={"interface_id": "queued", "message": "hi"},
+                                   headers={"Idempotency-Key": "abc"})
+            self.assertEqual(response.status_code, 202)
+            job_id = response.json()["job_id"]
+            again = client.post("/v1/jobs", json={"interface_id": "queued", "message": "hi", "idempotency_key": "abc"})
+            self.assertEqual((again.status_code, again.json()["job_id"]), (200, job_id))
+            self.assertEqual(client.post("/v1/jobs", json={"interface_id": "missing", "message": "hi"}).status_code,
+                             404)
+
+            claimed = self.queue.claim(visibility_timeout=60, max_attempts=3)
+            self.assertEqual(client.get(f"/v1/jobs/{job_id}").json()["status"], "running")
+            self.queue.complete(job_id, claimed["attempts"], AIResponse(error=error_info("provider", "Error: bad")))
+            body = client.get(f"/v1/jobs/{job_id}").json()
+            self.assertEqual((body["status"], body["error"]["status_code"]), ("failed", 502))
+            self.assertEqual(client.get("/v1/jobs/nope").status_code, 404)
+
+if __name__ == "__main__":
+    unittest.main()
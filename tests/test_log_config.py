@@ -0,0 +1,63 @@
+import logging
+import os
+import queue
+import tempfile
+import unittest
+
+from src.log_config import LogWriter, NonBlockingQueueHandler, limit_payload, new_correlation_id
+
+class TestLogConfig(unittest.TestCase):
+
+    def test_payloads_are_truncated_and_sampled_per_request(self):
+        event = limit_payload({"event": "api_response", "response": "x" * 50}, max_chars=10, sample_rate=1.0)
+        self.assertEqual(event["response"], "x" * 10)
+        self.assertEqual(event["response_chars"], 50)
+
+        correlation_id = new_correlation_id()
+        request = limit_payload({"correlation_id": correlation_id, "question": "q" * 5}, 0, 0.5)
+        response = limit_payload({"correlation_id": correlation_id, "response": "r" * 5}, 0, 0.5)
+        self.assertEqual(request["question"] is None, response["response"] is None)
+
+        dropped = limit_payload({"question": "hello"}, 0, 0.0)
+        self.assertEqual(dropped, {"question": None, "question_chars": 5})
+
+        # Missing and caller-supplied ids are sampled too
+        for correlation_id in (None, "order-42/retry"):
+            event = limit_payload({"correlation_id": correlation_id, "question": "x"}, 0, 0.5)
+            self.assertIn(event["question"], (None, "x"))
+
+    def test_correlation_ids_are_unique(self):
+        self.assertEqual(len({new_correlation_id() for _ in range(1000)}), 1000)
+
+    def test_writer_encodes_batches_and_rotates(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "app.log")
+            records = queue.Queue()
+            writer = LogWriter(records, path, max_bytes=200, backup_count=2, flush_interval=0.01)
+            handler = NonBlockingQueueHandler(records)
+            logger = logging.getLogger("test_log_config")
+            logger.propagate = False
+            logger.addHandler(handler)
+            try:
+                writer.start()
+                for i in range(20):
+                    logger.warning({"event": "test", "i": i})
+            finally:
+                logger.removeHandler(handler)
+                records.put(None)
+                writer.join(timeout=5)
+
+            self.assertTrue(os.path.exists(path + ".1"))
+            self.assertFalse(os.path.exists(path + ".3"))
+            with open(path + ".1", encoding="utf-8") as f:
+                self.assertIn('WARNING {"event": "test", "i":', f.read())
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+        record = logging.makeLogRecord({"msg": {"event": "x"}})
+        handler.emit(record)
+        handler.emit(record)
+        self.assertEqual(handler.dropped, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+
+from src.metrics import Counter, Histogram
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = Histogram("test_seconds", "Test latency.", ("interface",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, "a")
+        histogram.observe(0.5, "a")
+        histogram.observe(5.0, "a")
+        lines = histogram.samples()
+        self.assertIn('test_seconds_bucket{interface="a",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{interface="a",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{interface="a",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{interface="a"} 3', lines)
+        self.assertEqual(histogram.count("a"), 3)
+
+    def test_counter_escapes_label_values(self):
+        counter = Counter("test_total", "Test counter.", ("model",))
+        counter.inc(2, 'say "hi"')
+        self.assertEqual(counter.samples(), ['test_total{model="say \\"hi\\""} 2.0'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+import httpx
+
+from src.external_integration import ConfigurationError, format_provider_error, validate_model_config
+from src.model_adaptor import MockAdaptor, ProviderError, adaptor_name, get_adaptor
+
+MESSAGES = [{"role": "system", "content": "Classify"}, {"role": "user", "content": "great service"}]
+
+class TestModelAdaptor(unittest.IsolatedAsyncioTestCase):
+
+    async def test_mock_adaptor_completes_streams_and_batches(self):
+        adaptor = MockAdaptor()
+        completion = await adaptor.complete({"response": "Positive"}, MESSAGES)
+        self.assertEqual(completion.text, "Positive")
+        self.assertGreater(completion.prompt_tokens, 0)
+
+        pieces = [chunk async for chunk in adaptor.stream({}, MESSAGES)]
+        self.assertEqual("".join(chunk.text for chunk in pieces).strip(), "Mock response to: great service")
+        self.assertIsNotNone(pieces[-1].completion_tokens)
+
+        results = await adaptor.batch({"error": "down"}, [MESSAGES, MESSAGES])
+        self.assertTrue(all(isinstance(result, ProviderError) for result in results))
+
+    async def test_health_reports_failures(self):
+        class Broken(MockAdaptor):
+            async def _probe(self, model_config, api_key):
+                raise ConnectionError("refused")
+        self.assertEqual((await MockAdaptor().health({}))["ok"], True)
+        self.assertEqual((await Broken().health({}))["error"], "refused")
+
+    def test_providers_select_adaptors_by_name_or_alias(self):
+        self.assertIsInstance(get_adaptor(adaptor_name("fake", {"adaptor": "mock"})), MockAdaptor)
+        validate_model_config({"adaptor": "mock", "system_prompt": "x"}, "fake", "demo")
+        with self.assertRaisesRegex(ConfigurationError, "No adaptor registered"):
+            validate_model_config({"system_prompt": "x"}, "unknown", "demo")
+        with self.assertRaisesRegex(ConfigurationError, "Unsupported local model type"):
+            validate_model_config({"model_type": "llamacpp", "base_url": "http://x", "model": "m",
+                                   "system_prompt": "x"}, "local_model", "demo")
+
+    def test_errors_are_worded_by_the_backends_adaptor(self):
+        # An Ollama server under another provider name still gets the local model wording
+        ollama = {"model_provider": "gpu_box", "model_config": {"adaptor": "local_model", "base_url": "http://gpu:11434"}}
+        error = format_provider_error(ollama, httpx.ConnectError("refused"))
+        self.assertEqual(error.kind, "unavailable")
+        self.assertIn("Could not connect to local model service at http://gpu:11434", error.message)
+        self.assertIn("from local model", format_provider_error(ollama, ValueError("bad JSON")).message)
+
+        openai = {"model_provider": "openai", "model_config": {}}
+        self.assertEqual(format_provider_error(openai, ValueError("no key")).kind, "configuration")
+        self.assertEqual(format_provider_error(openai, RuntimeError("boom")).message,
+                         "Error fetching data from openai: boom")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+
+from src.packing import max_items, pack_question, packing_settings, parse_pack_response
+
+class TestPacking(unittest.TestCase):
+
+    def test_settings_are_opt_in(self):
+        self.assertIsNone(packing_settings({}))
+        self.assertIsNone(packing_settings({"packing": {"enabled": True}}, enabled=False))
+        settings = packing_settings({"packing": {"enabled": True, "max_items": 5}})
+        self.assertEqual(max_items(settings), 5)
+        self.assertEqual(max_items(packing_settings({}, enabled=True)), 20)
+
+    def test_question_numbers_texts_as_json(self):
+        question = pack_question(["first\\n2. not an item", "second"])
+        self.assertIn('{"id": 1, "text": "first\\\\n2. not an item"}', question)
+        self.assertIn("every id from 1 to 2", question)
+
+    def test_malformed_entries_are_left_out(self):
+        response = ('Here you go: {"results": [{"id": 1, "label": 10}, {"id": 2, "label": "maybe"}, '
+                    '{"id": 3, "label": "0"}, {"id": 3, "label": "1"}, {"id": 7, "label": "0"}, {"id": 4}]}')
+        labels = [str(score) for score in range(11)]
+        self.assertEqual(parse_pack_response(response, 4, labels), {1: "10"})
+        self.assertEqual(parse_pack_response(response, 4), {1: "10", 2: "maybe"})
+        self.assertEqual(parse_pack_response("not json", 4), {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src import external_integration
+from src.external_integration import fetch_external_data_batch_async
+from src.preclassifier import Preclassifier, examples_from_logs, train
+from src.schemas import AIResponse
+
+SETTINGS = {
+    "enabled": True,
+    "threshold": 0.9,
+    "empty_label": "0",
+    "rules": [{"pattern": r"switch(ing)? to (t-mobile|at&t)", "label": "10"},
+              {"pattern": "maybe", "label": "5", "confidence": 0.5}],
+}
+
+EXAMPLES = ([("love the service", "Positive"), ("great coverage love it", "Positive"),
+             ("fast and great", "Positive")] * 10
+            + [("terrible coverage", "Negative"), ("slow and terrible support", "Negative"),
+               ("awful dropped calls", "Negative")] * 10)
+
+class TestPreclassifier(unittest.IsolatedAsyncioTestCase):
+
+    def test_rules_threshold_and_stats(self):
+        preclassifier = Preclassifier()
+        predictions = preclassifier.classify("at_risk", SETTINGS, ["  ", "I'm switching to T-Mobile", "maybe", "ok"])
+        self.assertEqual([(p.label, p.source) if p else None for p in predictions],
+                         [("0", "empty"), ("10", "rule"), None, None])
+        stats = preclassifier.stats()["at_risk"]
+        self.assertEqual((stats["requests"], stats["answered"], stats["hit_rate"]), (4, 2, 0.5))
+
+    def test_model_trained_from_logs_answers_confident_inputs(self):
+        lines = ['2026-01-01 00:00:00,000 INFO not json']
+        for i, (question, answer) in enumerate(EXAMPLES):
+            lines.append(f'x INFO {{"event": "api_request", "correlation_id": "{i}", '
+                         f'"interface_id": "sentiment", "question": "{question}"}}')
+            lines.append(f'x INFO {{"event": "api_response", "correlation_id": "{i}", '
+                         f'"interface_id": "sentiment", "response": "{answer}\\n"}}')
+        examples = examples_from_logs(lines, "sentiment")
+        self.assertEqual(examples, EXAMPLES)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            train(examples).save(os.path.join(tmp, "model.npz"))
+            preclassifier = Preclassifier(interfaces_dir=tmp)
+            settings = {"enabled": True, "threshold": 0.8, "model": os.path.join(tmp, "model.npz")}
+            love, awful, unknown = preclassifier.classify("sentiment", settings,
+                                                          ["I love it", "awful, terrible", "the bill arrived"])
+        self.assertEqual((love.label, love.source), ("Positive", "model"))
+        self.assertEqual(awful.label, "Negative")
+        self.assertIsNone(unknown)
+
+    async def test_batch_forwards_only_uncertain_items(self):
+        resolved = {"interface_id": "at_risk", "interface_config": {"preclassifier": SETTINGS},
+                    "model_provider": "local_model", "model_config": {"model": "m"},
+                    "system_prompt": "Score", "api_key": None}
+        forwarded = []
+
+        async def provider(prepared):
+            forwarded.append(prepared["question"])
+            return AIResponse(response_text="3")
+
+        with patch.object(external_integration, "resolve_model_config", return_value=(None, resolved)), \
+             patch.object(external_integration, "query_provider_async", side_effect=provider):
+            results = [r async for r in fetch_external_data_batch_async(
+                "at_risk", "local_model", ["switching to AT&T now", "bill is high"], concurrency=2)]
+        self.assertEqual(forwarded, ["bill is high"])
+        self.assertEqual((results[0]["response"], results[0]["preclassified"]), ("10", True))
+        self.assertEqual(results[1], {"index": 1, "id": 1, "response": "3", "attempts": 1})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from types import SimpleNamespace
+
+from src.model_adaptor import _cached_tokens
+from src.prompt_orchestrator import PromptOrchestrator, build_prompt
+
+def prepared(question, version=1, system_prompt="Classify the sentiment."):
+    return {"interface_id": "sentiment", "model_provider": "openai", "config_version": version,
+            "system_prompt": system_prompt, "question": question}
+
+class TestPromptOrchestrator(unittest.TestCase):
+
+    def test_system_prefix_is_shared_and_first(self):
+        orchestrator = PromptOrchestrator()
+        first = orchestrator.messages(prepared("great service"))
+        second = orchestrator.messages(prepared("slow delivery"))
+        self.assertIs(first[0], second[0])
+        self.assertEqual(first[0], {"role": "system", "content": "Classify the sentiment."})
+        self.assertEqual(second[1], {"role": "user", "content": "slow delivery"})
+        stats = orchestrator.stats()["sentiment"]
+        self.assertEqual((stats["requests"], stats["compilations"]), (2, 1))
+        self.assertEqual(stats["prefix_tokens_sent"], 2 * stats["system_prompt_tokens"])
+
+    def test_recompiles_when_config_version_changes(self):
+        orchestrator = PromptOrchestrator()
+        old = orchestrator.messages(prepared("hi"))[0]
+        new = orchestrator.messages(prepared("hi", version=2, system_prompt="Reply in French."))[0]
+        self.assertIsNot(old, new)
+        self.assertEqual(new["content"], "Reply in French.")
+        self.assertEqual(orchestrator.stats()["sentiment"]["compilations"], 2)
+
+    def test_cached_tokens_and_prompt_order(self):
+        usage = SimpleNamespace(prompt_tokens=1200, prompt_tokens_details=SimpleNamespace(cached_tokens=1024))
+        self.assertEqual(_cached_tokens(usage), 1024)
+        self.assertIsNone(_cached_tokens(SimpleNamespace(prompt_tokens=10)))
+        prompt = build_prompt("System", "Hello", {"external_data": "42"})
+        self.assertTrue(prompt.startswith("System\n"))
+        self.assertTrue(prompt.endswith("User: Hello\nAI:"))
+
+if __name__ == "__main__":
+    unittest.main()
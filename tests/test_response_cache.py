@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.response_cache import ResponseCache
+
+def prepared(question, interface_id="sentiment_analysis", system_prompt="Classify"):
+    return {
+        "interface_id": interface_id,
+        "model_provider": "openai",
+        "model_config": {"model": "gpt-4.1-2025-04-14"},
+        "system_prompt": system_prompt,
+        "question": question,
+    }
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.disk_path = os.path.join(self.tmp, "cache.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    async def test_hit_after_set_with_normalized_message(self):
+        cache = ResponseCache(max_entries=10, disk_path=self.disk_path)
+        settings = {"enabled": True, "case_sensitive": False}
+        self.assertIsNone(await cache.get(prepared("Great service"), settings))
+        await cache.set(prepared("Great service"), settings, "Positive")
+        self.assertEqual(await cache.get(prepared("  great   SERVICE "), settings), "Positive")
+        self.assertIsNone(await cache.get(prepared("Great service", system_prompt="Other"), settings))
+        stats = cache.snapshot()["interfaces"]["sentiment_analysis"]
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    async def test_lru_eviction_and_ttl(self):
+        cache = ResponseCache(max_entries=2, disk_path=self.disk_path)
+        settings = {"enabled": True, "ttl_seconds": 60}
+        for text in ("a", "b", "c"):
+            await cache.set(prepared(text), settings, text.upper())
+        self.assertIsNone(await cache.get(prepared("a"), settings))
+        self.assertEqual(cache.snapshot()["interfaces"]["sentiment_analysis"]["evictions"], 1)
+
+        with patch("src.response_cache.time.time", return_value=10**12):
+            self.assertIsNone(await cache.get(prepared("c"), settings))
+        self.assertEqual(cache.snapshot()["interfaces"]["sentiment_analysis"]["expirations"], 1)
+
+    async def test_disk_tier_survives_restart(self):
+        settings = {"enabled": True, "disk": True}
+        await ResponseCache(disk_path=self.disk_path).set(prepared("No comment"), settings, "Neutral")
+        restarted = ResponseCache(disk_path=self.disk_path)
+        self.assertEqual(await restarted.get(prepared("No comment"), settings), "Neutral")
+        self.assertEqual(restarted.snapshot()["interfaces"]["sentiment_analysis"]["disk_hits"], 1)
+
+    def test_caching_is_opt_in(self):
+        self.assertIsNone(ResponseCache.settings({}))
+        self.assertIsNone(ResponseCache.settings({"cache": {"enabled": False}}))
+        self.assertEqual(ResponseCache.settings({"cache": {"enabled": True}}), {"enabled": True})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+from src.router import OPEN, AllBackendsFailed, Router, backend_name
+from src.scheduler import is_retryable
+
+def route(provider, base_url=None, routing=None):
+    return {
+        "interface_id": "sentiment_analysis",
+        "interface_config": {"routing": routing or {}},
+        "model_provider": provider,
+        "model_config": {"base_url": base_url} if base_url else {},
+        "question": "hi",
+    }
+
+class TestRouter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_fails_over_on_connection_error(self):
+        router = Router()
+        seen = []
+
+        async def call(prepared):
+            seen.append((backend_name(prepared), prepared.get("allow_retry")))
+            if prepared["model_provider"] == "openai":
+                raise httpx.ConnectError("refused")
+            return "ok"
+
+        result = await router.run([route("openai"), route("local_model", "http://a")], call, is_retryable)
+        self.assertEqual(result, "ok")
+        self.assertEqual(seen, [("openai@default", False), ("local_model@http://a", None)])
+
+    async def test_non_transient_errors_do_not_fail_over(self):
+        router = Router()
+
+        async def call(prepared):
+            raise ValueError("bad request")
+
+        with self.assertRaises(AllBackendsFailed) as raised:
+            await router.run([route("openai"), route("local_model", "http://a")], call, is_retryable)
+        self.assertEqual(raised.exception.prepared["model_provider"], "openai")
+
+    async def test_circuit_opens_and_is_reprobed(self):
+        router = Router()
+        routing = {"failure_threshold": 2, "reset_timeout": 10}
+        a, b = route("local_model", "http://a", routing), route("local_model", "http://b", routing)
+        router.observe(a, 0.1, ok=False)
+        router.observe(a, 0.1, ok=False)
+        self.assertEqual(router.health(backend_name(a)).state, OPEN)
+        self.assertEqual([backend_name(r) for r in router.order([a, b])], ["local_model@http://b", "local_model@http://a"])
+
+        with patch("src.router.time.monotonic", return_value=router.health(backend_name(a)).opened_at + 11):
+            self.assertEqual(router.order([a, b])[0], a)
+        router.observe(a, 0.1, ok=True)
+        self.assertEqual(router.stats()["local_model@http://a"]["state"], "closed")
+
+    async def test_half_open_circuit_lets_one_probe_through(self):
+        router = Router()
+        routing = {"failure_threshold": 1, "reset_timeout": 10}
+        a, b = route("local_model", "http://a", routing), route("local_model", "http://b", routing)
+        router.observe(a, 0.1, ok=False)
+        release = asyncio.Event()
+        seen = []
+
+        async def call(prepared):
+            seen.append(backend_name(prepared))
+            if backend_name(prepared) == "local_model@http://a":
+                await release.wait()
+            router.observe(prepared, 0.1, ok=True)
+            return backend_name(prepared)
+
+        with patch("src.router.time.monotonic", return_value=router.health(backend_name(a)).opened_at + 11):
+            probe = asyncio.create_task(router.run([a, b], call, is_retryable))
+            await asyncio.sleep(0)
+            # The probe is still in flight, so the others fail over to b
+            self.assertEqual(await router.run([a, b], call, is_retryable), "local_model@http://b")
+            self.assertEqual(await router.run([a, b], call, is_retryable), "local_model@http://b")
+            release.set()
+            self.assertEqual(await probe, "local_model@http://a")
+        self.assertEqual(seen.count("local_model@http://a"), 1)
+        self.assertEqual(router.stats()["local_model@http://a"]["state"], "closed")
+        self.assertEqual(await router.run([a, b], call, is_retryable), "local_model@http://a")
+
+    async def test_failover_log_names_the_backend_actually_tried(self):
+        router = Router()
+        routing = {"failure_threshold": 1, "reset_timeout": 10}
+        a, b, c = (route("local_model", url, routing) for url in ("http://a", "http://b", "http://c"))
+        router.observe(b, 0.1, ok=False)
+
+        async def call(prepared):
+            if backend_name(prepared) == "local_model@http://a":
+                # Meanwhile another request claims b's probe, so this one skips b
+                router.health(backend_name(b)).begin_probe()
+                raise httpx.ConnectError("refused")
+            return backend_name(prepared)
+
+        with patch("src.router.log_event") as log_event, \
+                patch("src.router.time.monotonic", return_value=router.health(backend_name(b)).opened_at + 11):
+            self.assertEqual(await router.run([a, b, c], call, is_retryable), "local_model@http://c")
+        failovers = [call.kwargs for call in log_event.call_args_list if call.args[0] == "provider_failover"]
+        self.assertEqual([(kwargs["from"], kwargs["to"]) for kwargs in failovers],
+                         [("local_model@http://a", "local_model@http://c")])
+
+    def test_latency_policy_prefers_faster_backend(self):
+        router = Router()
+        routing = {"policy": "latency"}
+        fast, slow = route("local_model", "http://fast", routing), route("local_model", "http://slow", routing)
+        for _ in range(20):
+            router.observe(fast, 0.01, ok=True)
+            router.observe(slow, 1.0, ok=True)
+        firsts = [backend_name(router.order([slow, fast])[0]) for _ in range(200)]
+        self.assertGreater(firsts.count("local_model@http://fast"), 150)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from src.external_integration import ProviderError
+from src.scheduler import ProviderScheduler, TokenBucket
+
+class TestProviderScheduler(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrency_limit_and_priority_order(self):
+        scheduler = ProviderScheduler("local_model@test", {"max_concurrency": 1})
+        release = asyncio.Event()
+        order = []
+
+        async def blocker():
+            await release.wait()
+
+        async def record(name):
+            order.append(name)
+
+        first = asyncio.create_task(scheduler.run(blocker))
+        await asyncio.sleep(0)
+        batch = asyncio.create_task(scheduler.run(lambda: record("batch"), priority="batch"))
+        interactive = asyncio.create_task(scheduler.run(lambda: record("interactive")))
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.stats()["queued"], {"interactive": 1, "batch": 1})
+
+        release.set()
+        await asyncio.gather(first, batch, interactive)
+        self.assertEqual(order, ["interactive", "batch"])
+        self.assertEqual(scheduler.stats()["active"], 0)
+
+    async def test_retries_honor_retry_after(self):
+        scheduler = ProviderScheduler("openai@test", {"max_retries": 2})
+        attempts = 0
+
+        async def flaky():
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                raise ProviderError("slow down", status_code=429, retry_after=7)
+            return "Positive"
+
+        with patch("src.scheduler.asyncio.sleep") as sleep:
+            self.assertEqual(await scheduler.run(flaky), "Positive")
+        sleep.assert_called_once_with(7.0)
+        self.assertEqual(scheduler.stats()["rate_limited"], 1)
+
+    async def test_non_retryable_errors_are_raised_immediately(self):
+        scheduler = ProviderScheduler("openai@test", {"max_retries": 3})
+        attempts = 0
+
+        async def bad_request():
+            nonlocal attempts
+            attempts += 1
+            raise ProviderError("bad request", status_code=400)
+
+        with self.assertRaises(ProviderError):
+            await scheduler.run(bad_request)
+        self.assertEqual(attempts, 1)
+
+    async def test_token_bucket_waits_for_refill(self):
+        bucket = TokenBucket(60)
+        self.assertEqual(await bucket.take(60), 0.0)
+        with patch("src.scheduler.asyncio.sleep") as sleep:
+            sleep.side_effect = lambda delay: setattr(bucket, "tokens", bucket.tokens + delay)
+            await bucket.take(2)
+        self.assertAlmostEqual(sleep.call_args[0][0], 2.0, places=2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import re
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from src.external_integration import fetch_external_data_batch_async
+from src.model_adaptor import Completion, MockAdaptor
+from src.semantic_cache import HashedEmbedder, SemanticCache, VectorIndex
+
+from helpers import serve_interfaces
+
+SETTINGS = {"enabled": True, "threshold": 0.85, "ttl_seconds": 60}
+
+def prepared(question, system_prompt="Score churn risk"):
+    return {"interface_id": "at_risk", "model_provider": "openai", "model_config": {"model": "gpt"},
+            "system_prompt": system_prompt, "question": question}
+
+PACKED_CONFIG = """
+single_flight: false
+semantic_cache:
+  enabled: true
+packing:
+  enabled: true
+  labels: [Positive, Negative]
+model_providers:
+  mock:
+    system_prompt: Classify
+"""
+
+class TestSemanticCache(unittest.IsolatedAsyncioTestCase):
+
+    def test_near_duplicates_hit_and_other_messages_miss(self):
+        cache = SemanticCache(snapshot_dir=tempfile.mkdtemp())
+        cache.set(prepared("My calls keep dropping!"), SETTINGS, "7")
+        self.assertEqual(cache.get(prepared("calls keep dropping"), SETTINGS)[0], "7")
+        self.assertIsNone(cache.get(prepared("the bill is too high"), SETTINGS)[0])
+        # A different system prompt never reuses answers
+        self.assertIsNone(cache.get(prepared("My calls keep dropping!", "Other"), SETTINGS)[0])
+        stats = cache.snapshot()["interfaces"]["at_risk"]
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 2, 1))
+        self.assertGreater(stats["bytes"], 0)
+
+    def test_snapshot_is_memory_mapped_and_writable_after_insert(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = SemanticCache(snapshot_dir=tmp)
+            cache.set(prepared("switching to another carrier"), SETTINGS, "10")
+            cache.save()
+
+            restored = SemanticCache(snapshot_dir=tmp)
+            self.assertEqual(restored.get(prepared("switching to another carrier"), SETTINGS)[0], "10")
+            index = next(iter(restored._indexes.values()))[1]
+            self.assertIsInstance(index.vectors, np.memmap)
+            restored.set(prepared("love it"), SETTINGS, "0")
+            self.assertEqual(restored.get(prepared("love it"), SETTINGS)[0], "0")
+            self.assertEqual(len(index), 2)
+
+    def test_index_expires_and_overwrites_oldest(self):
+        embedder = HashedEmbedder(64)
+        index = VectorIndex(64, max_entries=2)
+        first, second, third = embedder.embed(["one", "two", "three"])
+        index.add(first, "1", expires_at=100.0)
+        index.add(second, "2", expires_at=200.0)
+        self.assertEqual(index.search(first, now=150.0)[0], "2")
+        index.add(third, "3", expires_at=200.0)
+        self.assertEqual(index.answers, ["3", "2"])
+        answer, similarity = index.search(third, now=150.0)
+        self.assertEqual(answer, "3")
+        self.assertAlmostEqual(similarity, 1.0, places=5)
+
+    async def test_packs_of_different_messages_never_share_answers(self):
+        serve_interfaces(self, {"packed": PACKED_CONFIG})
+        calls = []
+
+        async def complete(adaptor, model_config, messages, api_key=None):
+            texts = re.findall(r'"text": "([^"]*)"', messages[-1]["content"])
+            calls.append(texts)
+            return Completion(json.dumps({"results": [
+                {"id": i, "label": "Positive" if "love" in text else "Negative"}
+                for i, text in enumerate(texts, start=1)]}))
+
+        with patch.object(MockAdaptor, "complete", complete):
+            first = [r async for r in fetch_external_data_batch_async("packed", None, ["love it", "so good, love"])]
+            second = [r async for r in fetch_external_data_batch_async("packed", None, ["calls drop", "awful bill"])]
+        self.assertEqual([r["response"] for r in first], ["Positive", "Positive"])
+        self.assertEqual([r["response"] for r in second], ["Negative", "Negative"])
+        self.assertEqual(len(calls), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from src.model_adaptor import ProviderError
+from src.response_cache import ResponseCache
+from src.scheduler import ProviderScheduler, SharedTokenBucket
+from src.shared_state import BucketStore
+
+class TestSharedState(unittest.IsolatedAsyncioTestCase):
+
+    def test_stores_on_one_file_share_tokens(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "state.sqlite3")
+            first, second = BucketStore(path), BucketStore(path)
+            self.assertEqual(first.take("openai:rpm", 1, per_minute=2), 0.0)
+            self.assertEqual(second.take("openai:rpm", 1, per_minute=2), 0.0)
+            # Both workers' requests came out of one bucket of two
+            self.assertGreater(first.take("openai:rpm", 1, per_minute=2), 0.0)
+            second.pause("openai:tpm", 30, per_minute=600)
+            self.assertGreater(first.take("openai:tpm", 1, per_minute=600), 29.0)
+            first.close()
+            second.close()
+
+    async def test_workers_split_concurrency_and_share_buckets(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+             patch.dict(os.environ, {"MOBAI_WORKERS": "4", "MOBAI_SHARED_STATE_PATH": os.path.join(tmp, "s.db")}):
+            scheduler = ProviderScheduler("openai@KEY", {"max_concurrency": 10, "requests_per_minute": 6000})
+            self.assertEqual(scheduler.max_concurrency, 3)
+            self.assertIsInstance(scheduler.rpm_bucket, SharedTokenBucket)
+            self.assertEqual(await scheduler.rpm_bucket.take(1), 0.0)
+
+            errors = [ProviderError("slow down", status_code=429, retry_after=0.05)]
+            paused_on = []
+            store_pause = scheduler.rpm_bucket.store.pause
+
+            async def flaky():
+                if errors:
+                    raise errors.pop()
+                return "Positive"
+
+            def pause(*args):
+                paused_on.append(threading.current_thread())
+                store_pause(*args)
+
+            with patch.object(scheduler.rpm_bucket.store, "pause", pause):
+                self.assertEqual(await scheduler.run(flaky), "Positive")
+            # The shared bucket's SQLite write never runs on the event loop thread
+            self.assertEqual(len(paused_on), 1)
+            self.assertIsNot(paused_on[0], threading.current_thread())
+
+    async def test_shared_response_cache_reads_other_workers_answers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.sqlite3")
+            prepared = {"interface_id": "at_risk", "model_provider": "openai", "model_config": {"model": "m"},
+                        "system_prompt": "S", "question": "calls drop"}
+            settings = {"enabled": True}
+            await ResponseCache(disk_path=path, shared=True).set(prepared, settings, "7")
+            self.assertEqual(await ResponseCache(disk_path=path, shared=True).get(prepared, settings), "7")
+            self.assertIsNone(await ResponseCache(disk_path=path, shared=False).get(prepared, settings))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from src import external_integration
+from src.external_integration import prepare_query, query_provider_async
+from src.model_adaptor import Completion
+from src.single_flight import SingleFlight
+
+from helpers import serve_interfaces
+
+CONFIG = """
+model_providers:
+  mock:
+    system_prompt: Classify
+"""
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrent_calls_share_one_upstream_call(self):
+        group = SingleFlight()
+        calls = 0
+
+        async def upstream():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "Negative"
+
+        results = await asyncio.gather(*(group.do("key", upstream) for _ in range(5)))
+        self.assertEqual(results, ["Negative"] * 5)
+        self.assertEqual(calls, 1)
+        self.assertEqual(group.stats(), {"upstream_calls": 1, "deduplicated": 4, "in_flight": 0})
+
+    async def test_failure_reaches_every_waiter_and_is_not_cached(self):
+        group = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ConnectionError("upstream down")
+
+        results = await asyncio.gather(*(group.do("key", failing) for _ in range(3)), return_exceptions=True)
+        self.assertTrue(all(isinstance(r, ConnectionError) for r in results))
+
+        async def healthy():
+            return "Positive"
+
+        self.assertEqual(await group.do("key", healthy), "Positive")
+        self.assertEqual(group.stats()["upstream_calls"], 2)
+
+    async def test_cancelled_waiter_does_not_cancel_shared_call(self):
+        group = SingleFlight()
+        release = asyncio.Event()
+
+        async def upstream():
+            await release.wait()
+            return "Neutral"
+
+        first = asyncio.create_task(group.do("key", upstream))
+        second = asyncio.create_task(group.do("key", upstream))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        self.assertEqual(await second, "Neutral")
+
+    async def test_queries_share_calls_only_on_the_same_endpoint_and_retry_mode(self):
+        serve_interfaces(self, {"coalesced": CONFIG})
+        _, [route] = prepare_query({"interface_id": "coalesced", "question": "love it"})
+        calls = []
+
+        async def upstream(prepared):
+            calls.append(prepared)
+            await asyncio.sleep(0.01)
+            return Completion("Positive")
+
+        other_endpoint = {**route, "model_config": {**route["model_config"], "base_url": "http://b"}}
+        no_retry = {**route, "allow_retry": False}
+        with patch.object(external_integration, "call_provider_async", upstream):
+            results = await asyncio.gather(*(query_provider_async(prepared)
+                                             for prepared in (route, route, other_endpoint, no_retry)))
+        self.assertEqual([result.response_text for result in results], ["Positive"] * 4)
+        self.assertEqual(len(calls), 3)
+
+if __name__ == "__main__":
+    unittest.main()
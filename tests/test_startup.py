@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from src import model_adaptor
+from src.model_adaptor import MockAdaptor, get_adaptor, load_adaptors
+from src.startup import Warmup
+
+from helpers import serve_interfaces
+
+CONFIG = """
+model_providers:
+  mock:
+    system_prompt: Classify
+    response: "7"
+"""
+
+class TestStartup(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        serve_interfaces(self, {"bench": CONFIG})
+
+    def test_adaptors_are_instantiated_on_first_use(self):
+        with patch.dict(model_adaptor._adaptors, clear=True):
+            self.assertEqual(list(load_adaptors(["mock"])), ["mock"])
+            get_adaptor("local_model")
+            self.assertEqual(sorted(model_adaptor._adaptors), ["local_model", "mock"])
+            with self.assertRaises(KeyError):
+                get_adaptor("missing")
+
+    async def test_ready_only_after_backend_pings(self):
+        release = asyncio.Event()
+
+        async def probe(adaptor, model_config, api_key):
+            await release.wait()
+
+        with patch.object(MockAdaptor, "_probe", probe):
+            warmup = Warmup()
+            warmup.start(ping=True)
+            await asyncio.sleep(0)
+            self.assertFalse(warmup.ready)
+            self.assertEqual(set(warmup.phases), {"imports", "configs", "clients", "tokenizers"})
+            release.set()
+            await warmup._pings
+        snapshot = warmup.snapshot()
+        self.assertTrue(snapshot["ready"])
+        self.assertGreater(snapshot["startup_seconds"], 0)
+        self.assertIn("ping", snapshot["phases"])
+        self.assertEqual([result["ok"] for result in snapshot["backends"].values()], [True])
+
+    async def test_ready_immediately_without_pings_and_not_ready_when_stopping(self):
+        warmup = Warmup()
+        warmup.start(ping=False)
+        self.assertTrue(warmup.ready)
+        self.assertNotIn("ping", warmup.phases)
+        await warmup.stop()
+        self.assertFalse(warmup.snapshot()["ready"])
+
+if __name__ == "__main__":
+    unittest.main()
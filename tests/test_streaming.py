@@ -0,0 +1,89 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from src import router
+from src.main import app
+from src.model_adaptor import Completion, MockAdaptor, ProviderError
+from src.router import OPEN, Router
+
+from helpers import serve_interfaces
+
+CONFIG = """
+model_providers:
+  mock:
+    system_prompt: Classify
+    response: Positive, clearly
+routing:
+  failure_threshold: 1
+"""
+
+def events(body):
+    """Split an SSE body into (event, data) pairs; plain data events are named 'message'."""
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        parsed.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return parsed
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        serve_interfaces(self, {"streamed": CONFIG})
+        self.router = Router()
+        shared_router = patch.object(router, "_shared_router", self.router)
+        shared_router.start()
+        self.addCleanup(shared_router.stop)
+        self.client = TestClient(app)
+
+    def stream(self):
+        return self.client.post("/v1/query/stream", json={"interface_id": "streamed", "message": "love it"})
+
+    def test_each_token_is_one_data_event(self):
+        response = self.stream()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        self.assertEqual(response.headers["cache-control"], "no-cache")
+        tokens = [data["token"] for event, data in events(response.text) if event == "message"]
+        self.assertEqual(tokens, ["Positive, ", "clearly "])
+
+    def test_stream_ends_with_a_single_done_event(self):
+        parsed = events(self.stream().text)
+        self.assertEqual(parsed[-1], ("done", {}))
+        self.assertEqual([event for event, _ in parsed].count("done"), 1)
+        self.assertNotIn("error", [event for event, _ in parsed])
+        self.assertEqual(self.client.post("/v1/query/stream", json={"interface_id": "missing", "message": "hi"})
+                         .status_code, 404)
+
+    def test_provider_failure_mid_stream_sends_an_error_event(self):
+        async def stream(adaptor, model_config, messages, api_key=None):
+            yield Completion("Posi")
+            raise ProviderError("Error: upstream closed the connection", status_code=502)
+
+        with patch.object(MockAdaptor, "stream", stream):
+            parsed = events(self.stream().text)
+        self.assertEqual(parsed[0], ("message", {"token": "Posi"}))
+        event, data = parsed[-1]
+        self.assertEqual(event, "error")
+        self.assertIn("upstream closed the connection", data["detail"])
+        self.assertEqual(data["kind"], "unavailable")
+        self.assertNotIn("done", [event for event, _ in parsed])
+
+    def test_stream_outcomes_feed_the_router(self):
+        self.stream()
+        [health] = self.router.stats().values()
+        self.assertEqual((health["requests"], health["state"]), (1, "closed"))
+
+        async def stream(adaptor, model_config, messages, api_key=None):
+            raise ProviderError("Error: upstream unavailable", status_code=503)
+            yield
+
+        with patch.object(MockAdaptor, "stream", stream):
+            self.stream()
+        [health] = self.router.stats().values()
+        self.assertEqual((health["requests"], health["state"]), (2, OPEN))
+
+if __name__ == "__main__":
+    unittest.main()
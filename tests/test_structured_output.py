@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from src.external_integration import fetch_external_data_async
+from src.main import app
+from src.model_adaptor import Completion, MockAdaptor
+from src.structured_output import parse_output, typed_fields
+
+from helpers import serve_interfaces
+
+CONFIG = """
+single_flight: false
+cache:
+  enabled: true
+output:
+  type: label
+  labels: [Positive, Negative, Neutral]
+model_providers:
+  mock:
+    system_prompt: Classify
+"""
+
+LABELS = {"type": "label", "labels": ["Positive", "Negative", "Neutral"]}
+SCORE = {"type": "score", "min": 0, "max": 10}
+
+class TestStructuredOutput(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        serve_interfaces(self, {"typed": CONFIG})
+
+    def test_parse_output_labels_scores_and_json(self):
+        self.assertEqual(parse_output(" negative.", LABELS), "Negative")
+        self.assertEqual(parse_output("The feedback is Positive overall", LABELS), "Positive")
+        self.assertIsNone(parse_output("Positive or Negative", LABELS))
+        self.assertEqual(parse_output('{"label": "Neutral"}', LABELS), "Neutral")
+        self.assertEqual(parse_output("Score: 7 (Moderate Risk)", SCORE), "7")
+        self.assertEqual(parse_output('{"score": 9}', SCORE), "9")
+        self.assertIsNone(parse_output("42", SCORE))
+        self.assertIsNone(parse_output("On a scale of 0 to 10 I'd say 8", SCORE))
+        self.assertEqual(parse_output("Risk 8 of 42 factors", SCORE), "8")
+        self.assertEqual(typed_fields("7", SCORE), {"score": 7})
+        self.assertEqual(typed_fields("Mock response", LABELS), {})
+
+    async def test_answers_are_parsed_once_and_cached_in_canonical_form(self):
+        replies = iter(["The customer is clearly Negative.", "I cannot tell", "Still unsure"])
+        calls = []
+
+        async def complete(adaptor, model_config, messages, api_key=None):
+            calls.append(messages[-1]["content"])
+            return Completion(next(replies), prompt_tokens=5, completion_tokens=4)
+
+        with patch.object(MockAdaptor, "complete", complete):
+            first = await fetch_external_data_async({"interface_id": "typed", "question": "dropped calls again"})
+            again = await fetch_external_data_async({"interface_id": "typed", "question": "dropped calls again"})
+            unparsed = await fetch_external_data_async({"interface_id": "typed", "question": "hmm"})
+            # Unparsed answers are never cached
+            retried = await fetch_external_data_async({"interface_id": "typed", "question": "hmm"})
+
+        self.assertEqual((first.response_text, first.label, first.source), ("Negative", "Negative", "provider"))
+        self.assertEqual(first.usage.completion_tokens, 4)
+        self.assertIsNotNone(first.latency_ms)
+        self.assertEqual((again.label, again.source), ("Negative", "cache"))
+        self.assertEqual((unparsed.response_text, unparsed.label), ("I cannot tell", None))
+        self.assertEqual(retried.response_text, "Still unsure")
+        self.assertEqual(len(calls), 3)
+
+    def test_http_errors_carry_the_status_of_their_kind(self):
+        client = TestClient(app)
+        response = client.post("/v1/query", json={"interface_id": "missing", "message": "hi"})
+        self.assertEqual(response.status_code, 404)
+        response = client.post("/v1/query", json={"interface_id": "typed", "message": "hi",
+                                                  "model_provider": "openai"})
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("Configuration Error", response.json()["detail"])
+        with patch.object(MockAdaptor, "complete", return_value=Completion("Positive!")):
+            response = client.post("/v1/query", json={"interface_id": "typed", "message": "love it"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({key: response.json()[key] for key in ("response", "label", "source")},
+                         {"response": "Positive", "label": "Positive", "source": "provider"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+from src.config_manager import validate_interface_config
+from src.external_integration import prepare_query, resolve_model_config
+from src.metrics import INPUTS_TRUNCATED
+from src.model_adaptor import OllamaAdaptor, openai_options
+from src.prompt_orchestrator import PromptOrchestrator
+from src.token_budget import ELLIPSIS, Tokenizer, truncate
+
+from helpers import serve_interfaces
+
+CONFIG = """
+token_budget:
+  max_input_tokens: 8
+  max_output_tokens: 3
+  truncation: head
+model_providers:
+  mock:
+    system_prompt: Classify
+  pinned:
+    adaptor: mock
+    system_prompt: Classify
+    max_tokens: 50
+"""
+
+class TestTokenBudget(unittest.TestCase):
+
+    def setUp(self):
+        serve_interfaces(self, {"budgeted": CONFIG})
+
+    def test_truncation_strategies_stay_within_the_budget(self):
+        tokenizer = Tokenizer()
+        text = "".join(f"w{i:02d} " for i in range(40))
+        tokens = tokenizer.encode(text)
+        self.assertEqual(truncate(tokenizer, tokens, 5, "head"), text[:20])
+        self.assertEqual(truncate(tokenizer, tokens, 5, "tail"), text[-20:])
+        both = truncate(tokenizer, tokens, 10, "head_tail")
+        self.assertTrue(both.startswith("w00 ") and both.endswith("w39 ") and ELLIPSIS in both)
+        self.assertLessEqual(len(tokenizer.encode(both)), 10)
+
+    def test_long_messages_are_truncated_before_they_are_sent(self):
+        orchestrator = PromptOrchestrator()
+        truncated = INPUTS_TRUNCATED.value("budgeted")
+        _, short = prepare_query({"interface_id": "budgeted", "question": "fine", "model_provider": "mock"})
+        _, long = prepare_query({"interface_id": "budgeted", "question": "a" * 100, "model_provider": "mock"})
+        self.assertEqual(orchestrator.messages(short[0])[1]["content"], "fine")
+        # Retries and failover reuse the fitted question without counting it again
+        for _ in range(2):
+            self.assertEqual(orchestrator.messages(long[0])[1]["content"], "a" * 32)
+        self.assertEqual(INPUTS_TRUNCATED.value("budgeted") - truncated, 1)
+
+    def test_max_output_tokens_reaches_the_provider_call(self):
+        _, resolved = resolve_model_config("budgeted", "mock")
+        self.assertEqual(openai_options(resolved["model_config"]), {"max_tokens": 3})
+        payload = OllamaAdaptor._payload(resolved["model_config"], [], stream=False)
+        self.assertEqual(payload["options"], {"num_predict": 3})
+        # A provider's own max_tokens wins over the interface budget
+        _, pinned = resolve_model_config("budgeted", "pinned")
+        self.assertEqual(pinned["model_config"]["max_tokens"], 50)
+
+        with self.assertRaises(ValueError):
+            validate_interface_config("bad", {"token_budget": {"truncation": "middle"}})
+        with self.assertRaises(ValueError):
+            validate_interface_config("bad", {"token_budget": {"max_input_tokens": 0}})
+
+if __name__ == "__main__":
+    unittest.main()